@@ -5,8 +5,15 @@ from selenium.webdriver.common.action_chains import ActionChains
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+import os
+import sys
 import time
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from timeline.page_data import extract_posts
+
+INSTAGRAM_BASE_URL = "https://www.instagram.com/"
+
 # Initialize Selenium WebDriver
 def init_driver():
     service = Service("/usr/bin/chromedriver")  # Ensure this is the correct chromedriver path
@@ -17,7 +24,63 @@ def init_driver():
     return driver
 
 # Scrape location tags from Instagram posts
-def scrape_location_tags(profile_url, max_posts=10):
+def scrape_location_tags(profile_url, max_posts=10, mode="page"):
+    """
+    Returns the location names tagged in the profile's first max_posts posts.
+
+    mode "page" reads the post data embedded in the page source (see
+    scrape_location_tags_page_data); mode "click" opens every post in the
+    overlay, with fixed waits of several seconds per post.
+    """
+    if mode == "page":
+        return scrape_location_tags_page_data(profile_url, max_posts)
+    return scrape_location_tags_clicks(profile_url, max_posts)
+
+def scrape_location_tags_page_data(profile_url, max_posts=10):
+    """
+    Reads the locations from the JSON Instagram embeds in the page source,
+    without scrolling, clicking or fixed waits: the profile page is parsed
+    once, and a post page is only loaded for posts the profile page has no
+    location details for.
+    """
+    driver = init_driver()
+    locations = []
+    try:
+        driver.get(profile_url)
+        posts = {post["shortcode"]: post for post in extract_posts(driver.page_source)}
+
+        # Grid links cover posts that are rendered but not embedded as JSON
+        hrefs = driver.execute_script(
+            "return Array.from(document.querySelectorAll(\"a[href*='/p/']\"), a => a.href);") or []
+        shortcodes = list(posts)
+        for href in hrefs:
+            shortcode = href.rstrip('/').split('/p/')[-1].split('/')[0]
+            if shortcode and shortcode not in shortcodes:
+                shortcodes.append(shortcode)
+        print(f"Found {len(shortcodes)} posts.")
+
+        for i, shortcode in enumerate(shortcodes[:max_posts]):
+            try:
+                post = posts.get(shortcode)
+                if post is None or not post["location_known"]:
+                    driver.get(f"{INSTAGRAM_BASE_URL}p/{shortcode}/")
+                    found = [p for p in extract_posts(driver.page_source) if p["shortcode"] == shortcode]
+                    post = found[0] if found else post
+                if post is not None and post["location_name"]:
+                    print(f"Post {i + 1}: Found location: {post['location_name']}")
+                    locations.append(post["location_name"])
+                else:
+                    print(f"Post {i + 1}: No location tag found.")
+            except Exception as e:
+                print(f"Error processing post {i + 1}: {str(e)}")
+    finally:
+        driver.quit()
+    return locations
+
+def scrape_location_tags_clicks(profile_url, max_posts=10):
+    """
+    Reads the locations by opening every post thumbnail and querying the DOM.
+    """
     driver = init_driver()
     driver.get(profile_url)
     time.sleep(5)  # Increased initial wait to give time for page to load
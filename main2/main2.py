@@ -1,55 +1,198 @@
+import os
+import sys
 import requests
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from requests.adapters import HTTPAdapter
 
-def get_instagram_location_timeline(user_id, access_token):
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from timeline.date_range import in_date_range, parse_date
+from timeline.http_cache import DEFAULT_PATH as HTTP_CACHE_PATH, CachingAdapter, HttpCache
+from timeline.location_cache import DEFAULT_PATH as LOCATION_CACHE_PATH, LocationCache
+from timeline.records import record_type
+
+GRAPH_API_URL = "https://graph.instagram.com"
+DEFAULT_FIELDS = ('id', 'location', 'timestamp')
+PAGE_SIZE = 100
+REQUEST_TIMEOUT = 30
+
+# One located post of the timeline
+TimelineEntry = record_type("TimelineEntry", ("location", "timestamp"))
+
+def make_session(pool_size=4, http_cache=None):
+    """
+    Creates a requests session with a keep-alive connection pool. With an
+    HttpCache, responses are cached and revalidated (see timeline.http_cache).
+    """
+    session = requests.Session()
+    if http_cache is not None:
+        adapter = CachingAdapter(http_cache, pool_connections=pool_size, pool_maxsize=pool_size)
+    else:
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def _to_unix(value):
+    """
+    Converts a datetime (naive values are taken as UTC) or a number to a Unix timestamp.
+    """
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+def _fetch_page(session, url, params, timeout):
+    """
+    Fetches one page of the media edge. Returns the decoded JSON, or None on error.
+    """
+    response = session.get(url, params=params, timeout=timeout)
+    if response.status_code != 200:
+        print(f"Error fetching data: {response.status_code} - {response.text}")
+        return None
+    return response.json()
+
+def _media_date(post):
+    """
+    Returns the timestamp of a media object as a naive UTC datetime.
+    """
+    return datetime.fromisoformat(post.get('timestamp')).astimezone(timezone.utc).replace(tzinfo=None)
+
+def _with_token(url, access_token):
+    """
+    Sets the access_token query parameter of a paging URL. Pages served from
+    the response cache have the token blanked out of their links.
+    """
+    parts = urlsplit(url)
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True) if key != 'access_token']
+    query.append(('access_token', access_token))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+def iter_media_pages(session, url, params, timeout=REQUEST_TIMEOUT, access_token=None):
+    """
+    Follows the ``paging.next`` cursors of a Graph API edge and yields the
+    ``data`` list of each page. The next page is requested in the background
+    while the current one is being processed. With access_token, the token
+    in the paging links is replaced by it.
+    """
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(_fetch_page, session, url, params, timeout)
+        try:
+            while future is not None:
+                page = future.result()
+                if page is None:
+                    return
+                next_url = page.get('paging', {}).get('next')
+                if next_url and access_token:
+                    next_url = _with_token(next_url, access_token)
+                # paging.next already carries the cursor and all query parameters
+                future = executor.submit(_fetch_page, session, next_url, None, timeout) if next_url else None
+                yield page.get('data', [])
+        finally:
+            if future is not None:
+                future.cancel()
+
+def get_instagram_location_timeline(user_id, access_token, fields=DEFAULT_FIELDS, limit=None,
+                                    since=None, until=None, page_size=PAGE_SIZE,
+                                    base_url=GRAPH_API_URL, session=None,
+                                    cache_path=LOCATION_CACHE_PATH, http_cache_path=HTTP_CACHE_PATH):
     """
     Fetches location-based timeline of Instagram posts using Instagram Graph API.
-    
+
+    This is a generator: it follows the pagination cursors until the whole
+    timeline has been read (or limit is reached), holding one page at a time.
+
+    The Graph API returns locations inline, so no per-post lookup is needed;
+    they are recorded in the shared location cache for the other backends.
+
     Args:
         user_id (str): The Instagram User ID.
         access_token (str): The Instagram Graph API access token.
-    
-    Returns:
-        list: A list of dictionaries with locations and timestamps of the posts.
+        fields (tuple): Media fields to request; 'location' and 'timestamp'
+            are always included.
+        limit (int): Maximum number of timeline entries to yield.
+        since (datetime or int): Only posts at or after this time.
+        until (datetime or int): Only posts at or before this time.
+        page_size (int): Number of media per page.
+        base_url (str): Graph API base URL, e.g. a local fake server for tests.
+        session (requests.Session): Session to reuse; one is created if None.
+        cache_path (str): Location cache to record into, or None.
+        http_cache_path (str): Response cache for the session created when
+            session is None; pages are revalidated with their ETag instead
+            of downloaded again. None disables it.
+
+    Media are listed newest first, so the pagination stops at the first post
+    older than since; the first POSSIBLY_PINNED posts may be pinned ones out
+    of order and do not end it (see timeline.date_range).
+
+    Yields:
+        TimelineEntry: Location and timestamp of each post, newest first
+        (a compact record read like a dict, see timeline.records).
     """
-    url = f"https://graph.instagram.com/{user_id}/media"
+    fields = list(dict.fromkeys(['id', *fields, 'location', 'timestamp']))
+    since, until = _to_unix(since), _to_unix(until)
     params = {
-        'fields': 'id,caption,location,timestamp',
+        'fields': ','.join(fields),
+        'limit': page_size,
         'access_token': access_token
     }
+    if since is not None:
+        params['since'] = since
+    if until is not None:
+        params['until'] = until
 
-    response = requests.get(url, params=params)
-    if response.status_code != 200:
-        print(f"Error fetching data: {response.status_code} - {response.text}")
-        return []
-
-    # Extract location timeline from the posts
-    posts = response.json().get('data', [])
-    location_timeline = []
+    own_session = session is None
+    http_cache = None
+    if own_session:
+        http_cache = HttpCache(http_cache_path) if http_cache_path else None
+        session = make_session(http_cache=http_cache)
+    cache = LocationCache(cache_path) if cache_path else None
+    count = 0
+    # The API applies since/until itself; the range is checked again here so
+    # the page prefetch stops at the first older post even if it does not
+    pages = iter_media_pages(session, f"{base_url}/{user_id}/media", params, access_token=access_token)
+    media = ((post, _media_date(post)) for page in pages for post in page)
+    since_date = datetime.fromtimestamp(since, tz=timezone.utc).replace(tzinfo=None) if since is not None else None
+    until_date = datetime.fromtimestamp(until, tz=timezone.utc).replace(tzinfo=None) if until is not None else None
+    try:
+        for post, timestamp in in_date_range(media, since_date, until_date, date_of=lambda item: item[1],
+                                             is_pinned=lambda item: None):
+            location = post.get('location')
 
-    for post in posts:
-        location = post.get('location')
-        timestamp = post.get('timestamp')
+            if cache is not None:
+                cache.put_post(f"graph:{post['id']}",
+                               (location['name'], location.get('latitude'), location.get('longitude')) if location else None,
+                               location_id=location.get('id') if location else None)
 
-        if location:
-            location_timeline.append({
-                'location': location['name'],
-                'timestamp': datetime.fromisoformat(timestamp).strftime("%Y-%m-%d %H:%M:%S")
-            })
-
-    return location_timeline
+            if location:
+                yield TimelineEntry(location['name'], timestamp.strftime("%Y-%m-%d %H:%M:%S"))
+                count += 1
+                if limit is not None and count >= limit:
+                    return
+    finally:
+        pages.close()
+        if cache is not None:
+            cache.close()
+        if own_session:
+            session.close()
+        if http_cache is not None:
+            http_cache.close()
 
 
 if __name__ == "__main__":
     user_id = input("Enter the Instagram User ID: ")
     access_token = input("Enter your Instagram Graph API Access Token: ")
+    since = parse_date(input("Only posts since (YYYY-MM-DD or an age like 30d, blank for all): "))
+    until = parse_date(input("Only posts until (YYYY-MM-DD, blank for now): "), end_of_day=True)
 
-    timeline = get_instagram_location_timeline(user_id, access_token)
-    
-    if timeline:
-        print(f"Location timeline for user {user_id}:")
-        for entry in timeline:
-            print(f"Location: {entry['location']}, Timestamp: {entry['timestamp']}")
-    else:
-        print(f"No location data found for user {user_id}.")
+    found = False
+    for entry in get_instagram_location_timeline(user_id, access_token, since=since, until=until):
+        if not found:
+            print(f"Location timeline for user {user_id}:")
+            found = True
+        print(f"Location: {entry['location']}, Timestamp: {entry['timestamp']}")
 
+    if not found:
+        print(f"No location data found for user {user_id}.")
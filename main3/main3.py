@@ -5,9 +5,11 @@ from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.firefox.service import Service
-from webdriver_manager.firefox import GeckoDriverManager
-import pandas as pd
-import matplotlib.pyplot as plt
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from timeline.date_range import POSSIBLY_PINNED, parse_date
+from timeline.page_data import extract_posts
+from timeline.records import record_type, write_csv
 
 # Documentation
 """
@@ -30,6 +32,15 @@ INSTAGRAM_BASE_URL = "https://www.instagram.com/"
 OUTPUT_DIR = "output"
 DELAY = 3
 
+# matplotlib backends that cannot show a window
+NON_INTERACTIVE_BACKENDS = {"agg", "cairo", "pdf", "pgf", "ps", "svg", "template"}
+
+# Headless renderers by output formats, reused by every chart of the process
+_renderers = {}
+
+# One scraped post
+TimelineRow = record_type("TimelineRow", ("Date", "Post URL", "Location Name", "Latitude", "Longitude"))
+
 # Initialize WebDriver
 def init_driver():
     """
@@ -70,17 +81,109 @@ def login(driver, username, password):
         print(f"Login failed: {e}")
 
 # Scrape profile posts
-def scrape_profile(driver, profile_url, max_posts=50):
+def scrape_profile(driver, profile_url, max_posts=50, mode="page", since=None, until=None):
     """
     Scrapes the specified Instagram profile for post data and location tags.
+
+    mode "page" reads the data embedded in the page source (see
+    scrape_profile_page_data); mode "click" opens every post in the overlay.
+    Both are generators of TimelineRow records, so rows can be saved while
+    the scrape goes on. Only "page" mode knows coordinates; "click" mode
+    leaves Latitude and Longitude empty. since/until (naive UTC datetimes, see timeline.date_range.parse_date)
+    limit the posts to a date range.
+    """
+    if mode == "page":
+        return scrape_profile_page_data(driver, profile_url, max_posts=max_posts, since=since, until=until)
+    return scrape_profile_clicks(driver, profile_url, max_posts=max_posts, since=since, until=until)
+
+def _in_range(date, since, until):
+    """
+    Returns -1 if date (a UTC datetime or ISO string) is older than since,
+    1 if it is newer than until, else 0.
+    """
+    date = parse_date(date)
+    if since is not None and date < since:
+        return -1
+    if until is not None and date > until:
+        return 1
+    return 0
+
+def scrape_profile_page_data(driver, profile_url, max_posts=50, delay=0, since=None, until=None):
+    """
+    Scrapes the profile from the JSON Instagram embeds in the page source,
+    without clicking into posts or waiting on the DOM.
+
+    The profile page is parsed once; post pages are only loaded for posts the
+    profile page has no location details for, and each of those is parsed in
+    a single pass too. delay adds a pause between post page loads.
+
+    Posts whose embedded date is outside since/until are skipped without
+    loading their page. Posts only known from the grid are in grid order
+    (newest first), so loading them stops at the first non-pinned one older
+    than since.
+    """
+    driver.get(profile_url)
+    posts = {post["shortcode"]: post for post in extract_posts(driver.page_source)}
+
+    # Grid links cover posts that are rendered but not embedded as JSON
+    hrefs = driver.execute_script(
+        "return Array.from(document.querySelectorAll(\"a[href*='/p/']\"), a => a.href);") or []
+    shortcodes = list(posts)
+    grid_index = {}
+    for href in hrefs:
+        shortcode = href.rstrip('/').split('/p/')[-1].split('/')[0]
+        if shortcode and shortcode not in grid_index:
+            grid_index[shortcode] = len(grid_index)
+        if shortcode and shortcode not in posts and shortcode not in shortcodes:
+            shortcodes.append(shortcode)
+
+    kept = 0
+    for i, shortcode in enumerate(shortcodes):
+        if kept >= max_posts:
+            break
+        post_url = f"{INSTAGRAM_BASE_URL}p/{shortcode}/"
+        post = posts.get(shortcode)
+        try:
+            if post is not None and _in_range(post["taken_at"], since, until):
+                continue
+            if post is None or not post["location_known"]:
+                if delay:
+                    time.sleep(delay)
+                driver.get(post_url)
+                found = [p for p in extract_posts(driver.page_source) if p["shortcode"] == shortcode]
+                post = found[0] if found else post
+            if post is None:
+                print(f"Error processing post {i + 1}: no post data in page source")
+                continue
+            position = _in_range(post["taken_at"], since, until)
+            grid_only = shortcode not in posts
+            if position < 0 and grid_only and not post["pinned"] and grid_index.get(shortcode, 0) >= POSSIBLY_PINNED:
+                break
+            if position:
+                continue
+            kept += 1
+            yield TimelineRow(post["taken_at"].isoformat(), post_url, post["location_name"],
+                              post["latitude"], post["longitude"])
+        except Exception as e:
+            print(f"Error processing post {i + 1}: {e}")
+
+def scrape_profile_clicks(driver, profile_url, max_posts=50, since=None, until=None):
+    """
+    Scrapes the profile by opening every post and reading the DOM.
+
+    The grid is newest first apart from pinned posts, which the DOM does not
+    mark: past the first POSSIBLY_PINNED posts, the first post older than
+    since ends the scrape.
     """
     driver.get(profile_url)
     time.sleep(DELAY)
 
-    post_data = []
     posts = driver.find_elements(By.XPATH, "//a[contains(@href, '/p/')]")
 
-    for i, post in enumerate(posts[:max_posts]):
+    kept = 0
+    for i, post in enumerate(posts):
+        if kept >= max_posts:
+            break
         try:
             post_url = post.get_attribute('href')
             post.click()
@@ -92,32 +195,70 @@ def scrape_profile(driver, profile_url, max_posts=50):
                 pass
 
             date = driver.find_element(By.XPATH, "//time").get_attribute('datetime')
-            post_data.append({"Date": date, "Post URL": post_url, "Location Name": location})
-
             driver.find_element(By.XPATH, "//body").send_keys(Keys.ESCAPE)
             time.sleep(DELAY)
+
+            position = _in_range(date, since, until) if since is not None or until is not None else 0
+            if position < 0 and i >= POSSIBLY_PINNED:
+                break
+            if position:
+                continue
+            kept += 1
+            yield TimelineRow(date, post_url, location)
         except Exception as e:
             print(f"Error processing post {i + 1}: {e}")
 
-    return post_data
-
 # Save timeline to CSV
 def save_timeline(data, filename):
     """
-    Saves the scraped timeline data to a CSV file.
+    Saves the scraped timeline data (any iterable of rows) to a CSV file,
+    chunk by chunk. Returns the number of rows written.
     """
     os.makedirs(OUTPUT_DIR, exist_ok=True)
     file_path = os.path.join(OUTPUT_DIR, filename)
-    df = pd.DataFrame(data)
-    df.to_csv(file_path, index=False)
+    count = write_csv(data, file_path, fieldnames=list(TimelineRow.KEYS))
     print(f"Timeline saved to {file_path}")
+    return count
 
 # Visualize timeline
-def visualize_timeline(data):
+def has_gui():
+    """
+    Tells whether matplotlib can show a window: pyplot falls back to a
+    non-interactive backend such as Agg when no GUI toolkit or display is
+    available.
+    """
+    import matplotlib.pyplot as plt
+
+    return plt.get_backend().lower() not in NON_INTERACTIVE_BACKENDS
+
+def visualize_timeline(data, headless=None, name="location_timeline", formats=("png",), renderer=None):
     """
     Visualizes the timeline data as a plot.
+
+    In headless mode (the default when matplotlib has no GUI backend) the
+    chart is aggregated per time bucket and location and written to
+    OUTPUT_DIR as name.<format> instead of being shown. The renderer, one
+    per set of formats unless a TimelineRenderer is passed, keeps its figure
+    for the next profile. Returns the written paths.
     """
-    df = pd.DataFrame(data)
+    if headless is None:
+        headless = not has_gui()
+    if headless:
+        if renderer is None:
+            renderer = _renderers.get(tuple(formats))
+            if renderer is None:
+                from timeline.render import TimelineRenderer
+                renderer = _renderers[tuple(formats)] = TimelineRenderer(OUTPUT_DIR, formats=formats)
+        paths = renderer.render(name, [row["Date"] for row in data], [row["Location Name"] for row in data])
+        print(f"Timeline chart saved to {', '.join(paths)}")
+        return paths
+
+    # Only needed for the interactive chart
+    import pandas as pd
+    import matplotlib.pyplot as plt
+
+    df = pd.DataFrame({"Date": [row["Date"] for row in data],
+                       "Location Name": [row["Location Name"] for row in data]})
     df['Date'] = pd.to_datetime(df['Date'])
     df = df.sort_values(by='Date')
     plt.figure(figsize=(10, 6))
@@ -128,6 +269,39 @@ def visualize_timeline(data):
     plt.xticks(rotation=45)
     plt.tight_layout()
     plt.show()
+    return []
+
+# Scrape, save and chart one profile
+def build_timeline(target, max_posts=50, mode="page", since=None, until=None,
+                   filename="location_timeline.csv", chart=True, headless=None):
+    """
+    Scrapes a profile (username or profile URL), saves its timeline to
+    OUTPUT_DIR/filename and, if chart is set, draws it (written headless as
+    OUTPUT_DIR/<username>.png, see visualize_timeline). Returns the number
+    of posts saved.
+    """
+    driver = init_driver()
+
+    try:
+        profile_url = target if target.startswith("http") else f"{INSTAGRAM_BASE_URL}{target}/"
+        data = scrape_profile(driver, profile_url, max_posts=max_posts, mode=mode, since=since, until=until)
+
+        # Rows are saved as they are scraped and kept for the chart
+        rows = []
+
+        def collected(data):
+            for row in data:
+                if chart:
+                    rows.append(row)
+                yield row
+
+        count = save_timeline(collected(data), filename)
+        if count and chart:
+            username = profile_url.rstrip('/').rsplit('/', 1)[-1]
+            visualize_timeline(rows, headless=headless, name=username)
+        return count
+    finally:
+        driver.quit()
 
 # Main function
 def main():
@@ -137,22 +311,15 @@ def main():
     print("Instagram Location Timeline Scraper")
     target = input("Enter the Instagram username or profile URL: ").strip()
     max_posts = int(input("Enter the maximum number of posts to process (default 50): ") or 50)
-
-    driver = init_driver()
+    mode = input("Extraction mode, 'page' or 'click' (default page): ").strip() or "page"
+    since = parse_date(input("Only posts since (YYYY-MM-DD or an age like 30d, blank for all): "))
+    until = parse_date(input("Only posts until (YYYY-MM-DD, blank for now): "), end_of_day=True)
 
     try:
-        profile_url = target if target.startswith("http") else f"{INSTAGRAM_BASE_URL}{target}/"
-        data = scrape_profile(driver, profile_url, max_posts=max_posts)
-
-        if data:
-            save_timeline(data, "location_timeline.csv")
-            visualize_timeline(data)
-        else:
+        if not build_timeline(target, max_posts=max_posts, mode=mode, since=since, until=until):
             print("No data found. Ensure the profile exists and is public.")
     except Exception as e:
         print(f"Error: {e}")
-    finally:
-        driver.quit()
 
 if __name__ == "__main__":
     main()
@@ -1,8 +1,31 @@
 import instaloader
-import pandas as pd
+import os
 import re
+import sys
 import time
 import requests
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from timeline.checkpoint import CheckpointStore
+from timeline.date_range import in_date_range, parse_date
+from timeline.http_cache import DEFAULT_PATH as HTTP_CACHE_PATH, HttpCache, mount_cache
+from timeline.location_cache import DEFAULT_PATH as LOCATION_CACHE_PATH, MISS, LocationCache
+from timeline.location_resolver import LocationResolver, location_from_post_json
+from timeline.metrics import CrawlMetrics, instaloader_rate_controller
+from timeline.records import PostRecord, iter_chunks, write_csv
+
+CHECKPOINT_DIR = "checkpoints"
+CHECKPOINT_EVERY = 50
+LOCATION_CONCURRENCY = 8
+LOCATION_TIMEOUT = 10
+METRICS_FILE = "crawl_metrics.json"
+# GeoNames cities file for adding city/region/country columns (see timeline.geocode)
+GAZETTEER_PATH = os.environ.get("TIMELINE_GAZETTEER")
+PROGRESS_INTERVAL = 10
+# Rows waiting for a location lookup before the crawl waits for the oldest one
+MAX_PENDING_ROWS = 500
+CSV_FIELDS = list(PostRecord.KEYS)
 
 def get_instagram_username_from_url(profile_url):
     """
@@ -15,130 +38,367 @@ def get_instagram_username_from_url(profile_url):
     else:
         raise ValueError("Invalid Instagram profile URL")
 
-def get_instagram_data(username, loader):
+def iter_instagram_data(username, loader, checkpoint_dir=CHECKPOINT_DIR, resolver=None,
+                        cache_path=LOCATION_CACHE_PATH, metrics=None, since=None, until=None,
+                        http_cache_path=HTTP_CACHE_PATH):
+    """
+    This function scrapes the Instagram profile for the given username and yields
+    the post date, URL, location, latitude, and longitude (if available) of each
+    post as a PostRecord (see timeline.records), newest first, as soon as the
+    post's location is known.
+
+    Progress is checkpointed to checkpoint_dir (pass None to disable): an
+    interrupted crawl resumes from the saved iterator position, and a rerun
+    after a finished crawl stops at the newest post it already has. Rows are
+    streamed into the checkpoint's rows file as they are yielded, so memory
+    stays independent of the number of posts either way.
+
+    Posts without location details are looked up through resolver (a
+    LocationResolver, created with LOCATION_CONCURRENCY / LOCATION_TIMEOUT if
+    not given) while the iteration goes on; rows wait for their lookup (at
+    most MAX_PENDING_ROWS of them) so they still come out in post order.
+
+    Locations are first looked up in the persistent location cache at
+    cache_path (pass None to disable), so reruns skip the network for posts
+    seen before. The ``?__a=1`` payloads themselves are kept in the response
+    cache at http_cache_path (see timeline.http_cache; None disables it).
+
+    Stage timings and counters go to metrics (a CrawlMetrics), if given.
+
+    since/until (naive UTC datetimes, see timeline.date_range) limit the crawl
+    to a date range: newer posts are skipped without a location lookup and
+    the iteration stops at the first non-pinned post older than since. A
+    date-limited crawl is not checkpointed, since its rows are not the
+    complete history a rerun would extend.
+    """
+    if since is not None or until is not None:
+        checkpoint_dir = None
+    own_resolver = resolver is None
+    if own_resolver:
+        cache = LocationCache(cache_path) if cache_path else None
+        http_cache = HttpCache(http_cache_path) if http_cache_path else None
+        resolver = LocationResolver(concurrency=LOCATION_CONCURRENCY, timeout=LOCATION_TIMEOUT,
+                                    cache=cache, metrics=metrics, http_cache=http_cache)
+    try:
+        yield from _crawl_profile(username, loader, checkpoint_dir, resolver, metrics or CrawlMetrics(),
+                                  since, until)
+    finally:
+        if own_resolver:
+            resolver.close()
+            if resolver.cache is not None:
+                resolver.cache.close()
+            if resolver.http_cache is not None:
+                resolver.http_cache.close()
+
+def get_instagram_data(username, loader, **options):
     """
-    This function scrapes the Instagram profile for the given username and retrieves
-    the post date, URL, location, latitude, and longitude (if available).
+    This function returns the rows of iter_instagram_data as a list.
     """
-    profile = instaloader.Profile.from_username(loader.context, username)
+    return list(iter_instagram_data(username, loader, **options))
+
+def _crawl_profile(username, loader, checkpoint_dir, resolver, metrics, since=None, until=None):
+    cache = resolver.cache
+    with metrics.stage("profile_fetch"):
+        profile = instaloader.Profile.from_username(loader.context, username)
+    posts = profile.get_posts()
 
-    posts_data = []
+    store = CheckpointStore(checkpoint_dir, username) if checkpoint_dir else None
+    state = store.load() if store else {}
+    known_newest = state.get("newest_mediaid")
 
-    for post in profile.get_posts():
+    # Resume an interrupted crawl from where it stopped: the rows it emitted
+    # are read back from the checkpoint, those it had not emitted yet are
+    # looked up again
+    resumed = False
+    window_rows = [PostRecord.from_dict(row) for row in state.get("window_rows") or []]
+    newest_mediaid = state.get("pending_newest_mediaid")
+    # Posts of the previous crawl seen again (pinned ones), left out when its rows are added
+    old_urls = set(state.get("old_urls") or [])
+    can_freeze = hasattr(posts, "freeze")
+    if store:
         try:
-            post_date = post.date_utc  # Post timestamp
+            if can_freeze and state.get("iterator"):
+                posts.thaw(instaloader.FrozenNodeIterator(**state["iterator"]))
+                resumed = True
+            store.open_pending(state)
+        except Exception as e:
+            print(f"Cannot resume crawl of {username}, starting over: {e}")
+            posts = profile.get_posts()
+            state["iterator"] = None
+            store.open_pending(state)
+            resumed = False
+        if resumed:
+            print(f"Resuming crawl of {username} after {state['pending_count'] + len(window_rows)} posts.")
+        else:
+            window_rows, newest_mediaid, old_urls = [], None, set()
+
+    # Rows not yielded yet, in post order; those with a future wait for a lookup
+    window = deque((row, resolver.submit(row["url"].split('/')[-2]) if row["location_name"] is None else None)
+                   for row in window_rows)
+
+    def ready(limit=None):
+        """
+        Yields the rows at the head of the window whose location is known;
+        with limit, waits for lookups until at most limit rows are left.
+        Yielded rows are appended to the checkpoint.
+        """
+        while window:
+            row, future = window[0]
+            if future is not None:
+                if not future.done() and (limit is None or len(window) <= limit):
+                    return
+                row["location_name"], row["latitude"], row["longitude"] = future.result()
+            window.popleft()
+            if store:
+                store.append_row(row)
+            yield row
+
+    def save_progress():
+        iterator_state = posts.freeze()._asdict() if can_freeze else None
+        store.save_progress(state, iterator_state, (row for row, _ in window), newest_mediaid, old_urls)
+
+    try:
+        if resumed:
+            for old_row in store.iter_pending_rows(state):
+                yield PostRecord.from_dict(old_row)
+
+        unsaved = 0
+        for post in in_date_range(metrics.timed_iter("post_fetch", posts), since, until):
             post_url = f"https://www.instagram.com/p/{post.shortcode}/"  # URL to the post
 
-            # Extracting location data (if available)
-            location_name = post.location.name if post.location else None
-            latitude = post.location.latitude if post.location else None
-            longitude = post.location.longitude if post.location else None
-
-            # If location details are missing, fetch from Instagram API
-            if not location_name or not latitude or not longitude:
-                location_name, latitude, longitude = get_location_data_from_api(post_url)
-
-            # Add post data to the list
-            posts_data.append({
-                "date": post_date,
-                "url": post_url,
-                "location_name": location_name,
-                "latitude": latitude,
-                "longitude": longitude
-            })
-        except Exception as e:
-            print(f"Error processing post {post.shortcode}: {e}")
-            continue
+            # Pinned posts are listed first regardless of their age
+            pinned = getattr(post, "is_pinned", False)
+            if known_newest is not None and post.mediaid <= known_newest:
+                if not pinned:
+                    break
+                old_urls.add(post_url)
+            if newest_mediaid is None or post.mediaid > newest_mediaid:
+                newest_mediaid = post.mediaid
+
+            try:
+                post_date = post.date_utc  # Post timestamp
+
+                # Extracting location data (if available); post.location may
+                # cost a request, so the cache is asked first
+                cached = cache.get_post(post.shortcode) if cache is not None else MISS
+                if cached is not MISS:
+                    location_name, latitude, longitude = cached or ('Unknown', 'Unknown', 'Unknown')
+                else:
+                    location = post.location
+                    location_name = location.name if location else None
+                    latitude = location.lat if location else None
+                    longitude = location.lng if location else None
+                    if cache is not None and location_name and latitude and longitude:
+                        cache.put_post(post.shortcode, (location_name, latitude, longitude),
+                                       location_id=location.id)
+
+                row = PostRecord(post_date, post_url, location_name, latitude, longitude)
+
+                # If location details are missing, fetch from Instagram API
+                future = None
+                if not location_name or not latitude or not longitude:
+                    row["location_name"] = row["latitude"] = row["longitude"] = None
+                    future = resolver.submit(post.shortcode)
+                window.append((row, future))
+                metrics.count("posts")
+                unsaved += 1
+            except Exception as e:
+                print(f"Error processing post {post.shortcode}: {e}")
+                continue
+
+            yield from ready(MAX_PENDING_ROWS)
+            if store and unsaved >= CHECKPOINT_EVERY:
+                save_progress()
+                unsaved = 0
 
-    return posts_data
+        yield from ready(0)
+    except BaseException:
+        # Rate limit, dropped session or Ctrl+C: keep what we have for the next run
+        if store:
+            save_progress()
+            store.close()
+            print(f"Crawl of {username} interrupted, progress saved to {store.path}.")
+        raise
+
+    if store:
+        # New posts come first, followed by the ones from the previous crawl
+        if known_newest is not None:
+            for old_row in store.iter_rows():
+                if old_row["url"] not in old_urls:
+                    row = PostRecord.from_dict(old_row)
+                    store.append_row(row)
+                    yield row
+        store.save_complete(state, newest_mediaid)
+
+_api_session = None
+
+def _cached_api_session():
+    """
+    Returns the session used by get_location_data_from_api, whose responses
+    go through the response cache.
+    """
+    global _api_session
+    if _api_session is None:
+        _api_session = mount_cache(requests.Session(), HttpCache(HTTP_CACHE_PATH))
+    return _api_session
 
 def get_location_data_from_api(post_url):
     """
     This function fetches location data (name, latitude, longitude) from the Instagram API
-    for a given post URL.
+    for a given post URL. Post payloads do not change, so repeated lookups are
+    answered from the response cache.
     """
     try:
         # Extract shortcode from the URL and make a request to Instagram's post API
         shortcode = post_url.split('/')[-2]
         api_url = f"https://www.instagram.com/p/{shortcode}/?__a=1"
-        response = requests.get(api_url)
-        post_data = response.json()
-
-        # Extract location information
-        location_data = post_data['graphql']['shortcode_media'].get('location', None)
-
-        if location_data:
-            location_name = location_data.get('name', 'Unknown')
-            latitude = location_data.get('lat', 'Unknown')
-            longitude = location_data.get('lng', 'Unknown')
-            return location_name, latitude, longitude
-        else:
-            return 'Unknown', 'Unknown', 'Unknown'
+        response = _cached_api_session().get(api_url, timeout=LOCATION_TIMEOUT)
+        return location_from_post_json(response.json())
     except Exception as e:
         print(f"Error fetching location data for {post_url}: {e}")
         return 'Unknown', 'Unknown', 'Unknown'
 
 def save_to_csv(posts_data, filename="location_timeline.csv"):
     """
-    This function saves the scraped posts data to a CSV file.
+    This function saves the scraped posts data (any iterable of rows, e.g. the
+    iter_instagram_data generator) to a CSV file, chunk by chunk as the rows
+    arrive. Returns the number of rows written.
     """
-    df = pd.DataFrame(posts_data)
-    df.to_csv(filename, index=False)
+    return write_csv(posts_data, filename, fieldnames=CSV_FIELDS)
 
-def main():
+def save_to_parquet(posts_data, filename="location_timeline.parquet", username=None):
     """
-    Main function to prompt for Instagram profile URL, scrape posts data,
-    and save the results to a CSV file.
+    This function saves the scraped posts data to a typed Parquet file
+    (see timeline.columnar), with numeric coordinates and UTC timestamps,
+    in row groups as the rows arrive. Returns the number of rows written.
     """
-    profile_url = input("Enter Instagram profile URL: ").strip()
+    from timeline.columnar import TimelineParquetWriter
+    from timeline.instagram import shortcode_from_url
 
-    # Login to Instagram using your credentials
-    username = input("Enter your Instagram username: ").strip()
-    password = input("Enter your Instagram password: ").strip()
+    with TimelineParquetWriter(filename) as writer:
+        for row in posts_data:
+            writer.write({
+                "shortcode": shortcode_from_url(row["url"]),
+                "username": username,
+                "taken_at": row["date"],
+                "location_name": row["location_name"],
+                "latitude": row["latitude"],
+                "longitude": row["longitude"],
+            })
+    return writer.rows_written
 
-    loader = instaloader.Instaloader()
+def login(loader, username, password=None, session_file=None, ask_two_factor_code=None):
+    """
+    This function loads the saved instaloader session of username, or logs in
+    with password and saves the session for the next run.
 
+    Args:
+        loader (instaloader.Instaloader): The loader to authenticate.
+        username (str): Instagram account to log in as.
+        password (str): Its password; without it a missing session file
+            raises FileNotFoundError.
+        session_file (str): Session file (default: instaloader's).
+        ask_two_factor_code (callable): Returns the 2FA code when Instagram
+            asks for one; without it TwoFactorAuthRequiredException is raised.
+    """
     try:
         # Login to Instagram (this session will be used for scraping)
         loader.context.log("Logging in...")
-        loader.load_session_from_file(username)  # Attempt to load session if exists
+        loader.load_session_from_file(username, session_file)  # Attempt to load session if exists
         loader.context.log("Login session loaded.")
+        return
     except FileNotFoundError:
+        if password is None:
+            raise
         loader.context.log("Session file not found. Logging in with credentials.")
-        loader.context.log("Logging in...")
-        try:
-            loader.login(username, password)  # Login with username and password
-        except instaloader.exceptions.TwoFactorAuthRequiredException:
-            print("Two-factor authentication is required.")
-            # Handle the 2FA process
-            while True:
-                code = input("Enter the 2FA code sent to your device: ").strip()
-                try:
-                    loader.two_factor_login(code)  # Attempt 2FA login
-                    print("Logged in successfully with 2FA!")
-                    break  # Exit the loop after successful login
-                except instaloader.exceptions.BadCredentialsException:
-                    print("Incorrect 2FA code. Please try again.")
-                    time.sleep(2)  # Wait a bit before retrying
-        loader.save_session_to_file()  # Save the session for future use
+
+    loader.context.log("Logging in...")
+    try:
+        loader.login(username, password)  # Login with username and password
+    except instaloader.exceptions.TwoFactorAuthRequiredException:
+        if ask_two_factor_code is None:
+            raise
+        print("Two-factor authentication is required.")
+        # Handle the 2FA process
+        while True:
+            code = ask_two_factor_code()
+            try:
+                loader.two_factor_login(code)  # Attempt 2FA login
+                print("Logged in successfully with 2FA!")
+                break  # Exit the loop after successful login
+            except instaloader.exceptions.BadCredentialsException:
+                print("Incorrect 2FA code. Please try again.")
+                time.sleep(2)  # Wait a bit before retrying
+    loader.save_session_to_file(session_file)  # Save the session for future use
+
+def save_location_timeline(username, loader, filename="location_timeline.csv", metrics=None,
+                           since=None, until=None, checkpoint_dir=CHECKPOINT_DIR):
+    """
+    This function crawls a profile and writes its location timeline to a CSV
+    file as the rows come in, with city/region/country columns if
+    TIMELINE_GAZETTEER is set, or to a typed Parquet file if filename ends
+    in .parquet (see save_to_parquet). Returns the number of posts written.
+    """
+    metrics = metrics or CrawlMetrics(progress_interval=PROGRESS_INTERVAL)
+    posts_data = iter_instagram_data(username, loader, checkpoint_dir=checkpoint_dir, metrics=metrics,
+                                     since=since, until=until)
+    if filename.lower().endswith(".parquet"):
+        return save_to_parquet(posts_data, filename, username=username)
+    fieldnames = CSV_FIELDS
+
+    # Normalize coordinates to city/region/country, offline, a chunk at a time
+    if GAZETTEER_PATH:
+        from timeline.geocode import ADMIN_COLUMNS, Gazetteer, add_admin_columns
+        gazetteer = Gazetteer.from_geonames(GAZETTEER_PATH)
+        fieldnames = CSV_FIELDS + list(ADMIN_COLUMNS)
+
+        def geocoded(rows):
+            for chunk in iter_chunks(rows):
+                with metrics.stage("geocode"):
+                    add_admin_columns(chunk, gazetteer)
+                yield from chunk
+
+        posts_data = geocoded(posts_data)
+
+    return write_csv(posts_data, filename, fieldnames=fieldnames)
+
+def main():
+    """
+    Main function to prompt for Instagram profile URL, scrape posts data,
+    and save the results to a CSV file.
+    """
+    profile_url = input("Enter Instagram profile URL: ").strip()
+
+    # Login to Instagram using your credentials
+    username = input("Enter your Instagram username: ").strip()
+    password = input("Enter your Instagram password: ").strip()
+    since = parse_date(input("Only posts since (YYYY-MM-DD or an age like 30d, blank for all): "))
+    until = parse_date(input("Only posts until (YYYY-MM-DD, blank for now): "), end_of_day=True)
+    filename = (input("Output file, .csv or .parquet (default location_timeline.csv): ").strip()
+                or "location_timeline.csv")
+
+    metrics = CrawlMetrics(progress_interval=PROGRESS_INTERVAL)
+    loader = instaloader.Instaloader(rate_controller=instaloader_rate_controller(metrics))
+    login(loader, username, password,
+          ask_two_factor_code=lambda: input("Enter the 2FA code sent to your device: ").strip())
 
     try:
         # Extract the username from the profile URL
         username_from_url = get_instagram_username_from_url(profile_url)
 
-        # Scrape Instagram profile data
-        posts_data = get_instagram_data(username_from_url, loader)
+        # Scrape Instagram profile data and save it to CSV as the rows come in
+        count = save_location_timeline(username_from_url, loader, filename, metrics=metrics,
+                                       since=since, until=until)
 
         # Check if any posts were found
-        if not posts_data:
+        if not count:
             print(f"No posts found for {username_from_url}.")
             return
 
-        # Save the scraped data to CSV
-        save_to_csv(posts_data)
-
         # Print a success message
-        print(f"Location timeline saved to 'location_timeline.csv'.")
+        print(f"Location timeline saved to '{filename}'.")
+        metrics.write_json(METRICS_FILE)
+        print(f"Crawl metrics saved to '{METRICS_FILE}' ({metrics.rate():.2f} posts/s).")
 
     except ValueError as e:
         print(f"Error: {e}")
@@ -1,119 +1,427 @@
 import instaloader
 import csv
+import json
+import lzma
+import os
+import re
+import sys
+import time
+from contextlib import contextmanager
 from datetime import datetime
 
-# Initialize Instaloader
-L = instaloader.Instaloader(
-    download_videos=True,  # Download videos if available
-    download_comments=False,  # Disable downloading comments to save time
-    save_metadata=True  # Enable saving metadata
-)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from timeline.date_range import in_date_range, parse_date
+from timeline.dump_ingest import iter_dump_files, node_caption, node_to_row
+from timeline.instagram import caption_hashtags
+from timeline.location_cache import DEFAULT_PATH as LOCATION_CACHE_PATH, MISS, LocationCache
+from timeline.media_store import MediaStore
+from timeline.metrics import CrawlMetrics, instaloader_rate_controller
 
-def download_public_profile(username):
+# Stage timings and counters of this run (see timeline.metrics)
+METRICS = CrawlMetrics(progress_interval=10)
+
+# Content-addressed copy of all downloaded media (see timeline.media_store).
+# Must be on the same file system as the profile directories.
+MEDIA_STORE_DIR = os.environ.get("TIMELINE_MEDIA_STORE", "media_store")
+
+CSV_HEADER = ['Post Number', 'Post ID', 'Date', 'Time', 'Location', 'Hashtags', 'Description', 'Post Type', 'URL']
+
+# The Instaloader instance, created on first use by get_loader() so that
+# importing this module stays cheap
+L = None
+
+def get_loader():
+    """
+    Returns the shared Instaloader, initializing it on the first call.
+    """
+    global L
+    if L is None:
+        L = instaloader.Instaloader(
+            download_videos=True,  # Download videos if available
+            download_comments=False,  # Disable downloading comments to save time
+            save_metadata=True,  # Enable saving metadata
+            rate_controller=instaloader_rate_controller(METRICS)  # Count 429s and retries
+        )
+    return L
+
+def _dir_size(path):
+    """
+    Returns the total size in bytes of the files directly inside path.
+    """
+    try:
+        with os.scandir(path) as entries:
+            return sum(entry.stat().st_size for entry in entries if entry.is_file())
+    except FileNotFoundError:
+        return 0
+
+def _url_extension(url):
+    """
+    Returns the file extension instaloader derives from a media URL.
+    """
+    match = re.search(r'\.[a-z0-9]*\?', url)
+    return url[-3:] if match is None else match.group(0)[1:-1]
+
+@contextmanager
+def _download_hooks(store):
+    """
+    Wraps L.download_post/L.download_pic for the duration of a download:
+    media files are timed, and media already in the store are hardlinked
+    instead of downloaded.
+    """
+    loader = get_loader()
+    download_post = loader.download_post
+    download_pic = loader.download_pic
+    current = {"shortcode": None}
+
+    def tracked_download_post(post, target):
+        current["shortcode"] = post.shortcode
+        try:
+            return download_post(post, target)
+        finally:
+            current["shortcode"] = None
+
+    def timed_download_pic(filename, url, mtime, filename_suffix=None, _attempt=1):
+        if store is not None and current["shortcode"]:
+            extension = _url_extension(url)
+            path = f"{filename}_{filename_suffix}" if filename_suffix else filename
+            path += "." + extension
+            slide = int(filename_suffix) if filename_suffix and filename_suffix.isdigit() else 0
+            if not os.path.exists(path) and store.link_to(current["shortcode"], slide, extension, path):
+                METRICS.count("media_from_store")
+                return True
+        with METRICS.stage("media_download"):
+            return download_pic(filename, url, mtime, filename_suffix=filename_suffix, _attempt=_attempt)
+
+    loader.download_post = tracked_download_post
+    loader.download_pic = timed_download_pic
+    try:
+        yield
+    finally:
+        loader.download_post = download_post
+        loader.download_pic = download_pic
+
+def _ingest_media(store, username):
+    """
+    Hashes the profile's new media into the store and closes it.
+    """
+    try:
+        if os.path.isdir(username):
+            with METRICS.stage("media_store"):
+                store.ingest_profile(username)
+            print(f"Media store: {store.stats['deduplicated']} duplicate files linked, "
+                  f"{store.stats['bytes_saved'] / 2 ** 20:.1f} MiB saved.")
+    finally:
+        store.close()
+
+def download_public_profile(username, store_dir=MEDIA_STORE_DIR):
     """
     Download media from a public Instagram profile.
 
     Parameters:
         username (str): The Instagram username to download.
+        store_dir (str): Media store directory. Media already in the store
+            are hardlinked instead of downloaded, and new files are hashed
+            and deduplicated after the download. None disables the store.
     """
+    store = MediaStore(store_dir) if store_dir else None
+    size_before = _dir_size(username)
     try:
         print(f"Downloading public profile: {username}")
-        L.download_profile(
-            username,
-            profile_pic=True,  # Download profile picture
-            fast_update=True,  # Skip already-downloaded posts
-            download_stories=False,  # Skip downloading stories
-            download_tagged=False  # Skip downloading tagged posts
-        )
+        with _download_hooks(store):
+            get_loader().download_profile(
+                username,
+                profile_pic=True,  # Download profile picture
+                fast_update=True,  # Skip already-downloaded posts
+                download_stories=False,  # Skip downloading stories
+                download_tagged=False  # Skip downloading tagged posts
+            )
         print(f"Profile {username} downloaded successfully.")
     except instaloader.exceptions.ProfileNotExistsException:
         print(f"The profile {username} does not exist or is private.")
     except Exception as e:
         print(f"An error occurred: {e}")
+    finally:
+        METRICS.count("bytes_downloaded", max(_dir_size(username) - size_before, 0))
+        if store is not None:
+            _ingest_media(store, username)
+
+def _post_fields(post, cache):
+    """
+    Returns the catalog fields of an instaloader Post. The location comes
+    from the cache when it knows the post, since post.location may cost a
+    request.
+    """
+    cached = cache.get_post(post.shortcode) if cache is not None else MISS
+    if cached is not MISS:
+        location_name = cached[0] if cached else 'N/A'
+    else:
+        with METRICS.stage("location"):
+            location = post.location
+        if location:
+            location_name = location.name if hasattr(location, 'name') else 'N/A'
+        else:
+            location_name = 'N/A'
+        if cache is not None:
+            cache.put_post(post.shortcode, (location.name, location.lat, location.lng) if location else None,
+                           location_id=location.id if location else None)
+    return {
+        "mediaid": post.mediaid,
+        "shortcode": post.shortcode,
+        "date_utc": post.date_utc,
+        "location_name": location_name,
+        "hashtags": post.caption_hashtags,
+        "caption": post.caption,
+        "typename": post.typename,  # This could be "GraphImage", "GraphSidecar", etc.
+        "url": post.url,
+    }
+
+def _metadata_fields(node):
+    """
+    Returns the catalog fields of a post from the node instaloader saved in
+    its ``<date>_UTC.json.xz`` metadata file.
+    """
+    row = node_to_row(node)
+    caption = node_caption(node)
+    return {
+        "mediaid": row["mediaid"],
+        "shortcode": row["shortcode"],
+        "date_utc": row["taken_at"].replace(tzinfo=None) if row["taken_at"] else None,
+        "location_name": row["location_name"] or 'N/A',
+        "hashtags": caption_hashtags(caption),
+        "caption": caption,
+        "typename": row["typename"],
+        "url": node.get('display_url'),
+    }
+
+def _iter_metadata_nodes(profile_dir):
+    """
+    Yields the post nodes saved in a profile directory, newest first.
+    """
+    for path in reversed(list(iter_dump_files(profile_dir))):
+        try:
+            with lzma.open(path, 'rb') as file:
+                data = json.load(file)
+        except (OSError, lzma.LZMAError, ValueError) as e:
+            print(f"Error reading {path}: {e}")
+            continue
+        if data.get('instaloader', {}).get('node_type', 'Post') == 'Post':
+            yield data['node']
 
-def list_public_posts(username, filename):
+def _write_post(writer, parquet_writer, username, post_number, fields, verbose):
+    """
+    Writes one post to the CSV (and the Parquet copy).
+    """
+    # Format the date and time
+    post_date = fields["date_utc"].strftime('%d/%m/%Y') if fields["date_utc"] else 'N/A'  # dd/mm/yyyy
+    post_time = fields["date_utc"].strftime('%H:%M:%S') if fields["date_utc"] else 'N/A'  # 00:00:00
+
+    # Extract hashtags (if any)
+    hashtags = ', '.join(fields["hashtags"]) if fields["hashtags"] else 'N/A'
+
+    # Post description (caption)
+    description = fields["caption"] if fields["caption"] else 'N/A'
+
+    # Write data to CSV
+    write_start = time.perf_counter()
+    writer.writerow([
+        post_number,
+        fields["mediaid"],
+        post_date,
+        post_time,
+        fields["location_name"],
+        hashtags,
+        description,
+        fields["typename"],
+        fields["url"]
+    ])
+    if parquet_writer is not None:
+        parquet_writer.write({
+            "mediaid": fields["mediaid"],
+            "shortcode": fields["shortcode"],
+            "username": username,
+            "taken_at": fields["date_utc"],
+            "location_name": fields["location_name"],
+            "typename": fields["typename"],
+            "hashtags": fields["hashtags"],
+        })
+    METRICS.record("row_write", time.perf_counter() - write_start)
+
+    # Debugging output
+    if verbose:
+        print(f"Post Number: {post_number}")
+        print(f"Post ID: {fields['mediaid']}")
+        print(f"Date: {post_date}")
+        print(f"Time: {post_time}")
+        print(f"Location: {fields['location_name']}")
+        print(f"Hashtags: {hashtags}")
+        print(f"Description: {description}")
+        print(f"Post Type: {fields['typename']}")
+        print(f"URL: {fields['url']}")
+        print("\n")
+
+    METRICS.count("posts")
+
+def _open_catalog(filename, parquet_filename):
+    """
+    Opens the CSV file (header written) and the optional Parquet writer.
+    """
+    parquet_writer = None
+    if parquet_filename:
+        from timeline.columnar import TimelineParquetWriter
+        parquet_writer = TimelineParquetWriter(parquet_filename)
+    file = open(filename, mode='w', newline='', encoding='utf-8')
+    writer = csv.writer(file)
+    writer.writerow(CSV_HEADER)
+    return file, writer, parquet_writer
+
+def list_public_posts(username, filename, cache_path=LOCATION_CACHE_PATH, parquet_filename=None,
+                      verbose=False, since=None, until=None):
     """
     List posts from a public Instagram profile and save them to a CSV file.
 
+    This makes its own pass over the profile; main() uses
+    download_and_list_posts, which downloads and catalogs in one pass.
+
     Parameters:
         username (str): The Instagram username.
         filename (str): The name of the CSV file to save the output.
+        cache_path (str): Location cache consulted before post.location,
+            which may cost a request per post. None disables the cache.
+        parquet_filename (str): Optional typed Parquet copy of the output
+            (see timeline.columnar), written in row groups as posts arrive.
+        verbose (bool): Print every post's details. Off by default; progress
+            is reported through METRICS instead.
+        since (datetime): Only posts at or after this naive UTC time; the
+            iteration stops at the first non-pinned post older than it.
+        until (datetime): Only posts at or before this naive UTC time.
     """
+    cache = LocationCache(cache_path) if cache_path else None
+    file = parquet_writer = None
     try:
-        profile = instaloader.Profile.from_username(L.context, username)
+        with METRICS.stage("profile_fetch"):
+            profile = instaloader.Profile.from_username(get_loader().context, username)
         print(f"Fetching posts for public profile: {username}\n")
 
         # Prepare CSV file to save the output
-        with open(filename, mode='w', newline='', encoding='utf-8') as file:
-            writer = csv.writer(file)
-            writer.writerow(['Post Number', 'Post ID', 'Date', 'Time', 'Location', 'Hashtags', 'Description', 'Post Type', 'URL'])
-
-            post_number = 1
-            for post in profile.get_posts():
-                # Format the date and time
-                post_date = post.date_utc.strftime('%d/%m/%Y')  # Date in dd/mm/yyyy format
-                post_time = post.date_utc.strftime('%H:%M:%S')  # Time in 00:00:00 format
-
-                # Extract location
-                if post.location:
-                    location_name = post.location.name if hasattr(post.location, 'name') else 'N/A'
-                else:
-                    location_name = 'N/A'
-
-                # Extract hashtags (if any)
-                hashtags = ', '.join(post.caption_hashtags) if post.caption_hashtags else 'N/A'
-
-                # Post description (caption)
-                description = post.caption if post.caption else 'N/A'
-
-                # Post type (media type)
-                post_type = post.typename  # This could be "GraphImage", "GraphSidecar", etc.
-
-                # Write data to CSV
-                writer.writerow([
-                    post_number,
-                    post.mediaid,
-                    post_date,
-                    post_time,
-                    location_name,
-                    hashtags,
-                    description,
-                    post_type,
-                    post.url
-                ])
-
-                # Debugging output
-                print(f"Post Number: {post_number}")
-                print(f"Post ID: {post.mediaid}")
-                print(f"Date: {post_date}")
-                print(f"Time: {post_time}")
-                print(f"Location: {location_name}")
-                print(f"Hashtags: {hashtags}")
-                print(f"Description: {description}")
-                print(f"Post Type: {post_type}")
-                print(f"URL: {post.url}")
-                print("\n")
+        file, writer, parquet_writer = _open_catalog(filename, parquet_filename)
+        post_number = 1
+        for post in in_date_range(METRICS.timed_iter("post_fetch", profile.get_posts()), since, until):
+            _write_post(writer, parquet_writer, username, post_number, _post_fields(post, cache), verbose)
+            post_number += 1
+
+        print(f"Post details saved to {filename}.")
+    except instaloader.exceptions.ProfileNotExistsException:
+        print(f"The profile {username} does not exist or is private.")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+    finally:
+        if file is not None:
+            file.close()
+        if cache is not None:
+            cache.close()
+        if parquet_writer is not None:
+            parquet_writer.close()
+
+def download_and_list_posts(username, filename, store_dir=MEDIA_STORE_DIR, cache_path=LOCATION_CACHE_PATH,
+                            parquet_filename=None, verbose=False, since=None, until=None):
+    """
+    Download a public profile and save its posts to a CSV file in a single
+    pass over the profile: each post is downloaded and written to the CSV
+    from the same Post object.
 
+    Like fast_update, the crawl stops at the first (non-pinned) post that is
+    already downloaded; the rows of the older posts are then read from the
+    metadata files saved by earlier runs instead of fetched again.
+
+    Parameters:
+        username (str): The Instagram username.
+        filename (str): The name of the CSV file to save the output.
+        store_dir (str): Media store directory, see download_public_profile.
+        cache_path (str): Location cache, see list_public_posts.
+        parquet_filename (str): Optional typed Parquet copy of the output.
+        verbose (bool): Print every post's details.
+        since (datetime), until (datetime): Date range, see list_public_posts.
+
+    Returns:
+        int: Number of posts saved, or None if the profile could not be read.
+    """
+    store = MediaStore(store_dir) if store_dir else None
+    cache = LocationCache(cache_path) if cache_path else None
+    file = parquet_writer = None
+    size_before = _dir_size(username)
+    try:
+        with METRICS.stage("profile_fetch"):
+            profile = instaloader.Profile.from_username(get_loader().context, username)
+        print(f"Downloading and cataloging public profile: {username}")
+
+        file, writer, parquet_writer = _open_catalog(filename, parquet_filename)
+        post_number = 1
+        written = set()
+        stopped_early = False
+        with _download_hooks(store):
+            # Profile picture and profile metadata, as download_profile saves them
+            loader = get_loader()
+            loader.download_profilepic(profile)
+            if loader.save_metadata:
+                loader.save_metadata_json(os.path.join(username, f"{username}_{profile.userid}"), profile)
+
+            for post in in_date_range(METRICS.timed_iter("post_fetch", profile.get_posts()), since, until):
+                downloaded = loader.download_post(post, target=username)
+                _write_post(writer, parquet_writer, username, post_number, _post_fields(post, cache), verbose)
+                written.add(post.shortcode)
                 post_number += 1
+                if not downloaded and not post.is_pinned:
+                    stopped_early = True
+                    break
 
-        print(f"Post details saved to {filename}.")
+        # Older posts are already on disk; after a full crawl every post has
+        # been written and their metadata files need not be read
+        for node in _iter_metadata_nodes(username) if stopped_early else ():
+            if node.get('shortcode') in written:
+                continue
+            fields = _metadata_fields(node)
+            if fields["date_utc"] is not None and ((since is not None and fields["date_utc"] < since)
+                                                   or (until is not None and fields["date_utc"] > until)):
+                continue
+            _write_post(writer, parquet_writer, username, post_number, fields, verbose)
+            written.add(node.get('shortcode'))
+            METRICS.count("posts_from_metadata")
+            post_number += 1
+
+        print(f"Profile {username} downloaded, post details saved to {filename}.")
+        return post_number - 1
     except instaloader.exceptions.ProfileNotExistsException:
         print(f"The profile {username} does not exist or is private.")
     except Exception as e:
         print(f"An error occurred: {e}")
+    finally:
+        if file is not None:
+            file.close()
+        if cache is not None:
+            cache.close()
+        if parquet_writer is not None:
+            parquet_writer.close()
+        METRICS.count("bytes_downloaded", max(_dir_size(username) - size_before, 0))
+        if store is not None:
+            _ingest_media(store, username)
 
 def main():
     # Get Instagram username from user input
     username = input("Enter the Instagram username: ")
 
+    since = parse_date(input("Only posts since (YYYY-MM-DD or an age like 30d, blank for all): "))
+    until = parse_date(input("Only posts until (YYYY-MM-DD, blank for now): "), end_of_day=True)
+
     # File name will be the username with .csv extension
     filename = f"{username}.csv"
 
-    # Download the public profile and its media
-    download_public_profile(username)
+    # Download the public profile and its media, and save its posts to CSV in the same pass
+    download_and_list_posts(username, filename, since=since, until=until)
 
-    # List public posts and save them to CSV
-    list_public_posts(username, filename)
+    # Save where the time went
+    metrics_filename = f"{username}_metrics.json"
+    METRICS.write_json(metrics_filename)
+    print(f"Crawl metrics saved to {metrics_filename} ({METRICS.rate():.2f} posts/s).")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,65 @@
+import threading
+
+from timeline.batch import BatchScheduler, read_usernames
+from timeline.fixtures import FakeBackend
+
+
+def test_every_profile_gets_a_status(tmp_path):
+    backend = FakeBackend({"small": 3, "big": 120, "empty": 0})
+    rows = {}
+    lock = threading.Lock()
+
+    def on_rows(username, chunk):
+        with lock:
+            rows.setdefault(username, []).extend(chunk)
+
+    scheduler = BatchScheduler([backend], workers=4, slice_posts=10, on_rows=on_rows)
+    status = scheduler.run(["small", "big", "empty", "missing"])
+
+    assert {name: entry["state"] for name, entry in status.items()} == {
+        "small": "done", "big": "done", "empty": "done", "missing": "failed"}
+    assert status["big"]["rows"] == 120
+    assert status["big"]["slices"] == 13
+    assert "missing" in status["missing"]["error"]
+    assert [row["url"] for row in rows["big"]] == [f"https://www.instagram.com/p/big{i}/" for i in range(120)]
+    assert "empty" not in rows
+
+    report = tmp_path / "status.json"
+    scheduler.write_report(report)
+    assert '"missing"' in report.read_text()
+
+
+def test_huge_profile_does_not_starve_the_others():
+    finished = []
+    backend = FakeBackend({"huge": 1000, **{f"user{i}": 5 for i in range(5)}})
+
+    def on_rows(username, chunk):
+        if len(chunk) < 10:
+            finished.append(username)
+
+    scheduler = BatchScheduler([backend], workers=1, slice_posts=10, on_rows=on_rows)
+    scheduler.run(["huge"] + [f"user{i}" for i in range(5)])
+    # Round-robin: the small profiles finish on their first turn
+    assert finished[:5] == [f"user{i}" for i in range(5)]
+    # The last turn finds the iterator exhausted
+    assert scheduler.status["huge"]["slices"] == 101
+
+
+def test_account_concurrency_bounds_slices_per_backend():
+    limited = FakeBackend({f"a{i}": 20 for i in range(6)}, delay=0.002, name="limited", max_concurrency=2)
+    other = FakeBackend({f"b{i}": 20 for i in range(6)}, delay=0.002, name="other", max_concurrency=4)
+    usernames = [name for pair in zip(limited.post_counts, other.post_counts) for name in pair]
+
+    status = BatchScheduler([limited, other], workers=8, slice_posts=5).run(usernames)
+
+    assert all(entry["state"] == "done" for entry in status.values())
+    assert {status[name]["backend"] for name in limited.post_counts} == {"limited"}
+    assert limited.max_active <= 2
+    assert 1 < other.max_active <= 4
+
+
+def test_read_usernames_skips_comments_urls_and_duplicates(tmp_path):
+    path = tmp_path / "usernames.txt"
+    path.write_text("# accounts\nalice\n\nhttps://www.instagram.com/bob/?hl=en\nalice\n bob \ncarol\n",
+                    encoding="utf-8")
+    assert read_usernames(path) == ["alice", "bob", "carol"]
@@ -0,0 +1,95 @@
+from datetime import datetime
+
+import pytest
+
+from timeline.checkpoint import CheckpointStore
+from timeline.records import PostRecord
+
+
+def _row(i):
+    return PostRecord(datetime(2024, 1, 1, 12, i), f"https://www.instagram.com/p/P{i}/", f"Place {i}", 1.0 + i, 2.0)
+
+
+def _urls(rows):
+    return [row["url"] for row in rows]
+
+
+def test_fresh_store_is_empty(tmp_path):
+    store = CheckpointStore(tmp_path, "alice")
+    state = store.load()
+    assert state["iterator"] is None
+    assert list(store.iter_pending_rows(state)) == []
+    assert list(store.iter_rows()) == []
+
+
+def test_resume_replays_saved_rows_and_drops_unsaved_ones(tmp_path):
+    store = CheckpointStore(tmp_path, "alice")
+    state = store.load()
+    store.open_pending(state)
+    for i in range(3):
+        store.append_row(_row(i))
+    store.save_progress(state, {"cursor": "abc"}, [_row(3)], newest_mediaid=42, old_urls={"u1"})
+    # Appended after the last save, then the process dies
+    store.append_row(_row(4))
+    store.close()
+
+    resumed = CheckpointStore(tmp_path, "alice")
+    state = resumed.load()
+    assert state["iterator"] == {"cursor": "abc"}
+    assert state["pending_count"] == 3
+    assert state["pending_newest_mediaid"] == 42
+    assert state["old_urls"] == ["u1"]
+    assert _urls(state["window_rows"]) == [_row(3)["url"]]
+    assert _urls(resumed.iter_pending_rows(state)) == _urls(_row(i) for i in range(3))
+    # Dates survive the JSON round trip
+    assert next(resumed.iter_pending_rows(state))["date"] == datetime(2024, 1, 1, 12, 0)
+
+    resumed.open_pending(state)
+    assert resumed.pending_count == 3
+    resumed.append_row(_row(5))
+    resumed.save_progress(state, {"cursor": "def"}, [], newest_mediaid=42)
+    resumed.close()
+    assert _urls(resumed.iter_pending_rows(state)) == _urls(_row(i) for i in (0, 1, 2, 5))
+
+
+def test_complete_crawl_becomes_the_previous_rows(tmp_path):
+    store = CheckpointStore(tmp_path, "alice")
+    state = store.load()
+    store.open_pending(state)
+    store.append_row(_row(0))
+    store.append_row(_row(1))
+    store.save_complete(state, newest_mediaid=99)
+
+    state = CheckpointStore(tmp_path, "alice").load()
+    assert state["iterator"] is None
+    assert state["newest_mediaid"] == 99
+    assert state["pending_offset"] == state["pending_count"] == 0
+    assert _urls(store.iter_rows()) == _urls([_row(0), _row(1)])
+
+    # A new crawl without a saved position starts its pending rows over
+    store.open_pending(state)
+    store.append_row(_row(2))
+    store.save_complete(state, newest_mediaid=None)
+    assert _urls(store.iter_rows()) == [_row(2)["url"]]
+    assert CheckpointStore(tmp_path, "alice").load()["newest_mediaid"] == 99
+
+
+def test_truncated_pending_file_is_rejected(tmp_path):
+    store = CheckpointStore(tmp_path, "alice")
+    state = store.load()
+    store.open_pending(state)
+    store.append_row(_row(0))
+    store.save_progress(state, {"cursor": "abc"}, [], newest_mediaid=None)
+    store.close()
+    open(store.pending_path, "wb").close()
+
+    with pytest.raises(ValueError):
+        store.open_pending(store.load())
+
+
+def test_unreadable_checkpoint_starts_over(tmp_path, capsys):
+    store = CheckpointStore(tmp_path, "alice")
+    with open(store.path, "w", encoding="utf-8") as file:
+        file.write("{not json")
+    assert store.load()["iterator"] is None
+    assert "Ignoring unreadable checkpoint" in capsys.readouterr().out
@@ -0,0 +1,116 @@
+import os
+import shutil
+
+import pytest
+
+from timeline.fixtures import SEED_DUMP_DIR
+from timeline.geo_index import GeoIndex
+from timeline.instagram import mediaid_to_shortcode
+
+HEADER = "date,url,location_name,latitude,longitude\n"
+
+
+def _row(mediaid, latitude=48.0, longitude=11.0):
+    return (f"2024-01-{mediaid % 28 + 1:02d} 10:00:00,https://www.instagram.com/p/{mediaid_to_shortcode(mediaid)}/,"
+            f"Place,{latitude + mediaid / 1000},{longitude + mediaid / 1000}\n")
+
+
+def _write(path, mediaids, mode="w"):
+    with open(path, mode, encoding="utf-8") as file:
+        if mode == "w":
+            file.write(HEADER)
+        file.writelines(_row(mediaid) for mediaid in mediaids)
+
+
+def _everything(index):
+    return index.bbox(-90, -180, 90, 180)
+
+
+def test_radius_bbox_and_nearest(tmp_path):
+    index = GeoIndex(str(tmp_path / "index"))
+    index.add([("alice", 1, 1700000000, 48.137, 11.575),   # Munich
+               ("alice", 2, 1700003600, 48.208, 16.373),   # Vienna
+               ("bob", 3, 1700007200, -33.868, 151.209),   # Sydney
+               ("bob", 4, 1700010800, 64.0, 179.9),        # east of the antimeridian
+               ("bob", 5, 1700014400, 64.0, -179.9)])      # west of it
+    assert [hit["username"] for hit in index.radius(48.137, 11.575, 10)] == ["alice"]
+    assert {hit["url"] for hit in index.radius(48.137, 11.575, 400)} == {
+        f"https://www.instagram.com/p/{mediaid_to_shortcode(mediaid)}/" for mediaid in (1, 2)}
+    assert len(index.bbox(63, 179, 65, -179)) == 2
+    assert len(index.radius(64.0, 180.0, 20)) == 2
+    nearest = index.nearest(48.0, 12.0, 2)
+    assert [hit["latitude"] for hit in nearest] == [48.137, 48.208]
+    assert nearest[0]["distance_km"] < nearest[1]["distance_km"]
+    assert len(index.bbox(-90, -180, 90, 180, since="2023-11-15T00:00:00")) == 3
+
+
+def test_timeline_is_read_incrementally(tmp_path):
+    timeline = str(tmp_path / "alice.csv")
+    _write(timeline, range(1, 21))
+    index = GeoIndex(str(tmp_path / "index"))
+    assert index.add_source(timeline) == 20
+    assert index.add_source(timeline) == 0
+
+    _write(timeline, range(21, 26), mode="a")
+    assert index.add_source(timeline) == 5
+
+    # Rewritten newest first with one new post: read in full, no duplicates
+    _write(timeline, range(26, 0, -1))
+    os.utime(timeline, (1, 1))
+    assert index.add_source(timeline) == 26
+    assert len(_everything(index)) == 26
+    assert {hit["username"] for hit in _everything(index)} == {"alice"}
+
+
+def test_dump_directory_is_read_once(tmp_path):
+    dump = str(tmp_path / "dump")
+    shutil.copytree(SEED_DUMP_DIR, dump)
+    index = GeoIndex(str(tmp_path / "index"))
+    added = index.add_source(dump)
+    assert added > 0
+    assert index.add_source(dump) == 0
+
+    newest = sorted(name for name in os.listdir(dump) if name.endswith("_UTC.json.xz"))[-1]
+    shutil.copy(os.path.join(dump, newest), os.path.join(dump, "2099-01-01_00-00-00_UTC.json.xz"))
+    assert index.add_source(dump) == 1
+    assert len(_everything(index)) == added
+
+
+def test_compaction_keeps_the_newest_copy(tmp_path):
+    index = GeoIndex(str(tmp_path / "index"))
+    # Segments, oldest first: the post is moved by the 3rd and again by the 5th
+    index.add([("u", mediaid, 1700000000, 10.0, 10.0) for mediaid in range(100, 150)])
+    index.add([("u", 1, 1700000000, 1.0, 1.0)])
+    index.add([("u", 1, 1700000000, 2.0, 2.0), ("u", 2, 1700000000, 2.0, 2.0)])
+    index.add([("u", mediaid, 1700000000, 10.0, 10.0) for mediaid in range(200, 260)])
+    index.add([("u", 1, 1700000000, 3.0, 3.0)])
+    index.compact(2)
+    assert [entry["points"] for entry in index.manifest["segments"]] == [50, 2, 60, 1]
+    index.compact(3)
+    assert [entry["points"] for entry in index.manifest["segments"]] == [50, 62]
+    index.compact(0)
+    assert [entry["points"] for entry in index.manifest["segments"]] == [112]
+
+    reopened = GeoIndex(str(tmp_path / "index"))
+    hits = reopened.radius(3.0, 3.0, 1)
+    assert [hit["url"] for hit in hits] == [f"https://www.instagram.com/p/{mediaid_to_shortcode(1)}/"]
+    assert len(_everything(reopened)) == 112
+    assert sorted(os.listdir(tmp_path / "index")) == ["manifest.json", reopened.manifest["segments"][0]["name"]]
+
+
+def test_orphan_segment_directories_are_skipped(tmp_path):
+    index = GeoIndex(str(tmp_path / "index"))
+    os.makedirs(tmp_path / "index" / "seg-000001")
+    index.add([("u", 1, 1700000000, 1.0, 1.0)])
+    assert index.manifest["segments"][0]["name"] != "seg-000001"
+    index.add([("u", 2, 1700000000, 1.0, 1.0)])
+    index.compact(0)
+    assert not os.path.exists(tmp_path / "index" / "seg-000001")
+
+
+def test_other_format_versions_are_rejected(tmp_path):
+    directory = tmp_path / "index"
+    directory.mkdir()
+    (directory / "manifest.json").write_text('{"version": 99}')
+    with pytest.raises(ValueError, match="format 99"):
+        GeoIndex(str(directory))
@@ -0,0 +1,50 @@
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("requests")
+
+from timeline.bench import load_script
+from timeline.fixtures import FakeProfile, FixtureServer, location_for
+
+USER_ID = "17841400000000000"
+
+main2 = load_script("main2", "main2/main2.py")
+
+
+def _timeline(server, **options):
+    return list(main2.get_instagram_location_timeline(USER_ID, "token", base_url=server.base_url,
+                                                      cache_path=None, http_cache_path=None, **options))
+
+
+@pytest.fixture(scope="module")
+def profile():
+    return FakeProfile("alice", 250)
+
+
+def test_streams_every_page(profile):
+    expected = [(location.name, post.date_utc) for post in profile.get_posts()
+                for location in [location_for(post.mediaid)] if location]
+    with FixtureServer({USER_ID: profile}) as server:
+        entries = _timeline(server, page_size=20)
+        assert server.requests == 13
+    assert [(entry["location"], datetime.fromisoformat(entry["timestamp"])) for entry in entries] == expected
+
+
+def test_limit_stops_paging_early(profile):
+    with FixtureServer({USER_ID: profile}) as server:
+        entries = _timeline(server, page_size=20, limit=3)
+        assert len(entries) == 3
+        # The next page may already be in flight, but no more than that
+        assert server.requests <= 2
+
+
+def test_since_stops_at_the_first_older_post(profile):
+    posts = list(profile.get_posts())
+    since = posts[59].date_utc
+    with FixtureServer({USER_ID: profile}) as server:
+        entries = _timeline(server, page_size=20, since=since)
+        assert server.requests <= 5
+    assert entries
+    assert all(datetime.fromisoformat(entry["timestamp"]) >= since for entry in entries)
+    assert len(entries) == sum(1 for post in posts[:60] if location_for(post.mediaid))
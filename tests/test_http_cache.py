@@ -0,0 +1,84 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+requests = pytest.importorskip("requests")
+
+from timeline.fixtures import FixtureServer
+from timeline.http_cache import HttpCache, mount_cache, normalize_url
+
+
+@pytest.fixture
+def cache(tmp_path):
+    with HttpCache(str(tmp_path / "http.sqlite")) as cache:
+        yield cache
+
+
+def test_normalize_url_sorts_the_query_and_drops_credentials():
+    assert (normalize_url("HTTPS://Graph.Example.com/1/media?limit=5&access_token=secret&after=2#frag")
+            == "https://graph.example.com/1/media?after=2&limit=5")
+
+
+def test_fresh_entry_is_answered_without_a_request(cache):
+    session = mount_cache(requests.Session(), cache)
+    with FixtureServer() as server:
+        first = session.get(f"{server.base_url}/p/ABC/?__a=1")
+        second = session.get(f"{server.base_url}/p/ABC/?__a=1")
+        assert server.requests == 1
+    assert not getattr(first, "from_cache", False)
+    assert second.from_cache
+    assert second.json() == first.json()
+    assert cache.stats == {"hits": 1, "revalidated": 0, "misses": 1, "stored": 1}
+
+
+def test_stale_entry_is_revalidated(tmp_path):
+    with HttpCache(str(tmp_path / "http.sqlite"), policies=((r"/p/", 0),)) as cache:
+        session = mount_cache(requests.Session(), cache)
+        with FixtureServer() as server:
+            first = session.get(f"{server.base_url}/p/ABC/?__a=1")
+            second = session.get(f"{server.base_url}/p/ABC/?__a=1")
+            assert server.requests == 2
+            assert server.not_modified == 1
+        assert second.from_cache
+        assert second.json() == first.json()
+        assert cache.stats["revalidated"] == 1
+
+
+def test_credentials_are_not_stored(cache):
+    session = mount_cache(requests.Session(), cache)
+    with FixtureServer() as server:
+        session.get(f"{server.base_url}/p/ABC/?__a=1&access_token=s3cret")
+        cached = session.get(f"{server.base_url}/p/ABC/?__a=1&access_token=other")
+        assert server.requests == 1
+    assert cached.from_cache
+    with open(cache.path, "rb") as file:
+        assert b"s3cret" not in file.read()
+
+
+class _LoginWall(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        body = b"<html><body>Log in to continue</body></html>"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def test_html_answered_with_200_is_not_cached(cache):
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _LoginWall)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    try:
+        session = mount_cache(requests.Session(), cache)
+        url = f"http://127.0.0.1:{httpd.server_address[1]}/p/ABC/?__a=1"
+        session.get(url)
+        again = session.get(url)
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+    assert not getattr(again, "from_cache", False)
+    assert cache.stats["stored"] == 0
@@ -0,0 +1,51 @@
+import pytest
+
+from timeline.location_cache import MISS, LocationCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    with LocationCache(str(tmp_path / "locations.sqlite")) as cache:
+        yield cache
+
+
+def test_post_locations_round_trip(cache):
+    assert cache.get_post("ABC") is MISS
+    cache.put_post("ABC", ("Paris", "48.85", "2.35"), location_id=123)
+    assert cache.get_post("ABC") == ("Paris", 48.85, 2.35)
+    assert cache.get_location(123) == ("Paris", 48.85, 2.35)
+    # main4's placeholders are stored as missing coordinates
+    cache.put_post("DEF", ("Somewhere", "Unknown", "Unknown"))
+    assert cache.get_post("DEF") == ("Somewhere", None, None)
+    assert cache.stats["misses"] == 1
+
+
+def test_posts_without_location_are_cached_negatively(cache):
+    cache.put_post("ABC", None)
+    assert cache.get_post("ABC") is None
+    assert cache.stats["negative_hits"] == 1
+
+
+def test_negative_entries_expire_after_negative_ttl(tmp_path):
+    with LocationCache(str(tmp_path / "locations.sqlite"), negative_ttl=-1) as cache:
+        cache.put_post("ABC", None)
+        cache.put_post("DEF", ("Paris", 48.85, 2.35))
+        assert cache.get_post("ABC") is MISS
+        assert cache.get_post("DEF") == ("Paris", 48.85, 2.35)
+
+
+def test_resolver_answers_known_posts_from_the_cache(cache):
+    pytest.importorskip("requests")
+    from timeline.fixtures import FixtureServer
+    from timeline.location_resolver import LocationResolver
+
+    shortcodes = [f"Post{i}" for i in range(20)]
+    with FixtureServer(location_ratio=0.5) as server:
+        with LocationResolver(base_url=server.base_url, concurrency=4, cache=cache) as resolver:
+            first = resolver.resolve(shortcodes)
+            assert server.requests == 20
+            second = resolver.resolve(shortcodes)
+            assert server.requests == 20
+    assert second == first
+    assert cache.stats["hits"] + cache.stats["negative_hits"] == 20
+    assert cache.stats["negative_hits"] > 0
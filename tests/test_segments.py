@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from timeline.segments import TimelineSegmenter, segment_points, segment_timeline, timeline_arrays
+
+HOUR = 3600
+
+# Two days in Paris, a train ride via Lyon, three days in Nice
+TRIP = [
+    (0, 48.8566, 2.3522),
+    (5 * HOUR, 48.8606, 2.3376),
+    (30 * HOUR, 48.8530, 2.3499),
+    (40 * HOUR, 45.7640, 4.8357),
+    (44 * HOUR, 43.7102, 7.2620),
+    (60 * HOUR, 43.6950, 7.2650),
+    (100 * HOUR, 43.7031, 7.2661),
+]
+
+
+def _arrays(points):
+    seconds, latitudes, longitudes = zip(*points)
+    return np.array(seconds, dtype=np.int64), np.array(latitudes), np.array(longitudes)
+
+
+def _kinds(segments):
+    return [(segment["kind"], segment["start_index"], segment["end_index"]) for segment in segments]
+
+
+def test_stays_and_trips():
+    segments = segment_points(*_arrays(TRIP), min_dwell=12 * HOUR)
+    assert _kinds(segments) == [("stay", 0, 2), ("trip", 3, 3), ("stay", 4, 6)]
+    assert segments[0]["posts"] == 3
+    assert segments[2]["end"] - segments[2]["start"] == 56 * HOUR
+
+
+@pytest.mark.parametrize("chunk", [1, 2, 3])
+def test_incremental_matches_batch(chunk):
+    seconds, latitudes, longitudes = _arrays(TRIP)
+    segmenter = TimelineSegmenter(min_dwell=12 * HOUR)
+    for start in range(0, len(seconds), chunk):
+        end = start + chunk
+        segmenter.append(seconds[start:end], latitudes[start:end], longitudes[start:end])
+    batch = segment_points(seconds, latitudes, longitudes, min_dwell=12 * HOUR)
+    assert segmenter.segments(linked=False) == batch
+
+
+def test_timeline_arrays_reads_either_column_case_and_utc_offsets():
+    frame = {
+        "Date": ["2024-01-01T10:00:00+05:30", "2024-01-01 05:00:00", "2024-01-01T06:00:00Z"],
+        "Latitude": ["48.85", "Unknown", "48.86"],
+        "Longitude": ["2.35", "Unknown", "2.34"],
+    }
+    seconds, latitudes, longitudes = timeline_arrays(frame)
+    # 10:00+05:30 is 04:30 UTC, before 06:00 UTC; the row without coordinates is dropped
+    assert (seconds - seconds[0]).tolist() == [0, 90 * 60]
+    assert latitudes.tolist() == [48.85, 48.86]
+
+
+def test_missing_columns_are_named():
+    with pytest.raises(ValueError, match="latitude or Latitude"):
+        segment_timeline({"date": [], "longitude": []})
@@ -0,0 +1,108 @@
+import io
+import json
+import time
+
+import pytest
+
+from timeline.fixtures import FakeSource
+from timeline.watch import MAX_INTERVAL, MIN_INTERVAL, RateLimiter, Watcher, WatchState, next_interval, parse_duration
+
+DAY = 24 * 3600
+
+
+@pytest.fixture
+def watcher(tmp_path):
+    source = FakeSource(RateLimiter(per_minute=60_000))
+    with WatchState(str(tmp_path / "state.sqlite")) as state:
+        yield Watcher(source, state, str(tmp_path / "timelines"), io.StringIO(), workers=2)
+
+
+def _events(watcher):
+    return [json.loads(line) for line in watcher.events.getvalue().splitlines()]
+
+
+def test_parse_duration():
+    assert parse_duration("90") == 90
+    assert parse_duration("15m") == 900
+    assert parse_duration("2d") == 2 * DAY
+    with pytest.raises(ValueError):
+        parse_duration("soon")
+
+
+def test_next_interval_bounds_and_backoff():
+    now = time.time()
+    assert next_interval(None, None, now) == MAX_INTERVAL
+    assert next_interval(60, now - 60, now) == MIN_INTERVAL
+    assert next_interval(4 * 3600, now - 60, now) == 3600
+    assert next_interval(None, None, now, failures=2) == 4 * MIN_INTERVAL
+
+
+def test_only_new_posts_are_reported(watcher):
+    now = time.time()
+    watcher.source.publish("alice", [now - 3 * DAY, now - 2 * DAY, now - DAY])
+    watcher.add(["alice"])
+    # The first poll only records the newest post
+    assert watcher.poll("alice") == []
+
+    watcher.source.publish("alice", [now - 60, now - 30])
+    rows = watcher.poll("alice")
+    assert [row["url"] for row in rows] == ["https://www.instagram.com/p/P4/", "https://www.instagram.com/p/P5/"]
+    assert [event["url"] for event in _events(watcher)] == [row["url"] for row in rows]
+    with open(f"{watcher.timeline_dir}/alice.csv", encoding="utf-8") as file:
+        assert len(file.read().splitlines()) == 3
+
+    assert watcher.poll("alice") == []
+    profile = watcher.state.get("alice")
+    assert profile["newest_mediaid"] == 5
+    assert profile["new_posts"] == 2
+    assert MIN_INTERVAL <= profile["next_poll"] - profile["last_poll"] <= MAX_INTERVAL
+
+
+def test_pinned_old_post_does_not_end_the_poll(watcher):
+    now = time.time()
+    watcher.source.publish("bob", [now - 400 * DAY], pinned=True)
+    watcher.source.publish("bob", [now - 2 * DAY, now - DAY])
+    watcher.add(["bob"])
+    watcher.poll("bob")
+    watcher.source.publish("bob", [now - 10])
+    assert [row["url"] for row in watcher.poll("bob")] == ["https://www.instagram.com/p/P4/"]
+
+
+def test_failures_are_reported_and_backed_off(watcher):
+    watcher.add(["ghost"])
+    assert watcher.poll("ghost") == []
+    profile = watcher.state.get("ghost")
+    assert profile["failures"] == 1
+    assert "ghost" in profile["last_error"]
+    assert profile["next_poll"] - profile["last_poll"] == pytest.approx(2 * MIN_INTERVAL)
+    assert _events(watcher)[-1]["event"] == "error"
+
+
+def test_location_errors_count_as_failed_polls(watcher):
+    now = time.time()
+    watcher.source.publish("carol", [now - DAY])
+    watcher.add(["carol"])
+    watcher.poll("carol")
+    watcher.source.publish("carol", [now - 10])
+
+    class Unreachable(FakeSource.Post):
+        @property
+        def location(self):
+            raise ConnectionError("location fetch failed")
+
+        @location.setter
+        def location(self, value):
+            pass
+
+    watcher.source.posts["carol"][0].__class__ = Unreachable
+    assert watcher.poll("carol") == []
+    assert watcher.state.get("carol")["failures"] == 1
+
+
+def test_run_once_polls_every_due_profile(watcher):
+    now = time.time()
+    for name in ("a", "b", "c"):
+        watcher.source.publish(name, [now - DAY])
+    watcher.add(["a", "b", "c", "missing"])
+    stats = watcher.run(once=True)
+    assert stats == {"polls": 4, "new_posts": 0, "errors": 1}
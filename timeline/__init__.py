@@ -0,0 +1,15 @@
+"""
+Shared building blocks for the Instagram location timeline scripts.
+
+The main1 ... main5 scripts each implement one way of collecting a timeline
+(Selenium, Graph API, instaloader). The modules in this package hold the
+pieces they have in common so every backend can reuse them.
+"""
+
+import os
+
+# Where persistent caches (locations, HTTP responses, ...) are kept
+CACHE_DIR = os.environ.get(
+    "TIMELINE_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "instagram-timeline"),
+)
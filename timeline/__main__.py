@@ -0,0 +1,9 @@
+"""
+``python -m timeline``: the instagram-timeline command (see timeline.cli).
+"""
+
+import sys
+
+from timeline.cli import main
+
+sys.exit(main())
@@ -0,0 +1,275 @@
+"""
+Batch crawling of many profiles over a worker pool.
+
+The scripts each handle one username typed at a prompt. BatchScheduler takes
+a list of usernames (e.g. from a file) and crawls them on a thread pool:
+
+- A backend turns a username into an iterator of rows; the scheduler pulls
+  at most ``slice_posts`` rows from it per turn and then puts the profile at
+  the back of the queue (round-robin), so one huge profile cannot starve
+  the others.
+- ``workers`` bounds the global concurrency and each backend's
+  ``max_concurrency`` bounds how many slices run at once on one account.
+  main() crawls with a single account, which may use every worker unless
+  ``--account-concurrency`` is lower.
+- Every profile gets a status entry (queued/running/done/failed, rows,
+  slices, elapsed time, error) that can be written out as a report.
+
+InstaloaderSessions logs in (or loads the session file) once and hands every
+profile its own Instaloader carrying that same session, so workers never log
+in again. timeline.fixtures.FakeBackend stands in for Instagram in tests.
+
+Usage:
+  python -m timeline.batch usernames.txt --login YOUR_USERNAME [-w 8] [--report status.json]
+                           [--since 30d] [--until 2024-12-31]
+"""
+
+import argparse
+import csv
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from timeline.date_range import in_date_range, parse_date
+
+WORKERS = 8
+ACCOUNT_CONCURRENCY = 2
+SLICE_POSTS = 50
+
+
+def read_usernames(path):
+    """
+    Reads one username (or profile URL) per line, skipping blanks, comments
+    and duplicates.
+    """
+    usernames = []
+    seen = set()
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            name = line.strip()
+            if not name or name.startswith("#"):
+                continue
+            if "instagram.com/" in name:
+                name = name.split("instagram.com/", 1)[1].split("/", 1)[0].split("?", 1)[0]
+            if name not in seen:
+                seen.add(name)
+                usernames.append(name)
+    return usernames
+
+
+class InstaloaderSessions:
+    """
+    One authenticated instaloader session shared by all workers.
+
+    The session is loaded from instaloader's session file once; client()
+    returns a fresh Instaloader with that session, so each profile has its
+    own HTTP session object (they are not thread-safe) without a new login.
+    """
+
+    def __init__(self, login_username, session_file=None, **loader_options):
+        import instaloader
+
+        self.instaloader = instaloader
+        self.login_username = login_username
+        self.loader_options = {"quiet": True, **loader_options}
+        loader = instaloader.Instaloader(**self.loader_options)
+        loader.load_session_from_file(login_username, session_file)
+        self.session_data = loader.save_session()
+
+    def client(self):
+        loader = self.instaloader.Instaloader(**self.loader_options)
+        loader.load_session(self.login_username, self.session_data)
+        return loader
+
+
+class InstaloaderBackend:
+    """
+    Crawls profiles through instaloader, yielding main4-style rows, limited
+    to posts between since and until (naive UTC datetimes) if given.
+    """
+
+    def __init__(self, sessions, name=None, max_concurrency=ACCOUNT_CONCURRENCY, since=None, until=None):
+        self.sessions = sessions
+        self.name = name or sessions.login_username
+        self.max_concurrency = max_concurrency
+        self.since = since
+        self.until = until
+
+    def crawl(self, username):
+        loader = self.sessions.client()
+        profile = self.sessions.instaloader.Profile.from_username(loader.context, username)
+        for post in in_date_range(profile.get_posts(), self.since, self.until):
+            location = post.location
+            yield {
+                "date": post.date_utc,
+                "url": f"https://www.instagram.com/p/{post.shortcode}/",
+                "location_name": location.name if location else None,
+                "latitude": location.lat if location else None,
+                "longitude": location.lng if location else None,
+            }
+
+
+class BatchScheduler:
+    """
+    Schedules profile crawls over a thread pool with round-robin slices.
+
+    Args:
+        backends (list): Objects with name, max_concurrency and
+            crawl(username) -> iterator of rows. Profiles are assigned to
+            them round-robin and stay on their backend.
+        workers (int): Global number of concurrent slices.
+        slice_posts (int): Rows pulled from a profile per turn.
+        on_rows (callable): Called as on_rows(username, rows) after every
+            slice, from the worker thread.
+    """
+
+    def __init__(self, backends, workers=WORKERS, slice_posts=SLICE_POSTS, on_rows=None):
+        self.backends = list(backends)
+        self.workers = workers
+        self.slice_posts = slice_posts
+        self.on_rows = on_rows
+        self.status = {}
+        self._queue = deque()
+        self._running = {backend.name: 0 for backend in self.backends}
+        self._active_tasks = 0
+        self._condition = threading.Condition()
+
+    def submit(self, usernames):
+        with self._condition:
+            for i, username in enumerate(usernames):
+                if username in self.status:
+                    continue
+                backend = self.backends[i % len(self.backends)]
+                self.status[username] = {"state": "queued", "backend": backend.name, "rows": 0,
+                                         "slices": 0, "elapsed_s": 0.0, "error": None}
+                self._queue.append({"username": username, "backend": backend, "iterator": None})
+            self._condition.notify_all()
+
+    def _next_task(self):
+        """
+        Takes the first queued task whose backend has a free slot, waiting
+        if there is none. Returns None once all work is done.
+        """
+        with self._condition:
+            while True:
+                for task in self._queue:
+                    backend = task["backend"]
+                    if self._running[backend.name] < backend.max_concurrency:
+                        self._queue.remove(task)
+                        self._running[backend.name] += 1
+                        self._active_tasks += 1
+                        return task
+                if not self._queue and not self._active_tasks:
+                    return None
+                self._condition.wait()
+
+    def _finish_slice(self, task, requeue):
+        with self._condition:
+            self._running[task["backend"].name] -= 1
+            self._active_tasks -= 1
+            if requeue:
+                self._queue.append(task)
+            self._condition.notify_all()
+
+    def _run_slice(self, task):
+        username = task["username"]
+        status = self.status[username]
+        status["state"] = "running"
+        start = time.monotonic()
+        rows = []
+        finished = False
+        try:
+            if task["iterator"] is None:
+                task["iterator"] = iter(task["backend"].crawl(username))
+            for _ in range(self.slice_posts):
+                try:
+                    rows.append(next(task["iterator"]))
+                except StopIteration:
+                    finished = True
+                    break
+            if rows and self.on_rows is not None:
+                self.on_rows(username, rows)
+            status["state"] = "done" if finished else "queued"
+        except Exception as e:
+            finished = True
+            status["state"] = "failed"
+            status["error"] = str(e)
+        status["rows"] += len(rows)
+        status["slices"] += 1
+        status["elapsed_s"] = round(status["elapsed_s"] + time.monotonic() - start, 3)
+        return not finished
+
+    def _worker(self):
+        while True:
+            task = self._next_task()
+            if task is None:
+                return
+            requeue = False
+            try:
+                requeue = self._run_slice(task)
+            finally:
+                self._finish_slice(task, requeue)
+
+    def run(self, usernames=()):
+        """
+        Crawls the submitted (and given) usernames and returns the status
+        of every profile.
+        """
+        self.submit(usernames)
+        threads = [threading.Thread(target=self._worker, name=f"batch-{i}", daemon=True)
+                   for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.status
+
+    def write_report(self, path):
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.status, file, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Crawl many Instagram profiles with one shared session.")
+    parser.add_argument("usernames", help="File with one username or profile URL per line")
+    parser.add_argument("--login", required=True, help="Instagram account whose saved session is used")
+    parser.add_argument("--session-file", help="instaloader session file (default: instaloader's)")
+    parser.add_argument("-w", "--workers", type=int, default=WORKERS)
+    parser.add_argument("--account-concurrency", type=int,
+                        help="Concurrent slices on the logged-in account (default: --workers)")
+    parser.add_argument("--slice", type=int, default=SLICE_POSTS, help="Posts per profile per turn")
+    parser.add_argument("-o", "--output-dir", default="timelines", help="Where per-profile CSVs go")
+    parser.add_argument("--report", default="batch_status.json")
+    parser.add_argument("--since", help="Only posts since this date (YYYY-MM-DD) or age (e.g. 30d)")
+    parser.add_argument("--until", help="Only posts until this date (YYYY-MM-DD)")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    write_lock = threading.Lock()
+    started = set()
+
+    def write_rows(username, rows):
+        path = os.path.join(args.output_dir, f"{username}.csv")
+        with write_lock:
+            first = username not in started
+            started.add(username)
+        with open(path, "w" if first else "a", newline="", encoding="utf-8") as file:
+            writer = csv.DictWriter(file, fieldnames=list(rows[0]))
+            if first:
+                writer.writeheader()
+            writer.writerows(rows)
+
+    sessions = InstaloaderSessions(args.login, args.session_file)
+    backend = InstaloaderBackend(sessions, max_concurrency=args.account_concurrency or args.workers,
+                                 since=parse_date(args.since), until=parse_date(args.until, end_of_day=True))
+    scheduler = BatchScheduler([backend], workers=args.workers, slice_posts=args.slice, on_rows=write_rows)
+    status = scheduler.run(read_usernames(args.usernames))
+    scheduler.write_report(args.report)
+    done = sum(1 for entry in status.values() if entry["state"] == "done")
+    print(f"{done}/{len(status)} profiles crawled, status report saved to {args.report}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+"""
+Benchmark suite for the timeline pipelines, run against the fixture backend.
+
+Each benchmark runs once for timing and once more under tracemalloc for the
+peak Python memory, then reports throughput. Results can be stored as a
+baseline and later runs compared against it.
+
+Usage:
+  python -m timeline.bench [--posts 10000] [--only iteration,render] [--save-baseline base.json]
+  python -m timeline.bench --posts 10000 --baseline base.json [--threshold 0.1] [--fail-on-regression]
+
+Benchmarks whose dependencies are missing (instaloader, and requests for
+main4, for the main4/main5 writers; requests, matplotlib, numpy) are reported
+as skipped.
+"""
+
+import argparse
+import gc
+import importlib.util
+import json
+import lzma
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import timezone
+
+from timeline.fixtures import FakeProfile, FixtureServer, load_seeds
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+USER_ID = "17841403580947320"
+USERNAME = "sharmashresth"
+
+# Benchmarks that talk HTTP or write files are capped below --posts
+HTTP_POSTS = 100_000
+LOOKUP_POSTS = 20_000
+DUMP_FILES = 5_000
+
+
+class Skip(Exception):
+    """
+    Raised by a benchmark whose dependencies are not available.
+    """
+
+
+def load_script(name, relative_path):
+    """
+    Imports one of the mainN scripts by path; Skip if its imports fail.
+    """
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, relative_path))
+    module = importlib.util.module_from_spec(spec)
+    try:
+        spec.loader.exec_module(module)
+    except ImportError as e:
+        raise Skip(f"missing module {e.name}") from None
+    return module
+
+
+def _require(module_name):
+    if importlib.util.find_spec(module_name) is None:
+        raise Skip(f"missing module {module_name}")
+
+
+def bench_iteration(posts, seeds, workdir):
+    """
+    Profile.get_posts() iteration, touching the fields the scripts read.
+    """
+    count = 0
+    for post in FakeProfile(USERNAME, posts, seeds).get_posts():
+        post.shortcode, post.mediaid, post.date_utc, post.location, post.caption_hashtags
+        count += 1
+    return count
+
+
+def bench_graph_api(posts, seeds, workdir):
+    """
+    main2's paginated Graph API timeline against the local fixture server.
+    """
+    _require("requests")
+    main2 = load_script("main2", "main2/main2.py")
+    posts = min(posts, HTTP_POSTS)
+    with FixtureServer({USER_ID: FakeProfile(USERNAME, posts, seeds)}) as server:
+        server.httpd.media(USER_ID)  # build the fixture before timing
+        start = time.perf_counter()
+        count = sum(1 for _ in main2.get_instagram_location_timeline(
+            USER_ID, "token", base_url=server.base_url, cache_path=None, http_cache_path=None))
+        return posts, {"located": count, "requests": server.requests,
+                       "elapsed_s": time.perf_counter() - start}
+
+
+def bench_location_resolution(posts, seeds, workdir):
+    """
+    Concurrent ``?__a=1`` lookups through LocationResolver, cold and then
+    warm from the location cache.
+    """
+    _require("requests")
+    from timeline.location_cache import LocationCache
+    from timeline.location_resolver import LocationResolver
+
+    posts = min(posts, LOOKUP_POSTS)
+    shortcodes = [post.shortcode for post in FakeProfile(USERNAME, posts, seeds).get_posts()]
+    cache_path = os.path.join(workdir, f"locations-{time.monotonic_ns()}.sqlite")
+    with FixtureServer() as server, LocationCache(cache_path) as cache:
+        with LocationResolver(base_url=server.base_url, concurrency=16, cache=cache) as resolver:
+            start = time.perf_counter()
+            resolver.resolve(shortcodes)
+            cold = time.perf_counter() - start
+            start = time.perf_counter()
+            resolver.resolve(shortcodes)
+            warm = time.perf_counter() - start
+        return posts, {"requests": server.requests, "cold_s": round(cold, 3), "warm_s": round(warm, 3),
+                       "cache": dict(cache.stats)}
+
+
+def bench_csv_main4(posts, seeds, workdir):
+    """
+    main4.save_to_csv streaming main4's PostRecord rows.
+    """
+    main4 = load_script("main4", "main4/main4.py")
+
+    def rows():
+        for post in FakeProfile(USERNAME, posts, seeds).get_posts():
+            location = post.location
+            yield main4.PostRecord(post.date_utc, f"https://www.instagram.com/p/{post.shortcode}/",
+                                   location.name if location else "Unknown",
+                                   location.lat if location else "Unknown",
+                                   location.lng if location else "Unknown")
+
+    return main4.save_to_csv(rows(), os.path.join(workdir, "main4.csv"))
+
+
+def bench_csv_main5(posts, seeds, workdir):
+    """
+    main5.list_public_posts with Profile.from_username served by FakeProfile.
+    """
+    main5 = load_script("main5", "main5_shubhang/main5.py")
+    profile = FakeProfile(USERNAME, posts, seeds)
+    original = main5.instaloader.Profile.from_username
+    main5.instaloader.Profile.from_username = staticmethod(lambda context, username: profile)
+    try:
+        main5.list_public_posts(USERNAME, os.path.join(workdir, "main5.csv"), cache_path=None)
+    finally:
+        main5.instaloader.Profile.from_username = original
+    return posts
+
+
+def _write_synthetic_dump(directory, posts, seeds):
+    """
+    Writes FakeProfile posts as instaloader ``<date>_UTC.json.xz`` node files.
+    """
+    os.makedirs(directory, exist_ok=True)
+    for post in FakeProfile(USERNAME, posts, seeds).get_posts():
+        node = {"shortcode": post.shortcode, "id": str(post.mediaid), "__typename": post.typename,
+                "date": int(post.date_utc.replace(tzinfo=timezone.utc).timestamp()),
+                "caption": post.caption, "owner": {"username": USERNAME}}
+        location = post.location
+        if location:
+            node["location"] = {"id": str(location.id), "name": location.name,
+                                "lat": location.lat, "lng": location.lng}
+        # The index keeps names unique when two posts share a second
+        name = post.date_utc.strftime("%Y-%m-%d_%H-%M-%S") + f"_{post.index}_UTC.json.xz"
+        with lzma.open(os.path.join(directory, name), "wt", encoding="utf-8") as file:
+            json.dump({"node": node, "instaloader": {"version": "4.14", "node_type": "Post"}}, file)
+
+
+def bench_dump_ingest(posts, seeds, workdir):
+    """
+    Parallel ingestion of a synthetic instaloader dump.
+    """
+    from timeline.dump_ingest import ingest_dump
+
+    posts = min(posts, DUMP_FILES)
+    directory = os.path.join(workdir, f"dump-{posts}")
+    if not os.path.isdir(directory):
+        _write_synthetic_dump(directory, posts, seeds)
+    start = time.perf_counter()
+    count = sum(1 for _ in ingest_dump(directory))
+    return count, {"elapsed_s": time.perf_counter() - start}
+
+
+def bench_render(posts, seeds, workdir):
+    """
+    Headless timeline rendering of one profile.
+    """
+    _require("matplotlib")
+    _require("numpy")
+    from timeline.render import TimelineRenderer
+
+    dates, locations = [], []
+    for post in FakeProfile(USERNAME, posts, seeds).get_posts():
+        location = post.location
+        dates.append(post.date_utc)
+        locations.append(location.name if location else None)
+    renderer = TimelineRenderer(os.path.join(workdir, "render"))
+    start = time.perf_counter()
+    renderer.render(USERNAME, dates, locations)
+    return posts, {"elapsed_s": time.perf_counter() - start}
+
+
+BENCHMARKS = {
+    "iteration": bench_iteration,
+    "graph_api": bench_graph_api,
+    "location_resolution": bench_location_resolution,
+    "csv_main4": bench_csv_main4,
+    "csv_main5": bench_csv_main5,
+    "dump_ingest": bench_dump_ingest,
+    "render": bench_render,
+}
+
+
+def _run(function, posts, seeds, workdir):
+    gc.collect()
+    start = time.perf_counter()
+    result = function(posts, seeds, workdir)
+    elapsed = time.perf_counter() - start
+    items, extra = result if isinstance(result, tuple) else (result, {})
+    # A benchmark may time only its measured part (without fixture setup)
+    elapsed = extra.pop("elapsed_s", elapsed)
+    return items, elapsed, extra
+
+
+def run_benchmarks(posts, names=None, measure_memory=True, workdir=None):
+    """
+    Runs the selected benchmarks and returns their results by name.
+    """
+    seeds = load_seeds()
+    results = {}
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        for name in names or BENCHMARKS:
+            function = BENCHMARKS[name]
+            try:
+                items, elapsed, extra = _run(function, posts, seeds, tmp)
+                peak = None
+                if measure_memory:
+                    tracemalloc.start()
+                    _run(function, posts, seeds, tmp)
+                    peak = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+            except Skip as e:
+                results[name] = {"skipped": str(e)}
+                continue
+            results[name] = {
+                "items": items,
+                "seconds": round(elapsed, 4),
+                "items_per_s": round(items / elapsed, 1) if elapsed > 0 else None,
+                "peak_mb": round(peak / 2 ** 20, 2) if peak is not None else None,
+                **extra,
+            }
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Returns {name: relative throughput change} and the list of benchmarks
+    that got slower than threshold (e.g. 0.1 for 10 %).
+    """
+    changes, regressions = {}, []
+    for name, result in results.items():
+        before = baseline.get(name, {})
+        if "items_per_s" not in result or not before.get("items_per_s") or result["items"] != before.get("items"):
+            continue
+        change = result["items_per_s"] / before["items_per_s"] - 1
+        changes[name] = change
+        if change < -threshold:
+            regressions.append(name)
+    return changes, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the timeline pipelines on fixture data.")
+    parser.add_argument("--posts", type=int, default=10_000, help="Synthetic posts per benchmark")
+    parser.add_argument("--only", help="Comma separated benchmark names: " + ", ".join(BENCHMARKS))
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc run")
+    parser.add_argument("--save-baseline", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against a stored baseline")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Allowed throughput drop (default 10%%)")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args(argv)
+
+    names = args.only.split(",") if args.only else None
+    results = run_benchmarks(args.posts, names, measure_memory=not args.no_memory)
+
+    changes, regressions = {}, []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            changes, regressions = compare(results, json.load(file)["results"], args.threshold)
+
+    print(f"{'benchmark':22} {'items':>9} {'seconds':>9} {'items/s':>12} {'peak MB':>9} {'vs base':>8}")
+    for name, result in results.items():
+        if "skipped" in result:
+            print(f"{name:22} skipped: {result['skipped']}")
+            continue
+        change = f"{changes[name]:+.1%}" if name in changes else ""
+        peak = f"{result['peak_mb']:.2f}" if result["peak_mb"] is not None else "-"
+        print(f"{name:22} {result['items']:>9} {result['seconds']:>9.3f} {result['items_per_s']:>12.1f} "
+              f"{peak:>9} {change:>8}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as file:
+            json.dump({"posts": args.posts, "python": sys.version.split()[0], "results": results}, file, indent=2)
+        print(f"Baseline saved to {args.save_baseline}.")
+    if regressions:
+        print(f"Slower than baseline by more than {args.threshold:.0%}: {', '.join(regressions)}")
+        if args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Checkpoint store for resumable profile crawls.
+
+The state of a profile is kept in three files under the checkpoint directory:
+
+- ``<username>.checkpoint.json``, small and rewritten on every save:
+  ``iterator`` (instaloader's frozen NodeIterator state of an unfinished
+  crawl), ``window_rows`` (the few rows that crawl had seen but not emitted
+  yet, at most main4's MAX_PENDING_ROWS), ``pending_offset`` and
+  ``pending_count`` (how much of the pending rows file belongs to the saved
+  position), ``pending_newest_mediaid``, ``old_urls`` (posts of the previous
+  crawl crawled again, i.e. pinned ones) and ``newest_mediaid`` of the last
+  completed crawl,
+- ``<username>.pending.jsonl``: the rows an unfinished crawl has emitted, one
+  JSON object per line, appended as they are emitted,
+- ``<username>.rows.jsonl``: the rows of the last completed crawl, so a
+  rerun only has to fetch posts newer than what it already has.
+
+Rows are only ever appended or read back as a stream, so saving progress
+costs the same at every point of a crawl and the rows are never all in
+memory.
+"""
+
+import json
+import os
+from datetime import datetime
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if hasattr(value, "as_dict"):
+        # timeline.records rows
+        return value.as_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _decode(obj):
+    if "__datetime__" in obj:
+        return datetime.fromisoformat(obj["__datetime__"])
+    return obj
+
+
+def _iter_jsonl(path, end=None):
+    """
+    Yields the rows of a JSONL file, up to byte offset end if given.
+    """
+    try:
+        file = open(path, "rb")
+    except FileNotFoundError:
+        return
+    with file:
+        for line in file:
+            if end is not None:
+                end -= len(line)
+                if end < 0:
+                    return
+            if line.endswith(b"\n"):
+                yield json.loads(line, object_hook=_decode)
+
+
+class CheckpointStore:
+    """
+    Persists crawl state for one profile under ``checkpoint_dir``.
+    """
+
+    def __init__(self, checkpoint_dir, username):
+        self.path = os.path.join(checkpoint_dir, f"{username}.checkpoint.json")
+        self.pending_path = os.path.join(checkpoint_dir, f"{username}.pending.jsonl")
+        self.rows_path = os.path.join(checkpoint_dir, f"{username}.rows.jsonl")
+        self._pending = None
+        self.pending_count = 0
+
+    def load(self):
+        """
+        Returns the saved state, or an empty state if there is none or the
+        file is unreadable.
+        """
+        state = {"iterator": None, "window_rows": [], "pending_offset": 0, "pending_count": 0,
+                 "pending_newest_mediaid": None, "old_urls": [], "newest_mediaid": None}
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                state.update(json.load(file, object_hook=_decode))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable checkpoint {self.path}: {e}")
+        return state
+
+    def save(self, state):
+        """
+        Writes the state atomically, so an interruption during the write never
+        leaves a truncated checkpoint behind.
+        """
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(state, file, default=_encode)
+        os.replace(tmp_path, self.path)
+
+    def iter_pending_rows(self, state):
+        """
+        Yields the rows the saved unfinished crawl had emitted.
+        """
+        return _iter_jsonl(self.pending_path, state["pending_offset"])
+
+    def iter_rows(self):
+        """
+        Yields the rows of the last completed crawl.
+        """
+        return _iter_jsonl(self.rows_path)
+
+    def open_pending(self, state):
+        """
+        Starts appending emitted rows after those of the saved position (or
+        from scratch without one). Rows a crashed crawl appended after its
+        last save are dropped, since the crawl repeats them.
+        """
+        resume = bool(state.get("iterator"))
+        offset = state["pending_offset"] if resume else 0
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.close()
+        self._pending = open(self.pending_path, "ab")
+        if self._pending.tell() < offset:
+            self.close()
+            raise ValueError(f"{self.pending_path} is shorter than its checkpoint")
+        self._pending.truncate(offset)
+        self._pending.seek(offset)
+        self.pending_count = state["pending_count"] if resume else 0
+
+    def append_row(self, row):
+        """
+        Records a row the unfinished crawl has emitted.
+        """
+        self._pending.write(json.dumps(row, default=_encode).encode("utf-8") + b"\n")
+        self.pending_count += 1
+
+    def save_progress(self, state, iterator_state, window_rows, newest_mediaid, old_urls=()):
+        """
+        Records the position of an unfinished crawl, the rows it has seen but
+        not emitted yet and, implicitly, every row appended so far.
+        """
+        self._pending.flush()
+        state["iterator"] = iterator_state
+        state["window_rows"] = list(window_rows)
+        state["pending_offset"] = self._pending.tell()
+        state["pending_count"] = self.pending_count
+        state["pending_newest_mediaid"] = newest_mediaid
+        state["old_urls"] = sorted(old_urls)
+        self.save(state)
+
+    def save_complete(self, state, newest_mediaid):
+        """
+        Records a finished crawl, whose appended rows become the rows of the
+        last completed crawl, and drops its resume information.
+        """
+        self.close()
+        os.replace(self.pending_path, self.rows_path)
+        state["iterator"] = None
+        state["window_rows"] = []
+        state["pending_offset"] = state["pending_count"] = 0
+        state["pending_newest_mediaid"] = None
+        state["old_urls"] = []
+        if newest_mediaid is not None:
+            state["newest_mediaid"] = newest_mediaid
+        self.save(state)
+
+    def close(self):
+        if self._pending is not None:
+            self._pending.close()
+            self._pending = None
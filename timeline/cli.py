@@ -0,0 +1,244 @@
+"""
+Single non-interactive entry point for all timeline backends.
+
+Each backend is a subcommand. Its script (and with it selenium, instaloader,
+requests, ...) is imported only when that subcommand runs, so starting the
+command costs little more than the Python interpreter itself:
+
+- ``selenium``: scrape a public profile page with Firefox (main3),
+- ``graph``: read the Instagram Graph API with an access token (main2),
+- ``instaloader``: crawl a profile's location timeline (main4), or with
+  ``--download`` download its media and catalog its posts (main5),
+- ``dump``: build rows from instaloader dump directories offline.
+
+Credentials are read from the environment (INSTAGRAM_ACCESS_TOKEN,
+INSTAGRAM_PASSWORD) or from saved sessions, never prompted for. The exit
+status is 0 on success (also when no posts matched), 1 on errors and 2 on
+usage errors.
+
+Run it as ``./instagram-timeline`` from anywhere (symlinks to it work too),
+or as ``python -m timeline`` from the repository root.
+
+Usage:
+  python -m timeline selenium USERNAME_OR_URL [--max-posts 50] [--mode page|click] [--no-chart]
+  python -m timeline graph USER_ID [--limit N] [-o timeline.csv]
+  python -m timeline instaloader USERNAME_OR_URL [--login YOUR_USERNAME] [--no-checkpoint] [-o timeline.parquet]
+  python -m timeline instaloader USERNAME --download [--no-media-store]
+  python -m timeline dump DUMP_DIR [DUMP_DIR ...] [-o rows.csv] [-j WORKERS]
+
+Every subcommand takes --since / --until.
+"""
+
+import argparse
+import importlib.util
+import os
+import sys
+
+from timeline.date_range import parse_date
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OUTPUT = "location_timeline.csv"
+
+# Backend scripts by subcommand
+SCRIPTS = {
+    "graph": ("main2", "main2/main2.py"),
+    "selenium": ("main3", "main3/main3.py"),
+    "instaloader": ("main4", "main4/main4.py"),
+    "download": ("main5", "main5_shubhang/main5.py"),
+}
+
+
+class CommandError(Exception):
+    """
+    A failure to report as a one-line message with exit status 1.
+    """
+
+
+def load_script(command):
+    """
+    Imports the backend script of a subcommand by path.
+    """
+    name, relative_path = SCRIPTS[command]
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, relative_path))
+    module = importlib.util.module_from_spec(spec)
+    try:
+        spec.loader.exec_module(module)
+    except ImportError as e:
+        raise CommandError(f"the {command} backend needs the '{e.name}' module, which is not installed") from None
+    sys.modules[name] = module
+    return module
+
+
+def _date_range(args):
+    try:
+        return parse_date(args.since), parse_date(args.until, end_of_day=True)
+    except ValueError as e:
+        raise CommandError(f"invalid date: {e}") from None
+
+
+def _username(target):
+    """
+    Accepts a username or a profile URL.
+    """
+    if "instagram.com/" in target:
+        target = target.split("instagram.com/", 1)[1].split("/", 1)[0].split("?", 1)[0]
+    return target.strip("@/ ")
+
+
+def run_selenium(args):
+    main3 = load_script("selenium")
+    since, until = _date_range(args)
+    count = main3.build_timeline(args.target, max_posts=args.max_posts, mode=args.mode, since=since,
+                                 until=until, filename=args.output, chart=not args.no_chart,
+                                 headless=args.headless or None)
+    if not count:
+        print("No data found. Ensure the profile exists and is public.")
+    return 0
+
+
+def run_graph(args):
+    token = args.token or os.environ.get("INSTAGRAM_ACCESS_TOKEN")
+    if not token:
+        raise CommandError("no access token: set INSTAGRAM_ACCESS_TOKEN or pass --token")
+    main2 = load_script("graph")
+    from timeline.records import write_csv
+
+    since, until = _date_range(args)
+    entries = main2.get_instagram_location_timeline(
+        args.user_id, token, limit=args.limit, since=since, until=until,
+        http_cache_path=None if args.no_http_cache else main2.HTTP_CACHE_PATH)
+    count = write_csv(entries, args.output, fieldnames=list(main2.TimelineEntry.KEYS))
+    print(f"{count} located posts of user {args.user_id} saved to {args.output}.")
+    return 0
+
+
+def run_instaloader(args):
+    if args.download:
+        return _run_download(args)
+    main4 = load_script("instaloader")
+    since, until = _date_range(args)
+    metrics = main4.CrawlMetrics(progress_interval=main4.PROGRESS_INTERVAL)
+    loader = main4.instaloader.Instaloader(rate_controller=main4.instaloader_rate_controller(metrics))
+    if args.login:
+        try:
+            main4.login(loader, args.login, os.environ.get("INSTAGRAM_PASSWORD"), session_file=args.session_file)
+        except FileNotFoundError:
+            raise CommandError(f"no saved session for {args.login}; set INSTAGRAM_PASSWORD "
+                               f"or log in once with main4/main4.py") from None
+        except main4.instaloader.exceptions.TwoFactorAuthRequiredException:
+            raise CommandError(f"{args.login} needs two-factor authentication; "
+                               f"log in once with main4/main4.py to save a session") from None
+
+    username = _username(args.target)
+    count = main4.save_location_timeline(username, loader, args.output, metrics=metrics, since=since,
+                                         until=until, checkpoint_dir=None if args.no_checkpoint else args.checkpoint_dir)
+    if args.metrics:
+        metrics.write_json(args.metrics)
+    if not count:
+        print(f"No posts found for {username}.")
+        return 0
+    print(f"{count} posts of {username} saved to {args.output}.")
+    return 0
+
+
+def _run_download(args):
+    main5 = load_script("download")
+    since, until = _date_range(args)
+    username = _username(args.target)
+    filename = args.output if args.output != OUTPUT else f"{username}.csv"
+    count = main5.download_and_list_posts(username, filename, since=since, until=until,
+                                          store_dir=None if args.no_media_store else main5.MEDIA_STORE_DIR)
+    if args.metrics:
+        main5.METRICS.write_json(args.metrics)
+    return 0 if count is not None else 1
+
+
+def run_dump(args):
+    from timeline.dump_ingest import ingest_dump, write_rows_csv
+
+    since, until = _date_range(args)
+    rows = ingest_dump(args.dump_dirs, workers=args.workers)
+    if since is not None or until is not None:
+        # Dumps are read oldest first, so the range cannot end the scan early
+        rows = (row for row in rows
+                if row["taken_at"] is not None
+                and (since is None or row["taken_at"].replace(tzinfo=None) >= since)
+                and (until is None or row["taken_at"].replace(tzinfo=None) <= until))
+    if args.output in (None, "-"):
+        write_rows_csv(rows, sys.stdout)
+        return 0
+    with open(args.output, mode="w", newline="", encoding="utf-8") as file:
+        count = write_rows_csv(rows, file)
+    print(f"{count} posts saved to {args.output}.")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="instagram-timeline",
+                                     description="Build Instagram location timelines with one of several backends.")
+    commands = parser.add_subparsers(dest="command", required=True, metavar="BACKEND")
+
+    def add_date_range(command):
+        command.add_argument("--since", help="Only posts since this date (YYYY-MM-DD) or age (e.g. 30d)")
+        command.add_argument("--until", help="Only posts until this date (YYYY-MM-DD)")
+
+    selenium = commands.add_parser("selenium", help="Scrape the profile page with Firefox (main3)")
+    selenium.add_argument("target", help="Username or profile URL")
+    selenium.add_argument("--max-posts", type=int, default=50)
+    selenium.add_argument("--mode", choices=("page", "click"), default="page")
+    selenium.add_argument("-o", "--output", default=OUTPUT, help="CSV file name inside main3's output directory")
+    selenium.add_argument("--no-chart", action="store_true", help="Do not draw the timeline chart")
+    selenium.add_argument("--headless", action="store_true",
+                          help="Write the chart to the output directory even when a window could be shown")
+    add_date_range(selenium)
+    selenium.set_defaults(run=run_selenium)
+
+    graph = commands.add_parser("graph", help="Read the Instagram Graph API (main2)")
+    graph.add_argument("user_id", help="Instagram user ID")
+    graph.add_argument("--token", help="Access token (default: $INSTAGRAM_ACCESS_TOKEN)")
+    graph.add_argument("--limit", type=int, help="Stop after this many located posts")
+    graph.add_argument("-o", "--output", default=OUTPUT)
+    graph.add_argument("--no-http-cache", action="store_true", help="Do not revalidate pages from the response cache")
+    add_date_range(graph)
+    graph.set_defaults(run=run_graph)
+
+    loader = commands.add_parser("instaloader", help="Crawl with instaloader (main4, or main5 with --download)")
+    loader.add_argument("target", help="Username or profile URL")
+    loader.add_argument("--login", help="Account whose saved session is used (password from $INSTAGRAM_PASSWORD)")
+    loader.add_argument("--session-file", help="instaloader session file (default: instaloader's)")
+    loader.add_argument("-o", "--output", default=OUTPUT,
+                        help=f"CSV file to write, Parquet if it ends in .parquet "
+                             f"(default: {OUTPUT}, or USERNAME.csv with --download)")
+    loader.add_argument("--checkpoint-dir", default="checkpoints")
+    loader.add_argument("--no-checkpoint", action="store_true", help="Do not save or resume crawl progress")
+    loader.add_argument("--download", action="store_true",
+                        help="Download the public profile's media and catalog every post instead")
+    loader.add_argument("--no-media-store", action="store_true", help="With --download, do not deduplicate media")
+    loader.add_argument("--metrics", help="Write crawl metrics to this JSON file")
+    add_date_range(loader)
+    loader.set_defaults(run=run_instaloader)
+
+    dump = commands.add_parser("dump", help="Read instaloader dump directories offline")
+    dump.add_argument("dump_dirs", nargs="+", help="Directories written by instaloader download_profile")
+    dump.add_argument("-o", "--output", help="CSV file to write (default: stdout)")
+    dump.add_argument("-j", "--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    add_date_range(dump)
+    dump.set_defaults(run=run_dump)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.run(args)
+    except KeyboardInterrupt:
+        return 130
+    except Exception as e:
+        print(f"instagram-timeline {args.command}: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
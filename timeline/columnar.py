@@ -0,0 +1,135 @@
+"""
+Typed columnar (Parquet) output for location timelines.
+
+CSV output forces every consumer to re-parse: main4 writes 'Unknown' into the
+coordinate columns and main5 splits the date into dd/mm/YYYY text. Here rows
+are written with a real schema, in row groups, while the crawl is running:
+
+    mediaid        int64
+    shortcode      string
+    username       dictionary<string>
+    taken_at       timestamp[us, UTC]
+    location_name  dictionary<string>    (null when unknown)
+    latitude       float64               (null when unknown)
+    longitude      float64               (null when unknown)
+    typename       dictionary<string>
+    hashtags       list<string>
+
+Requires pyarrow, which is only imported when this module is used.
+"""
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from timeline.instagram import shortcode_to_mediaid
+
+SCHEMA = pa.schema([
+    ("mediaid", pa.int64()),
+    ("shortcode", pa.string()),
+    ("username", pa.dictionary(pa.int32(), pa.string())),
+    ("taken_at", pa.timestamp("us", tz="UTC")),
+    ("location_name", pa.dictionary(pa.int32(), pa.string())),
+    ("latitude", pa.float64()),
+    ("longitude", pa.float64()),
+    ("typename", pa.dictionary(pa.int32(), pa.string())),
+    ("hashtags", pa.list_(pa.string())),
+])
+
+ROW_GROUP_SIZE = 10_000
+
+# Placeholders the scripts write for missing values
+_MISSING = {None, "", "Unknown", "N/A"}
+
+def _text(value):
+    return None if value in _MISSING else str(value)
+
+
+def _float(value):
+    if value in _MISSING:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class TimelineParquetWriter:
+    """
+    Appends timeline rows to a Parquet file, one row group per row_group_size rows.
+
+    Rows are dictionaries using the column names of SCHEMA; missing keys are
+    written as nulls and a missing mediaid is derived from the shortcode.
+    """
+
+    def __init__(self, path, row_group_size=ROW_GROUP_SIZE):
+        self.path = path
+        self.row_group_size = row_group_size
+        self.rows_written = 0
+        self._writer = pq.ParquetWriter(path, SCHEMA, compression="zstd")
+        self._buffer = {name: [] for name in SCHEMA.names}
+
+    def write(self, row):
+        shortcode = row.get("shortcode")
+        mediaid = row.get("mediaid")
+        if mediaid is None and shortcode:
+            mediaid = shortcode_to_mediaid(shortcode)
+        buffer = self._buffer
+        buffer["mediaid"].append(int(mediaid) if mediaid is not None else None)
+        buffer["shortcode"].append(shortcode)
+        buffer["username"].append(_text(row.get("username")))
+        buffer["taken_at"].append(row.get("taken_at"))
+        buffer["location_name"].append(_text(row.get("location_name")))
+        buffer["latitude"].append(_float(row.get("latitude")))
+        buffer["longitude"].append(_float(row.get("longitude")))
+        buffer["typename"].append(_text(row.get("typename")))
+        buffer["hashtags"].append(list(row.get("hashtags") or []))
+        if len(buffer["mediaid"]) >= self.row_group_size:
+            self.flush()
+
+    def write_many(self, rows):
+        for row in rows:
+            self.write(row)
+
+    def flush(self):
+        """
+        Writes the buffered rows as one row group.
+        """
+        count = len(self._buffer["mediaid"])
+        if not count:
+            return
+        arrays = []
+        for field in SCHEMA:
+            values = self._buffer[field.name]
+            if pa.types.is_dictionary(field.type):
+                arrays.append(pa.array(values, pa.string()).dictionary_encode())
+            else:
+                arrays.append(pa.array(values, field.type))
+        self._writer.write_table(pa.Table.from_arrays(arrays, schema=SCHEMA))
+        self.rows_written += count
+        self._buffer = {name: [] for name in SCHEMA.names}
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_timeline(path, columns=None, since=None, until=None):
+    """
+    Reads a timeline Parquet file back as a pyarrow Table.
+
+    Only the requested columns are read, and since/until (datetimes) are
+    pushed down as filters on taken_at, so row groups outside the date range
+    are skipped using their statistics.
+    """
+    filters = []
+    if since is not None:
+        filters.append(("taken_at", ">=", pa.scalar(since, pa.timestamp("us", tz="UTC"))))
+    if until is not None:
+        filters.append(("taken_at", "<=", pa.scalar(until, pa.timestamp("us", tz="UTC"))))
+    return pq.read_table(path, columns=columns, filters=filters or None)
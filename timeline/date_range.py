@@ -0,0 +1,105 @@
+"""
+Date-range filtering of newest-first post streams.
+
+Profiles list their posts newest first, so a crawl limited to a date range
+can skip posts newer than ``until`` without looking at them further and stop
+fetching at the first post older than ``since``. The exception are pinned
+posts, which come first regardless of their age: they are checked against
+the range but never end the crawl. Posts that do not say whether they are
+pinned are treated as possibly pinned for the first POSSIBLY_PINNED posts,
+the most Instagram allows.
+"""
+
+import re
+from datetime import datetime, timedelta, timezone
+
+POSSIBLY_PINNED = 3
+
+_RELATIVE = re.compile(r"^(\d+)\s*([dhw])$")
+
+
+def parse_date(value, now=None, end_of_day=False):
+    """
+    Parses a date limit into a naive UTC datetime (the convention of
+    instaloader's Post.date_utc).
+
+    Accepts datetimes, Unix timestamps, ISO dates or datetimes ("2024-05-01",
+    "2024-05-01T12:00:00+02:00") and relative ages ("30d", "12h", "2w").
+    Empty values give None. With end_of_day, a bare date means the last
+    moment of that day, so it can serve as an inclusive ``until``.
+    """
+    if isinstance(value, str):
+        value = value.strip()
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        parsed = value
+    elif isinstance(value, (int, float)):
+        parsed = datetime.fromtimestamp(value, tz=timezone.utc)
+    else:
+        relative = _RELATIVE.match(value.lower())
+        if relative:
+            amount, unit = int(relative[1]), relative[2]
+            delta = {"d": timedelta(days=amount), "h": timedelta(hours=amount), "w": timedelta(weeks=amount)}[unit]
+            parsed = (now or datetime.now(timezone.utc)) - delta
+        else:
+            parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+            if end_of_day and len(value) == 10:
+                parsed += timedelta(days=1, microseconds=-1)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def in_date_range(posts, since=None, until=None, date_of=lambda post: post.date_utc,
+                  is_pinned=lambda post: getattr(post, "is_pinned", None)):
+    """
+    Yields the posts dated between since and until (inclusive, naive UTC)
+    from a newest-first iterator, and stops consuming it at the first
+    non-pinned post older than since.
+
+    Args:
+        posts: Newest-first iterable, e.g. Profile.get_posts().
+        since (datetime): Oldest date to keep, or None.
+        until (datetime): Newest date to keep, or None.
+        date_of (callable): Returns a post's naive UTC date.
+        is_pinned (callable): Returns True/False, or None if unknown.
+    """
+    for index, post in enumerate(posts):
+        date = date_of(post)
+        pinned = is_pinned(post)
+        if pinned is None:
+            pinned = index < POSSIBLY_PINNED
+        if since is not None and date < since:
+            if pinned:
+                continue
+            return
+        if until is not None and date > until:
+            continue
+        yield post
+
+
+def utc_datetime64(values):
+    """
+    Converts dates (datetime64, datetimes, or ISO strings with or without a
+    UTC offset) to a datetime64[s] array of UTC times; missing dates become
+    NaT.
+
+    Strings without an offset are parsed by numpy in one pass; only those
+    with one, and Python objects, go through parse_date.
+    """
+    import numpy as np
+
+    values = np.asarray(values)
+    if values.dtype.kind == "M":
+        return values.astype("datetime64[s]")
+    if values.dtype.kind != "U":
+        return np.array([parse_date(value) for value in values.ravel()], dtype="datetime64[s]")
+    # "+hh:mm", "-hh:mm" (a dash after the date) or "Z"
+    offset = ((np.char.find(values, "+") >= 0) | (np.char.rfind(values, "-") > 10)
+              | np.char.endswith(values, "Z"))
+    naive = np.where(offset, "", values)
+    result = naive.astype("datetime64[s]")
+    for index in np.flatnonzero(offset):
+        result[index] = parse_date(str(values[index]))
+    return result
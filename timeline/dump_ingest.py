@@ -0,0 +1,214 @@
+"""
+Offline ingestion of instaloader dump directories.
+
+instaloader's download_profile (see main5) leaves one ``<date>_UTC.json.xz``
+metadata file per post next to the media. This module walks such a directory,
+decompresses and parses the node files across a process pool and streams out
+timeline rows without touching Instagram.
+
+Usage:
+  python -m timeline.dump_ingest DUMP_DIR [DUMP_DIR ...] [-o rows.csv] [--parquet rows.parquet] [-j WORKERS]
+"""
+
+import argparse
+import csv
+import json
+import lzma
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from itertools import islice
+
+ROW_FIELDS = [
+    "username", "shortcode", "mediaid", "taken_at", "location_name",
+    "latitude", "longitude", "typename", "media_count",
+]
+
+# Number of files handed to a worker in one task. Decoding a single node file
+# takes well under a millisecond, so batching keeps the IPC overhead small.
+BATCH_SIZE = 64
+
+
+def iter_dump_files(dump_dir):
+    """
+    Yields the post metadata files (``*_UTC.json.xz``) of a dump directory in
+    chronological order (their names start with the UTC date). Sorting needs
+    the directory's matching names in memory, but subdirectories are not
+    walked and nothing else is collected.
+
+    The profile file (``<username>_<id>.json.xz``) is skipped here; it does not
+    end in ``_UTC.json.xz``.
+    """
+    with os.scandir(dump_dir) as entries:
+        names = sorted(entry.name for entry in entries
+                       if entry.is_file() and entry.name.endswith("_UTC.json.xz"))
+    for name in names:
+        yield os.path.join(dump_dir, name)
+
+
+def _location_fields(node):
+    """
+    Returns (name, latitude, longitude) from a post node. Newer instaloader
+    dumps keep the location inside ``iphone_struct`` only.
+    """
+    location = node.get("location") or (node.get("iphone_struct") or {}).get("location")
+    if not location:
+        return None, None, None
+    return location.get("name"), location.get("lat"), location.get("lng")
+
+
+def node_caption(node):
+    """
+    Returns the caption text of a post node, or None. Older dumps keep it in
+    ``edge_media_to_caption`` only.
+    """
+    caption = node.get("caption")
+    if caption is None:
+        edges = (node.get("edge_media_to_caption") or {}).get("edges") or []
+        caption = edges[0]["node"]["text"] if edges else None
+    return caption
+
+
+def node_to_row(node):
+    """
+    Converts a decoded post node into a timeline row dictionary.
+    """
+    timestamp = node.get("date") or node.get("taken_at_timestamp")
+    location_name, latitude, longitude = _location_fields(node)
+    children = (node.get("edge_sidecar_to_children") or {}).get("edges")
+    owner = node.get("owner") or {}
+    return {
+        "username": owner.get("username"),
+        "shortcode": node.get("shortcode"),
+        "mediaid": int(node["id"]),
+        "taken_at": datetime.fromtimestamp(timestamp, tz=timezone.utc) if timestamp else None,
+        "location_name": location_name,
+        "latitude": latitude,
+        "longitude": longitude,
+        "typename": node.get("__typename"),
+        "media_count": len(children) if children else 1,
+    }
+
+
+def parse_dump_file(path):
+    """
+    Decompresses and parses a single ``.json.xz`` node file. Returns the row
+    dictionary, or None for files that are not post nodes or cannot be read.
+    """
+    try:
+        with lzma.open(path, "rb") as file:
+            data = json.load(file)
+        if data.get("instaloader", {}).get("node_type", "Post") != "Post":
+            return None
+        return node_to_row(data["node"])
+    except (OSError, lzma.LZMAError, ValueError, KeyError) as e:
+        print(f"Error reading {path}: {e}", file=sys.stderr)
+        return None
+
+
+def _parse_batch(paths):
+    """
+    Worker entry point: parses a batch of files and drops unreadable ones.
+    """
+    rows = []
+    for path in paths:
+        row = parse_dump_file(path)
+        if row is not None:
+            rows.append(row)
+    return rows
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def ingest_dump(dump_dirs, workers=None, batch_size=BATCH_SIZE):
+    """
+    Streams timeline rows for one or more dump directories.
+
+    Files are parsed in batches on a process pool. At most ``2 * workers``
+    batches are in flight at any time, so memory stays flat no matter how
+    large the dump is. Rows come out in the same order as the files.
+
+    Args:
+        dump_dirs (str or list): A dump directory or a list of them.
+        workers (int): Number of worker processes (default: CPU count).
+            With ``workers=1`` everything runs in the calling process.
+        batch_size (int): Number of files per worker task.
+
+    Yields:
+        dict: One row per post, with the keys listed in ROW_FIELDS.
+    """
+    if isinstance(dump_dirs, (str, os.PathLike)):
+        dump_dirs = [dump_dirs]
+    paths = (path for dump_dir in dump_dirs for path in iter_dump_files(dump_dir))
+    return ingest_files(paths, workers, batch_size)
+
+
+def ingest_files(paths, workers=None, batch_size=BATCH_SIZE):
+    """
+    Streams the timeline rows of the given node files, like ingest_dump.
+    """
+    batches = _batches(paths, batch_size)
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for batch in batches:
+            yield from _parse_batch(batch)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for batch in batches:
+            pending.append(pool.submit(_parse_batch, batch))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def write_rows_csv(rows, file):
+    """
+    Writes rows to an open text file as CSV and returns the number of rows.
+    """
+    writer = csv.DictWriter(file, fieldnames=ROW_FIELDS)
+    writer.writeheader()
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build timeline rows from instaloader dump directories.")
+    parser.add_argument("dump_dirs", nargs="+", help="Directories written by instaloader download_profile")
+    parser.add_argument("-o", "--output", help="CSV file to write (default: stdout)")
+    parser.add_argument("--parquet", help="Write a typed Parquet file instead of CSV")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    rows = ingest_dump(args.dump_dirs, workers=args.workers)
+    if args.parquet:
+        from timeline.columnar import TimelineParquetWriter
+
+        with TimelineParquetWriter(args.parquet) as writer:
+            writer.write_many(rows)
+        print(f"{writer.rows_written} posts saved to {args.parquet}.")
+    elif args.output:
+        with open(args.output, mode="w", newline="", encoding="utf-8") as file:
+            count = write_rows_csv(rows, file)
+        print(f"{count} posts saved to {args.output}.")
+    else:
+        write_rows_csv(rows, sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
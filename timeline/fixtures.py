@@ -0,0 +1,363 @@
+"""
+Recorded-fixture backend standing in for Instagram.
+
+Posts are seeded from a real instaloader dump (by default the sharmashresth
+dump in main5_shubhang/) and scaled synthetically to any size: the seeds'
+captions, hashtags, types and sidecar sizes are cycled, while shortcodes,
+media ids and timestamps are generated so they stay unique and newest-first.
+Everything is derived from the post index, so even millions of posts are
+generated lazily and reproducibly.
+
+On top of the posts this module provides:
+
+- FakeProfile / FakePost: the parts of instaloader.Profile.get_posts() and
+  instaloader.Post the scripts use,
+- FixtureServer: a local HTTP server for the Graph API ``/{user_id}/media``
+  endpoint (with paging.next cursors) and the ``/p/{shortcode}/?__a=1``
+  endpoint, to point main2 and LocationResolver at via base_url,
+- FakeSource: a post source for timeline.watch.Watcher whose profiles get
+  new posts on demand,
+- FakeBackend: a crawl backend for timeline.batch.BatchScheduler with
+  synthetic profiles of given sizes.
+"""
+
+import hashlib
+import json
+import lzma
+import os
+import random
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+from timeline.batch import ACCOUNT_CONCURRENCY
+from timeline.dump_ingest import iter_dump_files
+from timeline.instagram import caption_hashtags, mediaid_to_shortcode, shortcode_to_mediaid
+
+SEED_DUMP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             "main5_shubhang", "sharmashresth")
+
+# Same fields as instaloader.PostLocation
+PostLocation = namedtuple("PostLocation", ["id", "name", "slug", "has_public_page", "lat", "lng"])
+
+PLACES = [
+    PostLocation(213131048, "Mussoorie", "mussoorie", True, 30.4598, 78.0644),
+    PostLocation(215430521, "Dehradun", "dehradun", True, 30.3165, 78.0322),
+    PostLocation(243817292, "Triund", "triund", True, 32.2599, 76.3598),
+    PostLocation(212988663, "Rishikesh", "rishikesh", True, 30.0869, 78.2676),
+    PostLocation(212999109, "New Delhi, India", "new-delhi-india", True, 28.6139, 77.2090),
+    PostLocation(108424279189115, "Manali", "manali", True, 32.2432, 77.1892),
+    PostLocation(237512486, "Shimla", "shimla", True, 31.1048, 77.1734),
+    PostLocation(1025637016, "Kimadi", "kimadi", True, 30.4245, 77.9921),
+]
+
+LOCATION_RATIO = 0.3
+FIXTURE_LAST_MODIFIED = "Wed, 23 Aug 2023 12:18:50 GMT"
+NEWEST_TIMESTAMP = 1692793130  # newest post of the seed dump
+MEAN_GAP_SECONDS = 36 * 3600
+OLDEST_TIMESTAMP = 1314220022  # media ids start at Instagram's epoch
+
+_INSTAGRAM_EPOCH_MS = 1314220021721
+
+
+def load_seeds(dump_dir=SEED_DUMP_DIR):
+    """
+    Reads the post nodes of a dump directory into small seed dictionaries.
+    """
+    seeds = []
+    for path in iter_dump_files(dump_dir):
+        with lzma.open(path, "rb") as file:
+            node = json.load(file)["node"]
+        children = (node.get("edge_sidecar_to_children") or {}).get("edges")
+        seeds.append({
+            "caption": node.get("caption"),
+            "typename": node.get("__typename"),
+            "media_count": len(children) if children else 1,
+            "owner": (node.get("owner") or {}).get("username"),
+        })
+    return seeds
+
+
+def location_for(mediaid, ratio=LOCATION_RATIO):
+    """
+    The location of a synthetic post: a fixed function of its media id, so
+    the fake endpoints and FakePost always agree.
+    """
+    rng = random.Random(mediaid)
+    return rng.choice(PLACES) if rng.random() < ratio else None
+
+
+class FakePost:
+    """
+    The instaloader.Post attributes used by the scripts.
+    """
+
+    def __init__(self, index, seed, timestamp, username, inline_location=True, location_ratio=LOCATION_RATIO):
+        self.index = index
+        self.mediaid = ((timestamp * 1000 - _INSTAGRAM_EPOCH_MS) << 23) | (index % 8192)
+        self.shortcode = mediaid_to_shortcode(self.mediaid)
+        self.date_utc = datetime.fromtimestamp(timestamp, tz=timezone.utc).replace(tzinfo=None)
+        self.caption = seed["caption"]
+        self.typename = seed["typename"]
+        self.media_count = seed["media_count"]
+        self.owner_username = username
+        self.is_pinned = False
+        self.url = f"https://scontent.example/{self.shortcode}.jpg"
+        self._inline_location = inline_location
+        self._location_ratio = location_ratio
+
+    @property
+    def location(self):
+        if not self._inline_location:
+            return None
+        return location_for(self.mediaid, self._location_ratio)
+
+    @property
+    def caption_hashtags(self):
+        return caption_hashtags(self.caption)
+
+    @property
+    def date(self):
+        return self.date_utc
+
+
+class FakeProfile:
+    """
+    A profile with count synthetic posts, newest first.
+
+    Args:
+        username (str): Profile name.
+        count (int): Number of posts.
+        seeds (list): Seed posts from load_seeds(); loaded if None.
+        inline_location (bool): Whether post.location is filled; with False
+            every post needs the ``?__a=1`` fallback, like most real posts.
+        seed (int): Random seed for the timestamps.
+    """
+
+    def __init__(self, username, count, seeds=None, inline_location=True,
+                 location_ratio=LOCATION_RATIO, seed=0):
+        self.username = username
+        self.count = count
+        self.seeds = seeds if seeds is not None else load_seeds()
+        self.inline_location = inline_location
+        self.location_ratio = location_ratio
+        self.seed = seed
+
+    def get_posts(self):
+        rng = random.Random(self.seed)
+        timestamp = NEWEST_TIMESTAMP
+        # Large profiles post more often, so every post stays after OLDEST_TIMESTAMP
+        mean_gap = min(MEAN_GAP_SECONDS, (NEWEST_TIMESTAMP - OLDEST_TIMESTAMP) / max(self.count, 1) / 2)
+        for index in range(self.count):
+            yield FakePost(index, self.seeds[index % len(self.seeds)], timestamp, self.username,
+                           self.inline_location, self.location_ratio)
+            timestamp -= 1 + int(rng.expovariate(1 / mean_gap))
+
+    def graph_media(self):
+        """
+        The posts as Graph API media objects.
+        """
+        for post in self.get_posts():
+            location = location_for(post.mediaid, self.location_ratio)
+            yield {
+                "id": str(post.mediaid),
+                "caption": post.caption,
+                "timestamp": post.date_utc.strftime("%Y-%m-%dT%H:%M:%S+0000"),
+                "location": {"id": str(location.id), "name": location.name} if location else None,
+            }
+
+
+class FakeSource:
+    """
+    In-process stand-in for timeline.watch's InstaloaderSource: publish()
+    adds posts to a profile and every profile read and further page of 12
+    posts takes a token from the limiter (a watch.RateLimiter), so tests
+    can count requests.
+    """
+
+    PAGE_SIZE = 12
+
+    class Post:
+        def __init__(self, mediaid, timestamp, is_pinned=False):
+            self.mediaid = mediaid
+            self.shortcode = f"P{mediaid}"
+            self.date_utc = datetime.fromtimestamp(timestamp, tz=timezone.utc).replace(tzinfo=None)
+            self.is_pinned = is_pinned
+            self.location = None
+
+    def __init__(self, limiter):
+        self.limiter = limiter
+        self.posts = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def publish(self, username, timestamps, pinned=False):
+        with self._lock:
+            for timestamp in sorted(timestamps):
+                self.posts.setdefault(username, []).insert(0, self.Post(self._next_id, timestamp, pinned))
+                self._next_id += 1
+
+    def recent_posts(self, username):
+        self.limiter.acquire()
+        if username not in self.posts:
+            raise LookupError(f"Profile {username} does not exist")
+        posts = sorted(self.posts[username], key=lambda post: (not post.is_pinned, -post.mediaid))
+        for i, post in enumerate(posts):
+            if i and i % self.PAGE_SIZE == 0:
+                self.limiter.acquire()
+            yield post
+
+
+class FakeBackend:
+    """
+    In-process stand-in for timeline.batch's InstaloaderBackend: profile
+    username has post_counts[username] posts, each taking delay seconds.
+    Unknown usernames raise like a missing profile would. active and
+    max_active count the posts being fetched at once.
+    """
+
+    def __init__(self, post_counts, delay=0.0, name="fake", max_concurrency=ACCOUNT_CONCURRENCY):
+        self.post_counts = post_counts
+        self.delay = delay
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def crawl(self, username):
+        if username not in self.post_counts:
+            raise LookupError(f"Profile {username} does not exist")
+        for i in range(self.post_counts[username]):
+            with self._lock:
+                self.active += 1
+                self.max_active = max(self.max_active, self.active)
+            try:
+                if self.delay:
+                    time.sleep(self.delay)
+            finally:
+                with self._lock:
+                    self.active -= 1
+            yield {"date": None, "url": f"https://www.instagram.com/p/{username}{i}/",
+                   "location_name": None, "latitude": None, "longitude": None}
+
+
+class _FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        if status == 200 and self.headers.get("If-None-Match") == etag:
+            with self.server.lock:
+                self.server.not_modified += 1
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if status == 200:
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", FIXTURE_LAST_MODIFIED)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        parts = [part for part in url.path.split("/") if part]
+        with server.lock:
+            server.requests += 1
+
+        if len(parts) == 2 and parts[0] == "p":
+            location = location_for(shortcode_to_mediaid(parts[1]), server.location_ratio)
+            self._send_json({"graphql": {"shortcode_media": {
+                "shortcode": parts[1],
+                "location": {"id": str(location.id), "name": location.name, "slug": location.slug,
+                             "lat": location.lat, "lng": location.lng} if location else None,
+            }}})
+        elif len(parts) == 2 and parts[1] == "media" and parts[0] in server.profiles:
+            self._send_media_page(server.profiles[parts[0]], parts[0], query)
+        else:
+            self._send_json({"error": {"message": "Unsupported get request."}}, status=400)
+
+    def _send_media_page(self, profile, user_id, query):
+        limit = int(query.get("limit", 25))
+        offset = int(query.get("after", 0))
+        fields = query.get("fields", "id,timestamp").split(",")
+        media = self.server.media(user_id)[offset:offset + limit]
+        page = {"data": [{key: value for key, value in item.items() if key in fields} for item in media]}
+        if offset + limit < profile.count:
+            next_query = {**query, "after": offset + limit}
+            page["paging"] = {"cursors": {"after": str(offset + limit)},
+                              "next": f"{self.server.base_url}/{user_id}/media?{urlencode(next_query)}"}
+        self._send_json(page)
+
+
+class FixtureServer:
+    """
+    Local HTTP server for the Graph API and ``?__a=1`` endpoints.
+
+        with FixtureServer({"17841400000": FakeProfile("sharmashresth", 10_000)}) as server:
+            get_instagram_location_timeline("17841400000", "token", base_url=server.base_url)
+
+    ``requests`` counts the requests served and ``not_modified`` the 304
+    answers to conditional requests (responses carry an ETag).
+    """
+
+    def __init__(self, profiles=None, location_ratio=LOCATION_RATIO):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), _FixtureHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.profiles = profiles or {}
+        self.httpd.location_ratio = location_ratio
+        self.httpd.requests = 0
+        self.httpd.not_modified = 0
+        self.httpd.lock = threading.Lock()
+        self.httpd.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self._media = {}
+        self.httpd.media = self._media_list
+        self._thread = None
+
+    def _media_list(self, user_id):
+        # Materialized once per profile, so pages can be sliced
+        with self.httpd.lock:
+            if user_id not in self._media:
+                self._media[user_id] = list(self.httpd.profiles[user_id].graph_media())
+            return self._media[user_id]
+
+    @property
+    def base_url(self):
+        return self.httpd.base_url
+
+    @property
+    def requests(self):
+        return self.httpd.requests
+
+    @property
+    def not_modified(self):
+        return self.httpd.not_modified
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,641 @@
+"""
+Persistent spatial index of post coordinates for radius, bounding-box and
+k-nearest queries across tracked accounts.
+
+main4, timeline.batch and timeline.watch leave one timeline CSV per profile
+with per-post latitude/longitude. GeoIndex keeps those points in a directory
+of immutable segments, each a set of numpy arrays sorted by a Z-order (Morton)
+key of the quantized coordinates:
+
+    key         uint64 interleaved 32-bit longitude/latitude cells
+    latitude, longitude  float64
+    taken_at    int64 Unix seconds
+    mediaid     int64 (the post URL is rebuilt from it)
+    user        uint32 into the segment's users.json
+
+A bounding box is covered by at most a few dozen Z-order cells, each a
+contiguous key range found by binary search in every segment; only the points
+in those ranges are read (the arrays are memory mapped) and checked exactly.
+A radius query searches the box around the circle and filters by great-circle
+distance, and a k-nearest query widens its radius until it has k points.
+
+Adding points writes a new segment and never rewrites the existing ones;
+manifest.json lists the segments (oldest first) and what has been read of
+every source: for a timeline file, the read offset, its size, mtime and
+digests of its header and of the last bytes read; for a dump directory, a
+digest of its node files' names, sizes and mtimes. Re-adding an unchanged
+source adds nothing. A timeline that has only grown (watch appends to them)
+or a dump with new node files has just the new posts read; one that was
+rewritten (main4 and batch write theirs newest first) is read again in full.
+Once there are more than MAX_SEGMENTS segments, the smallest run of adjacent
+ones is merged, which also drops duplicate posts. Queries skip duplicates
+too, preferring the newest copy.
+
+Usage:
+  python -m timeline.geo_index add TIMELINE.csv|DUMP_DIR [...] [--index geo_index] [--username NAME]
+  python -m timeline.geo_index radius LAT LNG KM [--since 2023-01-01] [--until 2023-12-31] [--accounts]
+  python -m timeline.geo_index bbox SOUTH WEST NORTH EAST [--since ...] [--until ...]
+  python -m timeline.geo_index nearest LAT LNG K [--since ...] [--until ...]
+"""
+
+import argparse
+import csv
+import hashlib
+import io
+import json
+import math
+import os
+import shutil
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+import numpy as np
+
+from timeline.date_range import parse_date
+from timeline.instagram import mediaid_to_shortcode, shortcode_from_url, shortcode_to_mediaid
+from timeline.records import record_type
+
+DEFAULT_DIR = "geo_index"
+FORMAT_VERSION = 1
+MAX_SEGMENTS = 16
+# Segments merged together when there are too many
+MERGE_COUNT = 4
+# Bytes at the start and before the read offset of a timeline file that
+# must be unchanged for add_source to resume there
+_DIGEST_BYTES = 4096
+# Z-order cells per axis covering a query box, at most
+MAX_CELLS_PER_AXIS = 8
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+# First radius tried by nearest()
+NEAREST_START_KM = 1.0
+
+_ARRAYS = ("key", "latitude", "longitude", "taken_at", "mediaid", "user")
+
+# Placeholders the scripts write for missing values
+_MISSING = {None, "", "Unknown", "N/A"}
+
+# One query result
+GeoHit = record_type("GeoHit", ("username", "url", "taken_at", "latitude", "longitude", "distance_km"))
+
+
+def _spread_bits(values):
+    """
+    Spreads the low 32 bits of each value to the even bit positions.
+    """
+    values = values.astype(np.uint64) & np.uint64(0xFFFFFFFF)
+    for shift, mask in ((16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF), (4, 0x0F0F0F0F0F0F0F0F),
+                        (2, 0x3333333333333333), (1, 0x5555555555555555)):
+        values = (values | (values << np.uint64(shift))) & np.uint64(mask)
+    return values
+
+
+def _cells(latitude, longitude):
+    """
+    Quantizes coordinates to 32-bit cells per axis.
+    """
+    x = np.clip((np.asarray(longitude, dtype=np.float64) + 180) / 360 * 2 ** 32, 0, 2 ** 32 - 1)
+    y = np.clip((np.asarray(latitude, dtype=np.float64) + 90) / 180 * 2 ** 32, 0, 2 ** 32 - 1)
+    return x.astype(np.uint64), y.astype(np.uint64)
+
+
+def morton_keys(latitude, longitude):
+    """
+    Returns the Z-order keys of coordinate arrays.
+    """
+    x, y = _cells(latitude, longitude)
+    return _spread_bits(x) | (_spread_bits(y) << np.uint64(1))
+
+
+def _key_ranges(south, west, north, east):
+    """
+    Returns sorted, merged inclusive (low, high) key ranges covering a box
+    that does not cross the antimeridian.
+    """
+    x0, y0 = (int(value) for value in _cells(south, west))
+    x1, y1 = (int(value) for value in _cells(north, east))
+    shift = 0
+    while ((x1 >> shift) - (x0 >> shift) >= MAX_CELLS_PER_AXIS
+           or (y1 >> shift) - (y0 >> shift) >= MAX_CELLS_PER_AXIS):
+        shift += 1
+    cx = np.arange(x0 >> shift, (x1 >> shift) + 1, dtype=np.uint64)
+    cy = np.arange(y0 >> shift, (y1 >> shift) + 1, dtype=np.uint64)
+    prefixes = np.sort((_spread_bits(cx)[None, :] | (_spread_bits(cy)[:, None] << np.uint64(1))).ravel())
+    ranges = []
+    for prefix in prefixes.tolist():
+        low = prefix << (2 * shift)
+        high = ((prefix + 1) << (2 * shift)) - 1
+        if ranges and ranges[-1][1] + 1 == low:
+            ranges[-1][1] = high
+        else:
+            ranges.append([low, high])
+    return ranges
+
+
+def _split_box(south, west, north, east):
+    """
+    Splits a box crossing the antimeridian (west > east) in two.
+    """
+    if west <= east:
+        return [(south, west, north, east)]
+    return [(south, west, north, 180.0), (south, -180.0, north, east)]
+
+
+def _boxes_around(latitude, longitude, km):
+    """
+    Returns the boxes covering all points within km of a point.
+    """
+    delta = km / KM_PER_DEGREE
+    south, north = max(latitude - delta, -90.0), min(latitude + delta, 90.0)
+    if south <= -90 or north >= 90:
+        return [(south, -180.0, north, 180.0)]
+    delta_lng = delta / math.cos(math.radians(max(abs(south), abs(north))))
+    if delta_lng >= 180:
+        return [(south, -180.0, north, 180.0)]
+    west, east = longitude - delta_lng, longitude + delta_lng
+    if west < -180:
+        west += 360
+    if east > 180:
+        east -= 360
+    return _split_box(south, west, north, east)
+
+
+def haversine_km(latitude, longitude, latitudes, longitudes):
+    """
+    Great-circle distances in km from a point to arrays of points.
+    """
+    lat1, lat2 = math.radians(latitude), np.radians(latitudes)
+    dlat = lat2 - lat1
+    dlng = np.radians(longitudes) - math.radians(longitude)
+    a = np.sin(dlat / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _unix(value, end_of_day=False):
+    if value is None:
+        return None
+    return int(parse_date(value, end_of_day=end_of_day).replace(tzinfo=timezone.utc).timestamp())
+
+
+def _coordinate(value):
+    if value in _MISSING:
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(value) else value
+
+
+def _point(username, shortcode, taken_at, latitude, longitude):
+    """
+    Returns an index point, or None for posts without coordinates.
+    """
+    latitude, longitude = _coordinate(latitude), _coordinate(longitude)
+    if latitude is None or longitude is None or not shortcode or taken_at is None:
+        return None
+    if isinstance(taken_at, str):
+        taken_at = datetime.fromisoformat(taken_at)
+    if taken_at.tzinfo is None:
+        taken_at = taken_at.replace(tzinfo=timezone.utc)
+    return username, shortcode_to_mediaid(shortcode), int(taken_at.timestamp()), latitude, longitude
+
+
+def read_timeline(path, username=None, offset=0):
+    """
+    Reads the points of a timeline CSV (main4's columns: date, url,
+    location_name, latitude, longitude) from byte offset on. A last line
+    still being written is left for the next call.
+
+    Returns:
+        tuple: (points, end offset). Rows without coordinates are skipped.
+    """
+    username = username or os.path.splitext(os.path.basename(path))[0]
+    with open(path, "rb") as file:
+        header = file.readline()
+        if not header.endswith(b"\n"):
+            return [], 0
+        file.seek(max(offset, len(header)))
+        data = file.read()
+    complete = data[:data.rfind(b"\n") + 1]
+    fieldnames = next(csv.reader([header.decode("utf-8")]))
+    points = []
+    for row in csv.DictReader(io.StringIO(complete.decode("utf-8"), newline=""), fieldnames=fieldnames):
+        try:
+            point = _point(username, shortcode_from_url(row.get("url")), row.get("date") or None,
+                           row.get("latitude"), row.get("longitude"))
+        except ValueError:
+            continue
+        if point is not None:
+            points.append(point)
+    return points, max(offset, len(header)) + len(complete)
+
+
+def read_dump(dump_dir, paths=None):
+    """
+    Reads the points of an instaloader dump directory, or of only its node
+    files in paths.
+    """
+    from timeline.dump_ingest import ingest_dump, ingest_files
+
+    fallback_username = os.path.basename(os.path.normpath(dump_dir))
+    points = []
+    for row in ingest_dump(dump_dir) if paths is None else ingest_files(paths):
+        point = _point(row["username"] or fallback_username, row["shortcode"], row["taken_at"],
+                       row["latitude"], row["longitude"])
+        if point is not None:
+            points.append(point)
+    return points
+
+
+class _Segment:
+    """
+    One immutable, memory-mapped segment.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        for name in _ARRAYS:
+            setattr(self, name, np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r"))
+        self._users = None
+
+    def __len__(self):
+        return len(self.key)
+
+    @property
+    def users(self):
+        if self._users is None:
+            with open(os.path.join(self.directory, "users.json"), encoding="utf-8") as file:
+                self._users = json.load(file)
+        return self._users
+
+    def positions(self, ranges):
+        """
+        Returns the positions of the points whose key is in any of the
+        inclusive (low, high) ranges.
+        """
+        if not len(self.key) or not ranges:
+            return np.empty(0, dtype=np.int64)
+        bounds = np.array(ranges, dtype=np.uint64)
+        starts = np.searchsorted(self.key, bounds[:, 0], "left")
+        ends = np.searchsorted(self.key, bounds[:, 1], "right")
+        return np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)])
+
+
+def _source_state(path, offset, stat):
+    """
+    Returns what add_source remembers about a timeline file read up to
+    offset: its size and mtime (from stat, taken before it was read), and
+    digests of the start of the file (header and first rows, which change
+    when a newest-first file is rewritten) and of the bytes just before
+    offset.
+    """
+    with open(path, "rb") as file:
+        head = file.read(min(offset, _DIGEST_BYTES))
+        file.seek(max(offset - _DIGEST_BYTES, 0))
+        tail = file.read(offset - max(offset - _DIGEST_BYTES, 0))
+    return {"offset": offset, "size": stat.st_size, "mtime": stat.st_mtime,
+            "head": hashlib.sha1(head).hexdigest(), "tail": hashlib.sha1(tail).hexdigest()}
+
+
+def _dump_state(paths):
+    """
+    Returns what add_source remembers about the node files of a dump
+    directory: how many there are, the newest name and a digest of every
+    name, size and mtime.
+    """
+    digest = hashlib.sha1()
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f"{os.path.basename(path)}\0{stat.st_size}\0{stat.st_mtime}\n".encode("utf-8"))
+    return {"files": len(paths), "newest": os.path.basename(paths[-1]) if paths else None,
+            "digest": digest.hexdigest()}
+
+
+def _write_segment(directory, arrays, users):
+    tmp_dir = f"{directory}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for name in _ARRAYS:
+        np.save(os.path.join(tmp_dir, f"{name}.npy"), arrays[name])
+    with open(os.path.join(tmp_dir, "users.json"), "w", encoding="utf-8") as file:
+        json.dump(users, file)
+    os.rename(tmp_dir, directory)
+
+
+class GeoIndex:
+    """
+    A segmented spatial index directory, created if missing.
+
+    Queries take optional since/until (datetimes or strings, see
+    timeline.date_range.parse_date; until is inclusive) and return GeoHit
+    records.
+    """
+
+    def __init__(self, directory=DEFAULT_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._manifest_path = os.path.join(directory, "manifest.json")
+        try:
+            with open(self._manifest_path, encoding="utf-8") as file:
+                self.manifest = json.load(file)
+        except FileNotFoundError:
+            self.manifest = {"version": FORMAT_VERSION, "next_segment": 1, "segments": [], "sources": {}}
+        if self.manifest.get("version") != FORMAT_VERSION:
+            raise ValueError(f"{directory} has index format {self.manifest.get('version')}, "
+                             f"expected {FORMAT_VERSION}")
+        # Newest first, so duplicates resolve to the newest copy
+        self.segments = [_Segment(os.path.join(directory, entry["name"]))
+                         for entry in reversed(self.manifest["segments"])]
+
+    def __len__(self):
+        return sum(entry["points"] for entry in self.manifest["segments"])
+
+    def _save_manifest(self):
+        tmp_path = f"{self._manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(self.manifest, file, indent=2)
+        os.replace(tmp_path, self._manifest_path)
+
+    def _new_segment(self, arrays, users):
+        # A process that died before saving the manifest can leave a
+        # segment directory behind, so names on disk are skipped
+        while True:
+            name = f"seg-{self.manifest['next_segment']:06d}"
+            self.manifest["next_segment"] += 1
+            if not os.path.exists(os.path.join(self.directory, name)):
+                break
+        _write_segment(os.path.join(self.directory, name), arrays, users)
+        return name
+
+    def add(self, points, source=None, state=None):
+        """
+        Adds points, (username, mediaid, taken_at, latitude, longitude)
+        tuples, as a new segment. state is recorded as what has been read
+        of the source file or directory. Returns the number of points added.
+        """
+        if points:
+            users = {}
+            usernames, mediaids, taken_at, latitudes, longitudes = zip(*points)
+            columns = {
+                "latitude": np.array(latitudes, dtype=np.float64),
+                "longitude": np.array(longitudes, dtype=np.float64),
+                "taken_at": np.array(taken_at, dtype=np.int64),
+                "mediaid": np.array(mediaids, dtype=np.int64),
+                "user": np.array([users.setdefault(name, len(users)) for name in usernames], dtype=np.uint32),
+            }
+            columns["key"] = morton_keys(columns["latitude"], columns["longitude"])
+            order = np.argsort(columns["key"], kind="stable")
+            name = self._new_segment({name: values[order] for name, values in columns.items()}, list(users))
+            self.manifest["segments"].append({"name": name, "points": len(points)})
+            self.segments.insert(0, _Segment(os.path.join(self.directory, name)))
+        if source is not None:
+            self.manifest["sources"][os.path.abspath(source)] = dict(state, added_at=time.time())
+        self._save_manifest()
+        if len(self.manifest["segments"]) > MAX_SEGMENTS:
+            self.compact()
+        return len(points)
+
+    def add_source(self, path, username=None):
+        """
+        Adds a timeline CSV or a dump directory. A CSV added before is read
+        from where the last call stopped if it has only been appended to
+        since, and in full if it was rewritten; a dump directory added
+        before has only its new node files read, unless older ones changed.
+        Unchanged sources add nothing, and posts read again are dropped as
+        duplicates. Returns the number of points added.
+        """
+        source = self.manifest["sources"].get(os.path.abspath(path)) or {}
+        if os.path.isdir(path):
+            return self._add_dump(path, source)
+        offset = source.get("offset") or 0
+        stat = os.stat(path)
+        if offset:
+            if (stat.st_size, stat.st_mtime) == (source.get("size"), source.get("mtime")):
+                return 0
+            current = _source_state(path, offset, stat) if stat.st_size >= offset else {}
+            if (current.get("head"), current.get("tail")) != (source.get("head"), source.get("tail")):
+                # Rewritten rather than appended to
+                offset = 0
+        points, end = read_timeline(path, username, offset)
+        return self.add(points, source=path, state=_source_state(path, end, stat))
+
+    def _add_dump(self, path, source):
+        from timeline.dump_ingest import iter_dump_files
+
+        paths = list(iter_dump_files(path))
+        state = _dump_state(paths)
+        if state == {name: source.get(name) for name in state}:
+            return 0
+        new_paths = None
+        if source.get("newest") is not None:
+            # Node file names start with the post date, so the files of the
+            # last add are a prefix unless some were changed or removed
+            known = [name for name in paths if os.path.basename(name) <= source["newest"]]
+            if _dump_state(known) == {name: source.get(name) for name in state}:
+                new_paths = paths[len(known):]
+        return self.add(read_dump(path, new_paths), source=path, state=state)
+
+    def compact(self, count=None):
+        """
+        Merges the run of count adjacent segments with the fewest points
+        (all of them if count is 0; default MERGE_COUNT, or enough to get
+        back to MAX_SEGMENTS) into one, dropping duplicate posts, and removes
+        segment directories the manifest does not list. Only adjacent
+        segments are merged, so the merged one keeps their place in the
+        newest-first order and never shadows a newer copy of a post.
+        """
+        entries = self.manifest["segments"]
+        if count is None:
+            count = max(MERGE_COUNT, len(entries) - MAX_SEGMENTS + 1)
+        if count == 0 or count > len(entries):
+            count = len(entries)
+        if count < 2:
+            return
+        sizes = [entry["points"] for entry in entries]
+        start = min(range(len(entries) - count + 1), key=lambda i: sum(sizes[i:i + count]))
+        # Newest first, so the newest copy of a post wins
+        chosen = range(start + count - 1, start - 1, -1)
+        users = {}
+        parts = {name: [] for name in _ARRAYS}
+        for i in chosen:
+            segment = _Segment(os.path.join(self.directory, entries[i]["name"]))
+            remap = np.array([users.setdefault(name, len(users)) for name in segment.users], dtype=np.uint32)
+            for name in _ARRAYS:
+                values = np.asarray(getattr(segment, name))
+                parts[name].append(remap[values] if name == "user" and len(values) else values)
+        merged = {name: np.concatenate(values) for name, values in parts.items()}
+        _, first = np.unique(merged["mediaid"], return_index=True)
+        keep = np.sort(first)
+        order = keep[np.argsort(merged["key"][keep], kind="stable")]
+        arrays = {name: values[order] for name, values in merged.items()}
+        arrays["user"] = arrays["user"].astype(np.uint32)
+
+        name = self._new_segment(arrays, list(users))
+        kept = entries[:start] + [{"name": name, "points": len(order)}] + entries[start + count:]
+        self.manifest["segments"] = kept
+        self._save_manifest()
+        self.segments = [_Segment(os.path.join(self.directory, entry["name"])) for entry in reversed(kept)]
+        # The merged segments, and any left behind by a process that died
+        # before saving the manifest
+        listed = {entry["name"] for entry in kept}
+        for old_name in os.listdir(self.directory):
+            if old_name.startswith("seg-") and old_name not in listed:
+                shutil.rmtree(os.path.join(self.directory, old_name), ignore_errors=True)
+
+    def _matches(self, boxes, since=None, until=None):
+        """
+        Returns (segment, position, latitude, longitude, taken_at) arrays of
+        the points inside any of boxes and the date range, one per post.
+        """
+        low, high = _unix(since), _unix(until, end_of_day=True)
+        found = {name: [] for name in ("segment", "position", "latitude", "longitude", "taken_at", "mediaid")}
+        for number, segment in enumerate(self.segments):
+            for south, west, north, east in boxes:
+                positions = segment.positions(_key_ranges(south, west, north, east))
+                if not len(positions):
+                    continue
+                latitude, longitude = segment.latitude[positions], segment.longitude[positions]
+                taken_at = segment.taken_at[positions]
+                mask = (latitude >= south) & (latitude <= north) & (longitude >= west) & (longitude <= east)
+                if low is not None:
+                    mask &= taken_at >= low
+                if high is not None:
+                    mask &= taken_at <= high
+                positions = positions[mask]
+                found["segment"].append(np.full(len(positions), number))
+                found["position"].append(positions)
+                found["latitude"].append(latitude[mask])
+                found["longitude"].append(longitude[mask])
+                found["taken_at"].append(taken_at[mask])
+                found["mediaid"].append(segment.mediaid[positions])
+        if not found["segment"]:
+            return {name: np.empty(0) for name in found}
+        found = {name: np.concatenate(values) for name, values in found.items()}
+        # Segments are newest first, so the first copy of a post is the newest
+        _, first = np.unique(found["mediaid"], return_index=True)
+        if len(first) < len(found["mediaid"]):
+            first.sort()
+            found = {name: values[first] for name, values in found.items()}
+        return found
+
+    def _hits(self, found, order, distances=None):
+        hits = []
+        for i in order:
+            segment = self.segments[int(found["segment"][i])]
+            position = int(found["position"][i])
+            shortcode = mediaid_to_shortcode(int(segment.mediaid[position]))
+            hits.append(GeoHit(
+                segment.users[int(segment.user[position])],
+                f"https://www.instagram.com/p/{shortcode}/",
+                datetime.fromtimestamp(int(found["taken_at"][i]), tz=timezone.utc).replace(tzinfo=None),
+                float(found["latitude"][i]),
+                float(found["longitude"][i]),
+                None if distances is None else round(float(distances[i]), 3),
+            ))
+        return hits
+
+    def bbox(self, south, west, north, east, since=None, until=None, limit=None):
+        """
+        Returns the posts inside a box (west > east crosses the
+        antimeridian), newest first.
+        """
+        found = self._matches(_split_box(south, west, north, east), since, until)
+        order = np.argsort(-found["taken_at"], kind="stable")[:limit]
+        return self._hits(found, order)
+
+    def radius(self, latitude, longitude, km, since=None, until=None, limit=None):
+        """
+        Returns the posts within km of a point, nearest first.
+        """
+        found = self._matches(_boxes_around(latitude, longitude, km), since, until)
+        distances = haversine_km(latitude, longitude, found["latitude"], found["longitude"])
+        inside = np.flatnonzero(distances <= km)
+        order = inside[np.argsort(distances[inside], kind="stable")][:limit]
+        return self._hits(found, order, distances)
+
+    def nearest(self, latitude, longitude, k, since=None, until=None, max_km=math.pi * EARTH_RADIUS_KM):
+        """
+        Returns the k posts nearest to a point (within max_km), nearest first.
+        """
+        km = NEAREST_START_KM
+        while True:
+            km = min(km, max_km)
+            found = self._matches(_boxes_around(latitude, longitude, km), since, until)
+            distances = haversine_km(latitude, longitude, found["latitude"], found["longitude"])
+            inside = np.flatnonzero(distances <= km)
+            if len(inside) >= k or km >= max_km:
+                order = inside[np.argsort(distances[inside], kind="stable")][:k]
+                return self._hits(found, order, distances)
+            # Grow the search area about fourfold per round
+            km *= 2 if len(inside) else 4
+
+    def close(self):
+        self.segments = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Spatial queries over the posts of tracked accounts.")
+    parser.add_argument("--index", default=DEFAULT_DIR, help="Index directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="Add timeline CSVs (only their new rows) or dump directories")
+    add.add_argument("sources", nargs="+")
+    add.add_argument("--username", help="Account of the timelines (default: the CSV file name)")
+    commands.add_parser("compact", help="Merge all segments into one")
+
+    def add_query(name, help, *positionals):
+        command = commands.add_parser(name, help=help)
+        for positional, kind in positionals:
+            command.add_argument(positional, type=kind)
+        command.add_argument("--since", help="Only posts since this date (YYYY-MM-DD) or age (e.g. 30d)")
+        command.add_argument("--until", help="Only posts until this date (YYYY-MM-DD)")
+        command.add_argument("--accounts", action="store_true", help="Print accounts and post counts instead")
+        return command
+
+    add_query("radius", "Posts within KM of a point", ("latitude", float), ("longitude", float), ("km", float))
+    add_query("bbox", "Posts inside a box", ("south", float), ("west", float), ("north", float), ("east", float))
+    add_query("nearest", "The K posts nearest to a point", ("latitude", float), ("longitude", float), ("k", int))
+    args = parser.parse_args(argv)
+
+    with GeoIndex(args.index) as index:
+        if args.command == "add":
+            for source in args.sources:
+                if args.username is None and not os.path.isdir(source) \
+                        and os.path.basename(source) == "location_timeline.csv":
+                    parser.error(f"{source} does not name its account, pass --username")
+                print(f"{index.add_source(source, args.username)} points added from {source}.")
+            return
+        if args.command == "compact":
+            index.compact(0)
+            print(f"{len(index)} points in {len(index.segments)} segment(s).")
+            return
+
+        start = time.perf_counter()
+        if args.command == "radius":
+            hits = index.radius(args.latitude, args.longitude, args.km, args.since, args.until)
+        elif args.command == "bbox":
+            hits = index.bbox(args.south, args.west, args.north, args.east, args.since, args.until)
+        else:
+            hits = index.nearest(args.latitude, args.longitude, args.k, args.since, args.until)
+        elapsed = time.perf_counter() - start
+
+    writer = csv.writer(sys.stdout)
+    if args.accounts:
+        writer.writerow(["username", "posts"])
+        writer.writerows(Counter(hit["username"] for hit in hits).most_common())
+    else:
+        writer.writerow(GeoHit.KEYS)
+        writer.writerows(hit.values() for hit in hits)
+    print(f"{len(hits)} posts in {elapsed * 1000:.1f} ms.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+"""
+Offline, vectorized reverse geocoding of timeline coordinates.
+
+A gazetteer (a GeoNames ``cities*.txt`` dump, optionally with
+``admin1CodesASCII.txt`` for region names) is loaded once into NumPy arrays
+and indexed with a fixed lat/lng grid stored CSR-style: places sorted by cell,
+plus the offset of each cell. A query looks at the 3 x 3 cells around every
+point; the few points whose match is not provably the nearest are searched
+again with wider windows. All candidates of a chunk of points are gathered
+into flat arrays and the nearest one per point is picked with a single
+reduceat, so there is no per-row Python loop. Chunks are cut by candidate
+count rather than point count, so clustered points or a dense gazetteer do
+not blow up the candidate arrays.
+
+Points whose nearest place is not found within MAX_RADIUS_DEGREES get no
+match.
+
+Usage:
+  python -m timeline.geocode cities15000.txt location_timeline.csv -o geocoded.csv [--admin1 admin1CodesASCII.txt]
+"""
+
+import argparse
+import csv
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+# Small enough that dense city clusters give few candidates per point
+CELL_DEGREES = 0.25
+CHUNK_SIZE = 200_000
+# Most candidate places (and place ranges) compared at once
+MAX_CANDIDATES = 2_000_000
+# Widest search window, in degrees around the point, before giving up
+MAX_RADIUS_DEGREES = 16
+
+ADMIN_COLUMNS = ("city", "region", "country", "geocode_distance_km")
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """
+    Great-circle distance in km between arrays of points given in degrees.
+    """
+    lat1, lng1, lat2, lng2 = (np.radians(a) for a in (lat1, lng1, lat2, lng2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _unit_vectors(latitudes, longitudes):
+    """
+    Points on the unit sphere, as x, y and z arrays.
+    """
+    latitudes, longitudes = np.radians(latitudes), np.radians(longitudes)
+    cos_lat = np.cos(latitudes)
+    return cos_lat * np.cos(longitudes), cos_lat * np.sin(longitudes), np.sin(latitudes)
+
+
+def _first_true(mask, segment_starts, segment_lengths):
+    """
+    Offset of the first True of mask within each (non-empty) segment.
+    """
+    positions = np.flatnonzero(mask)
+    segments = np.repeat(np.arange(len(segment_starts)), segment_lengths)[positions]
+    first = positions[np.r_[True, segments[1:] != segments[:-1]]]
+    return first - segment_starts
+
+
+class Gazetteer:
+    """
+    Array-backed gazetteer with a grid spatial index.
+
+    Args:
+        latitudes, longitudes: Coordinates of the places.
+        names: Place names.
+        regions: Region (admin1) names or codes.
+        countries: ISO country codes.
+        cell_degrees (float): Grid cell size.
+    """
+
+    def __init__(self, latitudes, longitudes, names, regions, countries, cell_degrees=CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self.rows = int(np.ceil(180 / cell_degrees))
+        self.cols = int(np.ceil(360 / cell_degrees))
+
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        cells = self._cells(latitudes, longitudes)
+        order = np.argsort(cells, kind="stable")
+
+        self.latitudes = latitudes[order]
+        self.longitudes = longitudes[order]
+        self.names = np.asarray(names, dtype=object)[order]
+        self.regions = np.asarray(regions, dtype=object)[order]
+        self.countries = np.asarray(countries, dtype=object)[order]
+        # offsets[c]:offsets[c + 1] are the places of cell c
+        self.offsets = np.searchsorted(cells[order], np.arange(self.rows * self.cols + 1))
+        self._x, self._y, self._z = _unit_vectors(self.latitudes, self.longitudes)
+
+    def __len__(self):
+        return len(self.latitudes)
+
+    def _row_col(self, latitudes, longitudes):
+        rows = np.clip(((latitudes + 90) // self.cell_degrees).astype(np.int64), 0, self.rows - 1)
+        cols = ((longitudes + 180) // self.cell_degrees).astype(np.int64) % self.cols
+        return rows, cols
+
+    def _cells(self, latitudes, longitudes):
+        rows, cols = self._row_col(latitudes, longitudes)
+        return rows * self.cols + cols
+
+    @classmethod
+    def from_geonames(cls, path, admin1_path=None, cell_degrees=CELL_DEGREES):
+        """
+        Loads a GeoNames dump (tab separated: name in column 2, latitude and
+        longitude in 5 and 6, country code in 9, admin1 code in 11).
+        """
+        admin1_names = {}
+        if admin1_path:
+            with open(admin1_path, encoding="utf-8") as file:
+                for line in file:
+                    fields = line.rstrip("\n").split("\t")
+                    if len(fields) >= 2:
+                        admin1_names[fields[0]] = fields[1]
+
+        names, regions, countries, latitudes, longitudes = [], [], [], [], []
+        with open(path, encoding="utf-8") as file:
+            for line in file:
+                fields = line.rstrip("\n").split("\t")
+                if len(fields) < 11:
+                    continue
+                names.append(fields[1])
+                latitudes.append(fields[4])
+                longitudes.append(fields[5])
+                countries.append(fields[8])
+                regions.append(admin1_names.get(f"{fields[8]}.{fields[10]}", fields[10]))
+        return cls(np.array(latitudes, dtype=np.float64), np.array(longitudes, dtype=np.float64),
+                   names, regions, countries, cell_degrees=cell_degrees)
+
+    def nearest(self, latitudes, longitudes, chunk_size=CHUNK_SIZE):
+        """
+        Finds the nearest place for every point.
+
+        Returns:
+            tuple: (indices, distances_km) as arrays; index -1 and distance
+            NaN where a point is missing (NaN) or no place is near.
+        """
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        indices = np.full(len(latitudes), -1, dtype=np.int64)
+        distances = np.full(len(latitudes), np.nan)
+        for start in range(0, len(latitudes), chunk_size):
+            stop = start + chunk_size
+            indices[start:stop], distances[start:stop] = self._nearest_chunk(
+                latitudes[start:stop], longitudes[start:stop])
+        return indices, distances
+
+    def _nearest_chunk(self, latitudes, longitudes):
+        """
+        Searches the 3 x 3 cells around each point first. Points whose match
+        could still be beaten by a place outside the searched window (or
+        that have no match) are searched again with a wider window; those
+        still uncertain at MAX_RADIUS_DEGREES keep no match.
+        """
+        indices = np.full(len(latitudes), -1, dtype=np.int64)
+        distances = np.full(len(latitudes), np.nan)
+        pending = np.flatnonzero(~(np.isnan(latitudes) | np.isnan(longitudes)))
+        max_radius = int(np.ceil(MAX_RADIUS_DEGREES / self.cell_degrees))
+        radius = 1
+        while len(pending) and len(self):
+            found, found_distances, guard = self._search(latitudes[pending], longitudes[pending], radius)
+            certain = (found >= 0) & (found_distances <= guard)
+            indices[pending[certain]] = found[certain]
+            distances[pending[certain]] = found_distances[certain]
+            pending = pending[~certain]
+            if radius >= max_radius:
+                break
+            radius = min(radius * 2, max_radius)
+        return indices, distances
+
+    def _search(self, latitudes, longitudes, radius):
+        """
+        Nearest place among the (2 * radius + 1)^2 cells around each point.
+
+        Points are gathered in batches of at most MAX_CANDIDATES candidate
+        places (and place ranges), so memory stays bounded however
+        clustered the points or dense the gazetteer are; only a single
+        point with more candidates than that is searched on its own.
+
+        Returns:
+            tuple: (indices, distances_km, guard_km), where guard_km is the
+            distance from each point to the edge of its searched window.
+        """
+        count = len(latitudes)
+        indices = np.full(count, -1, dtype=np.int64)
+        distances = np.full(count, np.nan)
+        rows, cols = self._row_col(latitudes, longitudes)
+        guard = self._guard_km(latitudes, longitudes, rows, cols, radius)
+
+        step = max(1, MAX_CANDIDATES // (4 * radius + 2))
+        for start in range(0, count, step):
+            stop = min(start + step, count)
+            starts, lengths = self._window_ranges(rows[start:stop], cols[start:stop], radius)
+            totals = np.cumsum(lengths.sum(axis=1))
+            first = 0
+            while first < len(totals):
+                done = totals[first - 1] if first else 0
+                last = max(int(np.searchsorted(totals, done + MAX_CANDIDATES, side="right")), first + 1)
+                batch = slice(start + first, start + last)
+                indices[batch], distances[batch] = self._nearest_in_ranges(
+                    latitudes[batch], longitudes[batch], starts[first:last], lengths[first:last])
+                first = last
+        return indices, distances, guard
+
+    def _window_ranges(self, rows, cols, radius):
+        """
+        Place ranges of the cells around each point. The cells of a grid row
+        are consecutive, so each row of the window is one range of places,
+        or two where it wraps around the date line.
+
+        Returns:
+            tuple: (starts, lengths), each of shape (points, 2 * window rows).
+        """
+        d = np.arange(-radius, radius + 1)
+        window_rows = np.clip(rows[:, None] + d[None, :], 0, self.rows - 1)
+        # Clipping at the poles repeats rows
+        duplicate = np.zeros_like(window_rows, dtype=bool)
+        duplicate[:, 1:] = window_rows[:, 1:] == window_rows[:, :-1]
+
+        width = len(d)
+        if width >= self.cols:
+            west, east, wrapped = np.zeros_like(cols), np.full_like(cols, self.cols), np.zeros_like(cols)
+        else:
+            west = (cols - radius) % self.cols
+            east = np.minimum(west + width, self.cols)
+            wrapped = west + width - east
+        first_cell = window_rows * self.cols
+        # (point, row, part) -> (point, row * part)
+        starts = self.offsets[np.stack([first_cell + west[:, None], first_cell], axis=-1)].reshape(len(rows), -1)
+        ends = self.offsets[np.stack([first_cell + east[:, None], first_cell + wrapped[:, None]],
+                                     axis=-1)].reshape(len(rows), -1)
+        lengths = np.where(np.repeat(duplicate, 2, axis=1), 0, ends - starts)
+        return starts, lengths
+
+    def _nearest_in_ranges(self, latitudes, longitudes, starts, lengths):
+        """
+        Nearest place per point among its candidate place ranges.
+        """
+        count, width = starts.shape
+        indices = np.full(count, -1, dtype=np.int64)
+        distances = np.full(count, np.nan)
+        starts = starts.ravel()
+        lengths = lengths.ravel()
+        total = int(lengths.sum())
+        if not total:
+            return indices, distances
+
+        # Flatten all candidate ranges: candidate j of range r is starts[r] + j
+        range_ends = np.cumsum(lengths)
+        candidates = np.arange(total) - np.repeat(range_ends - lengths, lengths) + np.repeat(starts, lengths)
+        per_point = lengths.reshape(count, width).sum(axis=1)
+        matched = np.flatnonzero(per_point)
+        per_point = per_point[matched]
+
+        # The nearest place has the largest dot product of unit vectors, which
+        # needs no trigonometry per candidate
+        x, y, z = _unit_vectors(latitudes[matched], longitudes[matched])
+        dots = (np.repeat(x, per_point) * self._x[candidates] + np.repeat(y, per_point) * self._y[candidates]
+                + np.repeat(z, per_point) * self._z[candidates])
+
+        # Per point maximum; each point's candidates are one segment
+        segment_starts = np.r_[0, np.cumsum(per_point)[:-1]]
+        best = np.maximum.reduceat(dots, segment_starts)
+        # First position of the maximum inside each segment
+        first_best = segment_starts + _first_true(dots == np.repeat(best, per_point), segment_starts, per_point)
+
+        indices[matched] = candidates[first_best]
+        distances[matched] = haversine_km(latitudes[matched], longitudes[matched],
+                                          self.latitudes[indices[matched]], self.longitudes[indices[matched]])
+        return indices, distances
+
+    def _guard_km(self, latitudes, longitudes, rows, cols, radius):
+        """
+        Distance from each point to the nearest edge of its search window: to
+        the bounding parallels, and to the bounding meridians measured along
+        a great circle.
+        """
+        c = self.cell_degrees
+        low = (rows - radius) * c - 90
+        high = (rows + radius + 1) * c - 90
+        lat_margin = np.minimum(np.where(low <= -90, np.inf, latitudes - low),
+                                np.where(high >= 90, np.inf, high - latitudes))
+        if 2 * radius + 1 >= self.cols:
+            return np.radians(lat_margin) * EARTH_RADIUS_KM
+        west = (cols - radius) * c - 180
+        east = (cols + radius + 1) * c - 180
+        lng_margin = np.minimum(longitudes - west, east - longitudes)
+        meridian = np.arcsin(np.clip(np.cos(np.radians(latitudes)) * np.sin(np.radians(np.minimum(lng_margin, 90))),
+                                     0.0, 1.0))
+        return np.minimum(np.radians(lat_margin), meridian) * EARTH_RADIUS_KM
+
+    def reverse(self, latitudes, longitudes):
+        """
+        Resolves points to admin columns.
+
+        Returns:
+            dict: Arrays for city, region, country and geocode_distance_km;
+            None where nothing was matched.
+        """
+        indices, distances = self.nearest(latitudes, longitudes)
+        found = indices >= 0
+        columns = {}
+        for column, values in (("city", self.names), ("region", self.regions), ("country", self.countries)):
+            result = np.full(len(indices), None, dtype=object)
+            result[found] = values[indices[found]]
+            columns[column] = result
+        columns["geocode_distance_km"] = distances
+        return columns
+
+
+def _coordinates(values):
+    """
+    Converts raw column values ('Unknown', '', None, numbers) to a float array.
+    """
+    result = np.full(len(values), np.nan)
+    for i, value in enumerate(values):
+        try:
+            result[i] = float(value)
+        except (TypeError, ValueError):
+            pass
+    return result
+
+
+def add_admin_columns(rows, gazetteer, lat_key="latitude", lng_key="longitude"):
+    """
+    Adds city, region, country and geocode_distance_km to a list of row
+    dictionaries (e.g. main4's posts_data), resolving all rows in one query.
+    """
+    latitudes = _coordinates([row.get(lat_key) for row in rows])
+    longitudes = _coordinates([row.get(lng_key) for row in rows])
+    columns = gazetteer.reverse(latitudes, longitudes)
+    for i, row in enumerate(rows):
+        for column in ADMIN_COLUMNS:
+            value = columns[column][i]
+            row[column] = None if value is None or (isinstance(value, float) and np.isnan(value)) else value
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Add city/region/country columns to a timeline CSV.")
+    parser.add_argument("gazetteer", help="GeoNames cities file, e.g. cities15000.txt")
+    parser.add_argument("timeline", help="Timeline CSV with latitude/longitude columns")
+    parser.add_argument("-o", "--output", required=True, help="CSV file to write")
+    parser.add_argument("--admin1", help="GeoNames admin1CodesASCII.txt for region names")
+    args = parser.parse_args(argv)
+
+    gazetteer = Gazetteer.from_geonames(args.gazetteer, args.admin1)
+    with open(args.timeline, newline="", encoding="utf-8") as file:
+        reader = csv.DictReader(file)
+        fieldnames = list(reader.fieldnames) + [c for c in ADMIN_COLUMNS if c not in reader.fieldnames]
+        rows = list(reader)
+    add_admin_columns(rows, gazetteer)
+    with open(args.output, mode="w", newline="", encoding="utf-8") as file:
+        writer = csv.DictWriter(file, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"{len(rows)} rows geocoded to {args.output}.")
+
+
+if __name__ == "__main__":
+    main()
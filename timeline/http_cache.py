@@ -0,0 +1,283 @@
+"""
+On-disk cache of HTTP responses for the Instagram API calls.
+
+CachingAdapter is a requests transport adapter: mount it on a Session and
+every GET through that session goes through the cache.
+
+- Entries are keyed by the normalized URL: scheme and host lowercased,
+  query parameters sorted, and credentials (``access_token``,
+  ``appsecret_proof``) removed, so a new token does not invalidate the cache
+  and never ends up in it. Their values are also blanked out of stored
+  bodies (Graph API paging links repeat the token).
+- Bodies are stored zlib-compressed in a SQLite file.
+- Freshness is set per endpoint by POLICIES (URL regex -> seconds). A fresh
+  entry is answered without a request; a stale one is revalidated with
+  If-None-Match / If-Modified-Since, and a 304 refreshes it.
+- Once the stored bodies exceed ``max_bytes``, the least recently used
+  entries are evicted.
+
+Only 200 responses to GET requests whose body is JSON are cached, so an HTML
+login or error page answered with 200 is never served from the cache.
+Responses served from the cache carry ``from_cache = True``.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from urllib.parse import parse_qsl, quote, urlencode, urlsplit, urlunsplit
+
+from requests import Response
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from timeline import CACHE_DIR
+
+DEFAULT_PATH = os.path.join(CACHE_DIR, "http.sqlite")
+DEFAULT_MAX_BYTES = 512 * 2 ** 20
+
+# Freshness in seconds by URL pattern, first match wins. Post payloads do not
+# change once published; media listings change with every new post, so they
+# are always revalidated.
+POLICIES = (
+    (r"/p/[^/]+/", 365 * 24 * 3600),
+    (r"/media(\?|$)", 0),
+)
+DEFAULT_FRESHNESS = 0
+
+# Query parameters that are credentials, not part of the resource
+SECRET_PARAMS = frozenset({"access_token", "appsecret_proof"})
+
+# Headers that describe the transfer, not the stored (decoded) body
+_TRANSFER_HEADERS = frozenset({"content-encoding", "content-length", "transfer-encoding", "connection"})
+
+_EVICT_EVERY = 100
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    headers TEXT NOT NULL,
+    body BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    stored_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at);
+"""
+
+
+def _scrub(body, url):
+    """
+    Removes the credential values of url's query from a response body.
+    """
+    for key, value in parse_qsl(urlsplit(url).query):
+        if key in SECRET_PARAMS and value:
+            for form in {value, quote(value, safe=""), quote(value)}:
+                body = body.replace(form.encode("utf-8"), b"")
+    return body
+
+
+def _is_json(headers, body):
+    """
+    Tells whether a response body is a JSON document: by its Content-Type,
+    or else by parsing it.
+    """
+    content_type = CaseInsensitiveDict(headers).get("Content-Type", "")
+    if "json" in content_type.lower():
+        return True
+    try:
+        json.loads(body)
+    except ValueError:
+        return False
+    return True
+
+
+def normalize_url(url):
+    """
+    Returns the cache key of a URL: lowercased scheme and host, sorted query
+    without credentials, no fragment.
+    """
+    parts = urlsplit(url)
+    query = sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                   if key not in SECRET_PARAMS)
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or "/", urlencode(query), ""))
+
+
+class HttpCache:
+    """
+    SQLite store of compressed responses. Safe to share between threads.
+
+    Args:
+        path (str): Database file, created if missing.
+        max_bytes (int): Bound on the total compressed body size.
+        policies (tuple): (URL regex, freshness seconds) pairs.
+        default_freshness (float): Freshness of URLs no policy matches.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, max_bytes=DEFAULT_MAX_BYTES, policies=POLICIES,
+                 default_freshness=DEFAULT_FRESHNESS):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.policies = [(re.compile(pattern), freshness) for pattern, freshness in policies]
+        self.default_freshness = default_freshness
+        self.stats = {"hits": 0, "revalidated": 0, "misses": 0, "stored": 0}
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+
+    def freshness(self, key):
+        for pattern, freshness in self.policies:
+            if pattern.search(key):
+                return freshness
+        return self.default_freshness
+
+    def get(self, key):
+        """
+        Returns (headers, body, etag, last_modified, fresh) for a key,
+        or None.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT headers, body, etag, last_modified, stored_at FROM responses WHERE key = ?",
+                (key,)).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            self._db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        headers, body, etag, last_modified, stored_at = row
+        fresh = now - stored_at < self.freshness(key)
+        return json.loads(headers), zlib.decompress(body), etag, last_modified, fresh
+
+    def put(self, key, headers, body):
+        # Header names are case-insensitive (proxies and HTTP/2 send "etag")
+        headers = CaseInsensitiveDict({name: value for name, value in headers.items()
+                                       if name.lower() not in _TRANSFER_HEADERS})
+        compressed = zlib.compress(body)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, json.dumps(dict(headers)), compressed, len(compressed), headers.get("ETag"),
+                 headers.get("Last-Modified"), now, now))
+            self.stats["stored"] += 1
+            self._writes += 1
+            if self._writes % _EVICT_EVERY == 0:
+                self._evict()
+
+    def count(self, name):
+        """
+        Increments a counter of stats; adapters call this from many threads.
+        """
+        with self._lock:
+            self.stats[name] += 1
+
+    def touch(self, key):
+        """
+        Marks an entry as fresh again after a 304.
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("UPDATE responses SET stored_at = ?, accessed_at = ? WHERE key = ?", (now, now, key))
+
+    def _evict(self):
+        """
+        Drops the least recently used entries while the bodies exceed max_bytes.
+        """
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        freed = 0
+        doomed = []
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY accessed_at"):
+            doomed.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self._db.executemany("DELETE FROM responses WHERE key = ?", doomed)
+
+    def close(self):
+        with self._lock:
+            self._evict()
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class CachingAdapter(HTTPAdapter):
+    """
+    HTTPAdapter answering GET requests from an HttpCache.
+
+    Args:
+        cache (HttpCache): The response store; may be shared by many adapters.
+        **kwargs: Passed to HTTPAdapter (pool sizes, retries).
+    """
+
+    def __init__(self, cache, **kwargs):
+        super().__init__(**kwargs)
+        self.cache = cache
+
+    def send(self, request, **kwargs):
+        if request.method != "GET":
+            return super().send(request, **kwargs)
+
+        key = normalize_url(request.url)
+        entry = self.cache.get(key)
+        if entry is not None:
+            headers, body, etag, last_modified, fresh = entry
+            if fresh:
+                self.cache.count("hits")
+                return self._cached_response(request, headers, body)
+            if etag:
+                request.headers["If-None-Match"] = etag
+            if last_modified:
+                request.headers["If-Modified-Since"] = last_modified
+
+        response = super().send(request, **kwargs)
+        if entry is not None and response.status_code == 304:
+            response.close()
+            self.cache.touch(key)
+            self.cache.count("revalidated")
+            return self._cached_response(request, entry[0], entry[1])
+
+        self.cache.count("misses")
+        if response.status_code == 200 and _is_json(response.headers, response.content):
+            self.cache.put(key, dict(response.headers), _scrub(response.content, request.url))
+        return response
+
+    @staticmethod
+    def _cached_response(request, headers, body):
+        response = Response()
+        response.status_code = 200
+        response.reason = "OK"
+        response.headers = CaseInsensitiveDict(headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = body
+        response.url = request.url
+        response.request = request
+        response.from_cache = True
+        return response
+
+
+def mount_cache(session, cache, **adapter_kwargs):
+    """
+    Routes all http(s) requests of a session through cache.
+    """
+    adapter = CachingAdapter(cache, **adapter_kwargs)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
@@ -0,0 +1,56 @@
+"""
+Dependency-free helpers for Instagram post data.
+
+These mirror what instaloader computes on its Post objects (hashtags,
+shortcode <-> media id), for code that only has a saved node, a CSV row or a
+URL (dump ingestion, indexes, columnar output, fixtures), and import nothing
+beyond the standard library.
+"""
+
+import re
+
+# instaloader's Post.caption_hashtags pattern
+HASHTAG_REGEX = re.compile(r"(?:#)((?:\w){1,150})")
+
+SHORTCODE_ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_"
+
+
+def caption_hashtags(caption):
+    """
+    Hashtags of a caption, lowercased and without the #, as instaloader's
+    Post.caption_hashtags.
+    """
+    if not caption:
+        return []
+    return HASHTAG_REGEX.findall(caption.lower())
+
+
+def mediaid_to_shortcode(mediaid):
+    """
+    Converts a numeric media id to its shortcode (instaloader's mapping).
+    """
+    shortcode = ""
+    while mediaid > 0:
+        mediaid, remainder = divmod(mediaid, 64)
+        shortcode = SHORTCODE_ALPHABET[remainder] + shortcode
+    return shortcode
+
+
+def shortcode_to_mediaid(shortcode):
+    """
+    Converts a post shortcode to its numeric media id (the same mapping as
+    instaloader's Post.shortcode_to_mediaid).
+    """
+    mediaid = 0
+    for char in shortcode[-11:]:
+        mediaid = mediaid * 64 + SHORTCODE_ALPHABET.index(char)
+    return mediaid
+
+
+def shortcode_from_url(url):
+    """
+    Returns the shortcode of a ``/p/<shortcode>/`` post URL, or None.
+    """
+    if not url or "/p/" not in url:
+        return None
+    return url.split("/p/", 1)[1].split("/", 1)[0] or None
@@ -0,0 +1,189 @@
+"""
+Persistent SQLite cache of post locations, shared by all timeline backends.
+
+Two tables are kept:
+
+- ``locations``: location id -> name, latitude, longitude
+- ``posts``: post shortcode (or Graph API media id) -> location id, or NULL
+  when the post is known to have no location (negative caching)
+
+Entries expire after ``ttl`` seconds (``negative_ttl`` for posts without a
+location) and the least recently used ones are evicted once a table grows
+past ``max_entries``. Hit and miss counts are kept in ``stats``.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+from timeline import CACHE_DIR
+
+DEFAULT_PATH = os.path.join(CACHE_DIR, "locations.sqlite")
+DEFAULT_TTL = 30 * 24 * 3600
+DEFAULT_NEGATIVE_TTL = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 200_000
+
+# Returned by get_post() when the cache knows nothing about the post
+MISS = object()
+
+# Eviction runs every this many writes rather than on each one
+_EVICT_EVERY = 1000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS locations (
+    location_id TEXT PRIMARY KEY,
+    name TEXT,
+    latitude REAL,
+    longitude REAL,
+    updated_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS posts (
+    post_key TEXT PRIMARY KEY,
+    location_id TEXT,
+    updated_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS locations_accessed ON locations (accessed_at);
+CREATE INDEX IF NOT EXISTS posts_accessed ON posts (accessed_at);
+"""
+
+
+def _coordinate(value):
+    """
+    Normalizes a latitude/longitude to a float or None ('Unknown' -> None).
+    """
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class LocationCache:
+    """
+    On-disk location cache. Safe to share between threads.
+
+    Args:
+        path (str): SQLite database file, created if missing.
+        ttl (float): Lifetime of positive entries in seconds.
+        negative_ttl (float): Lifetime of "no location" entries in seconds.
+        max_entries (int): Size bound of each table before LRU eviction.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, ttl=DEFAULT_TTL, negative_ttl=DEFAULT_NEGATIVE_TTL,
+                 max_entries=DEFAULT_MAX_ENTRIES):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.stats = {"hits": 0, "negative_hits": 0, "misses": 0}
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+
+    def _location_row(self, location_id, now):
+        row = self._db.execute(
+            "SELECT name, latitude, longitude, updated_at FROM locations WHERE location_id = ?",
+            (location_id,)).fetchone()
+        if row is None or now - row[3] > self.ttl:
+            return None
+        self._db.execute("UPDATE locations SET accessed_at = ? WHERE location_id = ?", (now, location_id))
+        return row[:3]
+
+    def get_location(self, location_id):
+        """
+        Returns (name, latitude, longitude) for a location id, or None.
+        """
+        now = time.time()
+        with self._lock:
+            location = self._location_row(str(location_id), now)
+            self.stats["hits" if location else "misses"] += 1
+        return location
+
+    def get_post(self, post_key):
+        """
+        Returns (name, latitude, longitude) for a post, None if the post is
+        known to have no location, or MISS if the cache cannot tell.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT location_id, updated_at FROM posts WHERE post_key = ?", (post_key,)).fetchone()
+            if row is not None:
+                location_id, updated_at = row
+                if location_id is None and now - updated_at <= self.negative_ttl:
+                    self._db.execute("UPDATE posts SET accessed_at = ? WHERE post_key = ?", (now, post_key))
+                    self.stats["negative_hits"] += 1
+                    return None
+                if location_id is not None and now - updated_at <= self.ttl:
+                    location = self._location_row(location_id, now)
+                    if location is not None:
+                        self._db.execute("UPDATE posts SET accessed_at = ? WHERE post_key = ?",
+                                         (now, post_key))
+                        self.stats["hits"] += 1
+                        return location
+            self.stats["misses"] += 1
+            return MISS
+
+    def put_location(self, location_id, name, latitude, longitude):
+        """
+        Stores the details of a location.
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO locations VALUES (?, ?, ?, ?, ?, ?)",
+                (str(location_id), name, _coordinate(latitude), _coordinate(longitude), now, now))
+            self._wrote()
+
+    def put_post(self, post_key, location, location_id=None):
+        """
+        Stores the location of a post. location is a (name, latitude,
+        longitude) tuple, or None for a post without a location.
+
+        Locations without an id (e.g. from the ``?__a=1`` fallback of older
+        payloads) are keyed by their name.
+        """
+        if location is not None:
+            if location_id is None:
+                location_id = f"name:{location[0]}"
+            self.put_location(location_id, *location)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO posts VALUES (?, ?, ?, ?)",
+                (post_key, str(location_id) if location is not None else None, now, now))
+            self._wrote()
+
+    def _wrote(self):
+        self._writes += 1
+        if self._writes % _EVICT_EVERY == 0:
+            self._evict()
+
+    def _evict(self):
+        """
+        Drops the least recently used entries of tables over max_entries.
+        """
+        for table in ("posts", "locations"):
+            count = self._db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            excess = count - self.max_entries
+            if excess > 0:
+                self._db.execute(
+                    f"DELETE FROM {table} WHERE rowid IN "
+                    f"(SELECT rowid FROM {table} ORDER BY accessed_at LIMIT ?)", (excess,))
+
+    def close(self):
+        with self._lock:
+            self._evict()
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,129 @@
+"""
+Concurrent location lookups through Instagram's ``/p/{shortcode}/?__a=1`` endpoint.
+
+Lookups run on a bounded thread pool. Each worker thread keeps its own
+``requests.Session`` so connections stay alive between requests, and every
+request has a timeout. ``base_url`` can point at a local stub server for tests.
+With a LocationCache, posts already looked up are answered without a request;
+with an HttpCache, the raw payloads are cached as well (see timeline.http_cache).
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from timeline.http_cache import CachingAdapter
+from timeline.location_cache import MISS
+
+INSTAGRAM_BASE_URL = "https://www.instagram.com"
+UNKNOWN_LOCATION = ('Unknown', 'Unknown', 'Unknown')
+
+
+def location_from_post_json(post_data):
+    """
+    Extracts (name, latitude, longitude) from a ``?__a=1`` post payload.
+    """
+    location_data = post_data['graphql']['shortcode_media'].get('location', None)
+    if not location_data:
+        return UNKNOWN_LOCATION
+    return (location_data.get('name', 'Unknown'),
+            location_data.get('lat', 'Unknown'),
+            location_data.get('lng', 'Unknown'))
+
+
+class LocationResolver:
+    """
+    Resolves post locations concurrently over keep-alive connections.
+
+    Args:
+        base_url (str): Instagram base URL, without a trailing slash.
+        concurrency (int): Maximum number of requests in flight.
+        timeout (float): Per-request timeout in seconds.
+        cache (LocationCache): Optional cache consulted before each request.
+        metrics (CrawlMetrics): Optional; lookups are timed as the
+            "location_fallback" stage.
+        http_cache (HttpCache): Optional response cache under the sessions.
+    """
+
+    def __init__(self, base_url=INSTAGRAM_BASE_URL, concurrency=8, timeout=10, cache=None, metrics=None,
+                 http_cache=None):
+        self.base_url = base_url.rstrip('/')
+        self.cache = cache
+        self.http_cache = http_cache
+        self.metrics = metrics
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self._local = threading.local()
+        self._sessions = []
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="location")
+
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            if self.http_cache is not None:
+                adapter = CachingAdapter(self.http_cache, pool_connections=1, pool_maxsize=1)
+            else:
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            self._local.session = session
+            self._sessions.append(session)
+        return session
+
+    def fetch(self, shortcode):
+        """
+        Looks up one post. Errors are reported and mapped to UNKNOWN_LOCATION,
+        like main4's original per-post fallback.
+        """
+        if self.cache is not None:
+            cached = self.cache.get_post(shortcode)
+            if cached is not MISS:
+                return cached or UNKNOWN_LOCATION
+
+        api_url = f"{self.base_url}/p/{shortcode}/?__a=1"
+        try:
+            if self.metrics is not None:
+                with self.metrics.stage("location_fallback"):
+                    response = self._session().get(api_url, timeout=self.timeout)
+                self.metrics.count("bytes_downloaded", len(response.content))
+                if response.status_code == 429:
+                    self.metrics.count("http_429")
+            else:
+                response = self._session().get(api_url, timeout=self.timeout)
+            post_data = response.json()
+            location = location_from_post_json(post_data)
+            if self.cache is not None:
+                location_data = post_data['graphql']['shortcode_media'].get('location')
+                self.cache.put_post(shortcode, location if location_data else None,
+                                    location_id=(location_data or {}).get('id'))
+            return location
+        except Exception as e:
+            print(f"Error fetching location data for {shortcode}: {e}")
+            return UNKNOWN_LOCATION
+
+    def submit(self, shortcode):
+        """
+        Schedules a lookup and returns a Future of (name, latitude, longitude).
+        """
+        return self._executor.submit(self.fetch, shortcode)
+
+    def resolve(self, shortcodes):
+        """
+        Looks up all shortcodes concurrently and returns their locations in
+        the same order.
+        """
+        return list(self._executor.map(self.fetch, shortcodes))
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        for session in self._sessions:
+            session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,379 @@
+"""
+Content-addressed store for downloaded media.
+
+instaloader keeps every JPG/MP4 of a profile in the profile's directory, so
+the same picture reposted by several profiles is stored once per profile, and
+fast_update can only tell by file name whether a post was fetched. MediaStore
+keeps one object per distinct file content under ``objects/<ab>/<digest>``
+and hardlinks the profile files to it, so duplicates take no extra space.
+
+A SQLite index next to the objects records:
+
+- ``media``: (shortcode, slide, extension) -> digest, so a post already in
+  the store is linked into place instead of being downloaded again,
+- ``files``: path -> digest, size, mtime and inode, so re-ingesting a
+  directory only hashes files that are new or changed,
+- ``objects``: digest -> size and when it was last verified.
+
+Files are hashed on a thread pool (hashlib releases the GIL on large
+buffers) through memory-mapped reads. verify() hashes each object once, not
+each of its links, and skips objects that are unchanged since their last
+verification unless a full check is asked for.
+
+Usage:
+  python -m timeline.media_store [--root media_store] [-j WORKERS] ingest PROFILE_DIR [PROFILE_DIR ...]
+  python -m timeline.media_store [--root media_store] verify [--full]
+"""
+
+import argparse
+import hashlib
+import json
+import lzma
+import mmap
+import os
+import re
+import shutil
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_ROOT = "media_store"
+HASH_ALGORITHM = "sha256"
+HASH_WORKERS = min(8, os.cpu_count() or 1)
+MEDIA_EXTENSIONS = ("jpg", "jpeg", "png", "webp", "mp4")
+
+# Objects verified within this many seconds are skipped by verify()
+VERIFY_MAX_AGE = 30 * 24 * 3600
+
+# instaloader file names: <date>_UTC[_<slide>].<ext>; slide 0 means a single-media post
+_MEDIA_NAME = re.compile(r"^(?P<stem>.+_UTC)(?:_(?P<slide>\d+))?\.(?P<ext>[A-Za-z0-9]+)$")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    digest TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    verified_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS media (
+    shortcode TEXT NOT NULL,
+    slide INTEGER NOT NULL,
+    ext TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    PRIMARY KEY (shortcode, slide, ext)
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    inode INTEGER NOT NULL
+);
+"""
+
+
+def hash_file(path, algorithm=HASH_ALGORITHM):
+    """
+    Returns the hex digest of a file, read through a memory map.
+    """
+    digest = hashlib.new(algorithm)
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                digest.update(mapped)
+    return digest.hexdigest()
+
+
+def hash_files(paths, workers=HASH_WORKERS, algorithm=HASH_ALGORITHM):
+    """
+    Hashes files on a thread pool and yields (path, digest) in input order;
+    digest is None for files that cannot be read. At most ``4 * workers``
+    files are in flight, so any number of paths can be streamed through.
+    """
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hash") as executor:
+        pending = deque()
+        for path in paths:
+            pending.append((path, executor.submit(hash_file, path, algorithm)))
+            if len(pending) >= 4 * workers:
+                yield _hash_result(*pending.popleft())
+        while pending:
+            yield _hash_result(*pending.popleft())
+
+
+def _hash_result(path, future):
+    try:
+        return path, future.result()
+    except OSError as e:
+        print(f"Error hashing {path}: {e}")
+        return path, None
+
+
+def media_key(path, shortcodes):
+    """
+    Returns (shortcode, slide, extension) for an instaloader media file name,
+    or None. shortcodes maps file stems (``<date>_UTC``) to shortcodes.
+    """
+    match = _MEDIA_NAME.match(os.path.basename(path))
+    if not match or match["ext"].lower() not in MEDIA_EXTENSIONS:
+        return None
+    shortcode = shortcodes.get(match["stem"])
+    if shortcode is None:
+        return None
+    return shortcode, int(match["slide"] or 0), match["ext"].lower()
+
+
+def read_shortcodes(profile_dir):
+    """
+    Maps the file stems of a profile directory to post shortcodes, from the
+    ``<date>_UTC.json.xz`` metadata files instaloader writes next to the media.
+    """
+    shortcodes = {}
+    with os.scandir(profile_dir) as entries:
+        for entry in entries:
+            if not entry.name.endswith("_UTC.json.xz"):
+                continue
+            try:
+                with lzma.open(entry.path, "rb") as file:
+                    node = json.load(file).get("node") or {}
+            except (OSError, lzma.LZMAError, ValueError) as e:
+                print(f"Error reading {entry.path}: {e}")
+                continue
+            if node.get("shortcode"):
+                shortcodes[entry.name[:-len(".json.xz")]] = node["shortcode"]
+    return shortcodes
+
+
+class MediaStore:
+    """
+    Content-addressed media objects with hardlink deduplication.
+
+    Args:
+        root (str): Store directory; must be on the same file system as the
+            profile directories for hardlinks to work (files are copied
+            into the store otherwise, without deduplication).
+        workers (int): Hashing threads.
+    """
+
+    def __init__(self, root=DEFAULT_ROOT, workers=HASH_WORKERS):
+        self.root = root
+        self.workers = workers
+        self.stats = {"hashed": 0, "skipped": 0, "linked": 0, "deduplicated": 0, "bytes_saved": 0}
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(root, "index.sqlite"), isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+
+    def object_path(self, digest):
+        return os.path.join(self.root, "objects", digest[:2], digest)
+
+    def lookup(self, shortcode, slide, ext):
+        """
+        Returns the object path of a post's media file, or None if the store
+        does not have it.
+        """
+        row = self._db.execute("SELECT digest FROM media WHERE shortcode = ? AND slide = ? AND ext = ?",
+                               (shortcode, slide, ext.lower())).fetchone()
+        if row is None:
+            return None
+        path = self.object_path(row[0])
+        return path if os.path.exists(path) else None
+
+    def link_to(self, shortcode, slide, ext, target):
+        """
+        Hardlinks a stored media file to target instead of downloading it.
+        Returns False if the store does not have the file.
+        """
+        source = self.lookup(shortcode, slide, ext)
+        if source is None:
+            return False
+        os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+        try:
+            os.link(source, target)
+        except FileExistsError:
+            return True
+        except OSError:
+            shutil.copy2(source, target)
+        self._record_file(target, os.stat(target), self._digest_of(source))
+        self.stats["linked"] += 1
+        return True
+
+    @staticmethod
+    def _digest_of(object_path):
+        return os.path.basename(object_path)
+
+    def _record_file(self, path, stat, digest):
+        self._db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                         (os.path.abspath(path), digest, stat.st_size, stat.st_mtime_ns, stat.st_ino))
+
+    def _unchanged(self, path, stat):
+        row = self._db.execute("SELECT size, mtime_ns, inode FROM files WHERE path = ?",
+                               (os.path.abspath(path),)).fetchone()
+        return row == (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+    def _store(self, path, digest, key):
+        """
+        Moves one hashed file into the store: the first copy of a content
+        becomes the object, later ones are replaced by a link to it.
+        """
+        stat = os.stat(path)
+        target = self.object_path(digest)
+        try:
+            object_stat = os.stat(target)
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            try:
+                os.link(path, target)
+            except OSError:
+                shutil.copy2(path, target)
+            object_stat = os.stat(target)
+            self._db.execute("INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?)",
+                             (digest, object_stat.st_size, object_stat.st_mtime_ns, time.time()))
+        else:
+            if not os.path.samestat(stat, object_stat):
+                temporary = f"{path}.link-{os.getpid()}"
+                try:
+                    os.link(target, temporary)
+                    os.replace(temporary, path)
+                    self.stats["deduplicated"] += 1
+                    self.stats["bytes_saved"] += stat.st_size
+                    stat = os.stat(path)
+                except OSError:
+                    # Other file system: keep the copy
+                    if os.path.exists(temporary):
+                        os.remove(temporary)
+        self._record_file(path, stat, digest)
+        if key is not None:
+            self._db.execute("INSERT OR REPLACE INTO media VALUES (?, ?, ?, ?)", (*key, digest))
+
+    def ingest(self, files):
+        """
+        Adds files to the store. files is an iterable of (path, key) pairs,
+        key being (shortcode, slide, extension) or None. Files whose size,
+        mtime and inode match the index are not hashed again.
+
+        Returns:
+            int: Number of files hashed.
+        """
+        keys = {}
+
+        def changed():
+            for path, key in files:
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if self._unchanged(path, stat):
+                    self.stats["skipped"] += 1
+                    if key is not None:
+                        self._db.execute("INSERT OR IGNORE INTO media SELECT ?, ?, ?, digest FROM files "
+                                         "WHERE path = ?", (*key, os.path.abspath(path)))
+                    continue
+                keys[path] = key
+                yield path
+
+        hashed = 0
+        self._db.execute("BEGIN")
+        try:
+            for path, digest in hash_files(changed(), self.workers):
+                key = keys.pop(path)
+                if digest is None:
+                    continue
+                self._store(path, digest, key)
+                hashed += 1
+                if hashed % 1000 == 0:
+                    self._db.execute("COMMIT")
+                    self._db.execute("BEGIN")
+        finally:
+            self._db.execute("COMMIT")
+        self.stats["hashed"] += hashed
+        return hashed
+
+    def ingest_profile(self, profile_dir):
+        """
+        Adds every media file of an instaloader profile directory, keyed by
+        shortcode and slide where the metadata files tell them.
+        """
+        shortcodes = read_shortcodes(profile_dir)
+        with os.scandir(profile_dir) as entries:
+            paths = sorted(entry.path for entry in entries if entry.is_file()
+                           and entry.name.rsplit(".", 1)[-1].lower() in MEDIA_EXTENSIONS)
+        return self.ingest((path, media_key(path, shortcodes)) for path in paths)
+
+    def verify(self, full=False, max_age=VERIFY_MAX_AGE):
+        """
+        Re-hashes stored objects and returns the digests of missing or
+        corrupted ones. Without full, objects whose size and mtime are
+        unchanged and that were verified less than max_age seconds ago are
+        skipped.
+        """
+        now = time.time()
+        to_hash = []
+        bad = []
+        for digest, size, mtime_ns, verified_at in self._db.execute("SELECT * FROM objects").fetchall():
+            try:
+                stat = os.stat(self.object_path(digest))
+            except FileNotFoundError:
+                bad.append(digest)
+                continue
+            if (not full and stat.st_size == size and stat.st_mtime_ns == mtime_ns
+                    and now - verified_at < max_age):
+                self.stats["skipped"] += 1
+                continue
+            to_hash.append(self.object_path(digest))
+
+        self._db.execute("BEGIN")
+        try:
+            for path, digest in hash_files(to_hash, self.workers):
+                expected = self._digest_of(path)
+                self.stats["hashed"] += 1
+                if digest != expected:
+                    bad.append(expected)
+                    continue
+                stat = os.stat(path)
+                self._db.execute("UPDATE objects SET size = ?, mtime_ns = ?, verified_at = ? WHERE digest = ?",
+                                 (stat.st_size, stat.st_mtime_ns, now, expected))
+        finally:
+            self._db.execute("COMMIT")
+        return bad
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Deduplicate and verify downloaded Instagram media.")
+    parser.add_argument("--root", default=DEFAULT_ROOT, help="Store directory")
+    parser.add_argument("-j", "--workers", type=int, default=HASH_WORKERS, help="Hashing threads")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest = commands.add_parser("ingest", help="Add instaloader profile directories to the store")
+    ingest.add_argument("profile_dirs", nargs="+")
+    verify = commands.add_parser("verify", help="Check the stored objects against their digests")
+    verify.add_argument("--full", action="store_true", help="Re-hash every object")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    with MediaStore(args.root, args.workers) as store:
+        if args.command == "ingest":
+            for profile_dir in args.profile_dirs:
+                store.ingest_profile(profile_dir)
+            print(f"Hashed {store.stats['hashed']} files, skipped {store.stats['skipped']} unchanged, "
+                  f"deduplicated {store.stats['deduplicated']} ({store.stats['bytes_saved'] / 2 ** 20:.1f} MiB saved).")
+        else:
+            bad = store.verify(full=args.full)
+            for digest in bad:
+                print(f"Missing or corrupted object: {store.object_path(digest)}")
+            print(f"Verified {store.stats['hashed']} objects, skipped {store.stats['skipped']} recently verified, "
+                  f"{len(bad)} bad.")
+    print(f"Done in {time.perf_counter() - start:.1f} s.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Per-stage timing and throughput instrumentation for crawls.
+
+A CrawlMetrics object records, per pipeline stage (profile fetch, post
+iteration, location fallback, media download, row write, ...), a latency
+histogram, plus counters such as posts processed, bytes downloaded, retries
+and HTTP 429 responses. It can print a progress line every few seconds and
+export a JSON summary at the end, in place of per-post debug printing.
+
+    metrics = CrawlMetrics(progress_interval=10)
+    with metrics.stage("profile_fetch"):
+        profile = ...
+    for post in metrics.timed_iter("post_fetch", profile.get_posts()):
+        ...
+        metrics.count("posts")
+    metrics.write_json("crawl_metrics.json")
+"""
+
+import bisect
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds of the latency buckets, in milliseconds
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000, float("inf"))
+
+
+class Histogram:
+    """
+    Fixed-bucket latency histogram; cheap enough to record every call.
+    """
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS_MS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        ms = seconds * 1000
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """
+        Returns the upper bound (in seconds) of the bucket holding quantile q.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS_MS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound / 1000, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "total_s": round(self.total, 6),
+            "mean_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            "p50_ms": round(self.quantile(0.5) * 1000, 3),
+            "p90_ms": round(self.quantile(0.9) * 1000, 3),
+            "p99_ms": round(self.quantile(0.99) * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+            "buckets_ms": {str(bound): count for bound, count in zip(BUCKETS_MS, self.counts) if count},
+        }
+
+
+class CrawlMetrics:
+    """
+    Collects stage latencies and counters. Safe to use from several threads.
+
+    Args:
+        progress_interval (float): Seconds between progress lines, or None
+            for no progress output.
+        stream: Where progress lines go (default: stderr).
+    """
+
+    def __init__(self, progress_interval=None, stream=None):
+        self.started = time.monotonic()
+        self.stages = {}
+        self.counters = {}
+        self.progress_interval = progress_interval
+        self.stream = stream or sys.stderr
+        self._last_progress = self.started
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram()
+            histogram.record(seconds)
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Times the enclosed block as one call of the given stage.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def timed_iter(self, name, iterable):
+        """
+        Yields from iterable, timing how long each next() takes; with
+        instaloader this is where page fetches happen.
+        """
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.record(name, time.perf_counter() - start)
+                return
+            self.record(name, time.perf_counter() - start)
+            yield item
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+        if name == "posts":
+            self.maybe_report()
+
+    def rate(self, name="posts"):
+        elapsed = time.monotonic() - self.started
+        return self.counters.get(name, 0) / elapsed if elapsed > 0 else 0.0
+
+    def maybe_report(self):
+        """
+        Prints a progress line if progress_interval has passed since the last one.
+        """
+        if self.progress_interval is None:
+            return
+        now = time.monotonic()
+        if now - self._last_progress < self.progress_interval:
+            return
+        self._last_progress = now
+        print(self.progress_line(), file=self.stream, flush=True)
+
+    def progress_line(self):
+        elapsed = time.monotonic() - self.started
+        parts = [f"[{elapsed:7.1f}s]", f"posts={self.counters.get('posts', 0)}",
+                 f"rate={self.rate():.2f}/s"]
+        parts.extend(f"{name}={value}" for name, value in sorted(self.counters.items()) if name != "posts")
+        return " ".join(parts)
+
+    def summary(self):
+        with self._lock:
+            return {
+                "elapsed_s": round(time.monotonic() - self.started, 3),
+                "posts_per_s": round(self.rate(), 3),
+                "counters": dict(self.counters),
+                "stages": {name: histogram.summary() for name, histogram in self.stages.items()},
+            }
+
+    def write_json(self, path):
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.summary(), file, indent=2)
+
+
+def instaloader_rate_controller(metrics):
+    """
+    Returns a rate_controller factory for instaloader.Instaloader that counts
+    429 responses and the retries instaloader makes after them.
+    """
+    import instaloader
+
+    class MetricsRateController(instaloader.RateController):
+        def handle_429(self, query_type):
+            metrics.count("http_429")
+            metrics.count("retries")
+            return super().handle_429(query_type)
+
+    return lambda context: MetricsRateController(context)
@@ -0,0 +1,125 @@
+"""
+Single-pass extraction of post data from Instagram page source.
+
+Instagram ships the data behind a profile or post page as JSON inside the
+HTML: ``<script type="application/json">`` blobs on current pages, and
+``window._sharedData`` / ``window.__additionalDataLoaded(...)`` on older ones.
+Instead of clicking into every post and querying the DOM, this module pulls
+those blobs out of the page source and collects every media node in them
+(shortcode, timestamp, location) in one pass.
+
+The parser only needs the HTML text, so it can be run and timed on saved
+pages offline:
+  python -m timeline.page_data saved_profile.html [saved_post.html ...]
+"""
+
+import json
+import re
+import sys
+import time
+from datetime import datetime, timezone
+
+_JSON_SCRIPT = re.compile(r'<script[^>]*type="application/(?:ld\+)?json"[^>]*>(.*?)</script>', re.S)
+_SHARED_DATA = re.compile(r'window\._sharedData\s*=\s*(\{.*?\});?\s*</script>', re.S)
+_ADDITIONAL_DATA = re.compile(r'window\.__additionalDataLoaded\([^,]*,\s*(\{.*?\})\);?\s*</script>', re.S)
+
+# Blobs without any of these markers cannot contain media nodes
+_MARKERS = ('"shortcode"', '"code"')
+
+
+def iter_json_blobs(html):
+    """
+    Yields the decoded JSON documents embedded in a page that may hold posts.
+    """
+    for pattern in (_JSON_SCRIPT, _SHARED_DATA, _ADDITIONAL_DATA):
+        for match in pattern.finditer(html):
+            text = match.group(1)
+            if not any(marker in text for marker in _MARKERS):
+                continue
+            try:
+                yield json.loads(text)
+            except ValueError:
+                continue
+
+
+def _media_from_node(node):
+    """
+    Returns a post dictionary if node looks like a media node, else None.
+    """
+    shortcode = node.get("shortcode") or node.get("code")
+    timestamp = node.get("taken_at_timestamp") or node.get("taken_at")
+    if not isinstance(shortcode, str) or not isinstance(timestamp, (int, float)):
+        return None
+    location = node.get("location") if isinstance(node.get("location"), dict) else None
+    return {
+        "shortcode": shortcode,
+        # Grid nodes of some page versions omit the location entirely; only
+        # a node with a location key (even null) tells whether it has one
+        "location_known": "location" in node,
+        # Pinned posts are shown first in the grid regardless of their age
+        "pinned": bool(node.get("timeline_pinned_user_ids") or node.get("pinned_for_users")),
+        "taken_at": datetime.fromtimestamp(timestamp, tz=timezone.utc),
+        "location_id": location.get("pk") or location.get("id") if location else None,
+        "location_name": location.get("name") if location else None,
+        "latitude": location.get("lat") if location else None,
+        "longitude": location.get("lng") if location else None,
+    }
+
+
+def iter_media_nodes(document):
+    """
+    Walks a decoded JSON document (without recursion) and yields every media
+    node found in it.
+    """
+    stack = [document]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, dict):
+            post = _media_from_node(value)
+            if post is not None:
+                yield post
+            stack.extend(value.values())
+        elif isinstance(value, list):
+            stack.extend(value)
+
+
+def extract_posts(html):
+    """
+    Extracts all posts embedded in the page source, newest first.
+
+    The same post often appears several times (e.g. in the grid and in a
+    preloaded query); the copy carrying location details wins.
+
+    Returns:
+        list: Dictionaries with shortcode, taken_at (UTC datetime),
+        location_known, pinned, location_id, location_name, latitude and longitude.
+    """
+    posts = {}
+    for document in iter_json_blobs(html):
+        for post in iter_media_nodes(document):
+            known = posts.get(post["shortcode"])
+            if (known is None
+                    or (known["location_name"] is None and post["location_name"] is not None)
+                    or (not known["location_known"] and post["location_known"])):
+                posts[post["shortcode"]] = post
+    return sorted(posts.values(), key=lambda post: post["taken_at"], reverse=True)
+
+
+def main(argv=None):
+    paths = (argv if argv is not None else sys.argv[1:])
+    if not paths:
+        print("Usage: python -m timeline.page_data PAGE.html [PAGE.html ...]")
+        return
+    for path in paths:
+        with open(path, encoding="utf-8") as file:
+            html = file.read()
+        start = time.perf_counter()
+        posts = extract_posts(html)
+        elapsed = time.perf_counter() - start
+        print(f"{path}: {len(posts)} posts in {elapsed * 1000:.1f} ms")
+        for post in posts:
+            print(f"  {post['taken_at'].isoformat()} {post['shortcode']} {post['location_name'] or ''}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,551 @@
+"""
+Inverted index of hashtags, caption words and locations across archived profiles.
+
+main5's catalogs (``<username>.csv``) and instaloader's dump directories hold
+the captions of every archived post, but answering "which posts used
+#uttarakhand near date X" from them means rescanning every file. This module
+builds one index over all of them and answers such queries from memory-mapped
+arrays, without loading the index into RAM.
+
+Posts are numbered in timestamp order, so every posting list (the ascending
+post numbers of one term) is also sorted by time: a date range is a slice of
+each list found by binary search, and terms are combined by intersecting the
+shortest list with the others.
+
+Terms are ``#tag`` for hashtags, ``@word`` for the words of the location name
+and plain lowercased words for the caption (hashtag words included, so
+``uttarakhand`` also finds ``#uttarakhand``).
+
+An index directory holds numpy ``.npy`` files, opened with mmap_mode="r":
+
+    taken_at        int64 Unix seconds, ascending; a post's number is its position
+    mediaid         int64
+    user            uint32 into the users table
+    location        int32 into the locations table, -1 for none
+    latitude/longitude  float64, NaN when unknown
+    postings        uint32 post numbers, one ascending run per term
+    term_offsets    int64, run i is postings[term_offsets[i]:term_offsets[i + 1]]
+    terms, users, locations (+ ``_offsets``)  sorted UTF-8 string tables
+
+and ``meta.json``. The index is rebuilt as a whole from its sources and
+swapped in place of the old one, so readers never see a partial index.
+
+Usage:
+  python -m timeline.post_index build SOURCE [SOURCE ...] [-o post_index]
+  python -m timeline.post_index query [TERM ...] [--index post_index] [--location NAME] [--user USERNAME]
+                                      [--since 2023-01-01] [--until 2023-12-31] [--limit 20]
+"""
+
+import argparse
+import csv
+import json
+import lzma
+import math
+import os
+import re
+import shutil
+import sys
+import time
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timezone
+
+import numpy as np
+
+from timeline.date_range import parse_date
+from timeline.dump_ingest import iter_dump_files, node_caption, node_to_row
+from timeline.instagram import caption_hashtags, mediaid_to_shortcode
+from timeline.records import record_type
+
+DEFAULT_DIR = "post_index"
+FORMAT_VERSION = 1
+
+_WORD = re.compile(r"\w+")
+
+# Placeholders the scripts write for missing values
+_MISSING = {None, "", "N/A", "Unknown"}
+
+_ARRAYS = ("taken_at", "mediaid", "user", "location", "latitude", "longitude", "postings", "term_offsets")
+_TABLES = ("terms", "users", "locations")
+
+# One query result
+PostHit = record_type("PostHit", ("username", "shortcode", "url", "taken_at", "location_name",
+                                  "latitude", "longitude"))
+
+
+def post_terms(caption=None, hashtags=None, location_name=None):
+    """
+    Returns the set of index terms of a post. Hashtags are taken from the
+    caption if not given.
+    """
+    terms = set(_WORD.findall(caption.lower())) if caption else set()
+    if hashtags is None:
+        hashtags = caption_hashtags(caption)
+    terms.update("#" + tag.lower() for tag in hashtags if tag)
+    if location_name not in _MISSING:
+        terms.update("@" + word for word in _WORD.findall(location_name.lower()))
+    return terms
+
+
+def query_terms(text):
+    """
+    Splits one query term into index terms: "#tag" is a hashtag, "@place"
+    the words of a location name, anything else caption words.
+    """
+    text = text.strip().lower()
+    if text.startswith("#"):
+        return ["#" + text[1:]] if len(text) > 1 else []
+    if text.startswith("@"):
+        return ["@" + word for word in _WORD.findall(text[1:])]
+    return _WORD.findall(text)
+
+
+def iter_catalog_csv(path, username=None):
+    """
+    Yields the posts of a main5 catalog CSV. The username defaults to the
+    file name (main5 writes ``<username>.csv``). Rows without a date are
+    skipped.
+    """
+    username = username or os.path.splitext(os.path.basename(path))[0]
+    with open(path, newline="", encoding="utf-8") as file:
+        for row in csv.DictReader(file):
+            try:
+                mediaid = int(row["Post ID"])
+                taken_at = datetime.strptime(f"{row['Date']} {row['Time']}", "%d/%m/%Y %H:%M:%S")
+            except (KeyError, TypeError, ValueError):
+                continue
+            hashtags = row.get("Hashtags")
+            caption = row.get("Description")
+            yield {
+                "username": username,
+                "mediaid": mediaid,
+                "taken_at": int(taken_at.replace(tzinfo=timezone.utc).timestamp()),
+                "location_name": row.get("Location"),
+                "latitude": None,
+                "longitude": None,
+                "hashtags": [] if hashtags in _MISSING else [tag.strip() for tag in hashtags.split(",")],
+                "caption": None if caption in _MISSING else caption,
+            }
+
+
+def iter_dump_posts(dump_dir):
+    """
+    Yields the posts of an instaloader dump directory from its
+    ``.json.xz`` metadata files.
+    """
+    fallback_username = os.path.basename(os.path.normpath(dump_dir))
+    for path in iter_dump_files(dump_dir):
+        try:
+            with lzma.open(path, "rb") as file:
+                data = json.load(file)
+            if data.get("instaloader", {}).get("node_type", "Post") != "Post":
+                continue
+            node = data["node"]
+            row = node_to_row(node)
+        except (OSError, lzma.LZMAError, ValueError, KeyError) as e:
+            print(f"Error reading {path}: {e}", file=sys.stderr)
+            continue
+        if row["taken_at"] is None:
+            continue
+        yield {
+            "username": row["username"] or fallback_username,
+            "mediaid": row["mediaid"],
+            "taken_at": int(row["taken_at"].timestamp()),
+            "location_name": row["location_name"],
+            "latitude": row["latitude"],
+            "longitude": row["longitude"],
+            "hashtags": None,
+            "caption": node_caption(node),
+        }
+
+
+def iter_source(path):
+    """
+    Yields the posts of a dump directory or a catalog CSV.
+    """
+    if os.path.isdir(path):
+        return iter_dump_posts(path)
+    return iter_catalog_csv(path)
+
+
+def _sorted_table(table):
+    """
+    Sorts the strings of a {string: id} table by their UTF-8 bytes. Returns
+    the sorted strings and an array mapping old ids to new ones.
+    """
+    names = list(table)
+    encoded = [name.encode("utf-8") for name in names]
+    order = sorted(range(len(names)), key=encoded.__getitem__)
+    remap = np.empty(len(names), dtype=np.int64)
+    remap[order] = np.arange(len(names))
+    return [encoded[i] for i in order], remap
+
+
+def _save_strings(directory, name, encoded):
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    np.save(os.path.join(directory, f"{name}.npy"), np.frombuffer(b"".join(encoded), dtype=np.uint8))
+    np.save(os.path.join(directory, f"{name}_offsets.npy"), offsets)
+
+
+class PostIndexBuilder:
+    """
+    Collects posts in compact arrays and writes them out as an index
+    directory. A post seen again (same media id) is ignored.
+    """
+
+    def __init__(self):
+        self._taken_at = array("q")
+        self._mediaid = array("q")
+        self._user = array("I")
+        self._location = array("i")
+        self._latitude = array("d")
+        self._longitude = array("d")
+        # Term ids of all posts back to back, and how many belong to each post
+        self._term_ids = array("I")
+        self._term_counts = array("I")
+        self._seen = set()
+        self._terms = {}
+        self._users = {}
+        self._locations = {}
+        self.stats = {"posts": 0, "duplicates": 0, "postings": 0}
+
+    @staticmethod
+    def _intern(table, value):
+        ident = table.get(value)
+        if ident is None:
+            ident = table[value] = len(table)
+        return ident
+
+    def add(self, post):
+        """
+        Adds one post: a dict with username, mediaid, taken_at (Unix
+        seconds), location_name, latitude, longitude, hashtags (None to take
+        them from the caption) and caption.
+        """
+        if post["mediaid"] in self._seen:
+            self.stats["duplicates"] += 1
+            return
+        self._seen.add(post["mediaid"])
+        location_name = post.get("location_name")
+        terms = post_terms(post.get("caption"), post.get("hashtags"), location_name)
+        latitude, longitude = post.get("latitude"), post.get("longitude")
+
+        self._taken_at.append(post["taken_at"])
+        self._mediaid.append(post["mediaid"])
+        self._user.append(self._intern(self._users, post["username"]))
+        self._location.append(-1 if location_name in _MISSING else self._intern(self._locations, location_name))
+        self._latitude.append(math.nan if latitude is None else latitude)
+        self._longitude.append(math.nan if longitude is None else longitude)
+        self._term_ids.extend(self._intern(self._terms, term) for term in terms)
+        self._term_counts.append(len(terms))
+        self.stats["posts"] += 1
+        self.stats["postings"] += len(terms)
+
+    def write(self, directory=DEFAULT_DIR, sources=()):
+        """
+        Writes the index to directory, replacing any index already there.
+        """
+        count = len(self._taken_at)
+        taken_at = np.frombuffer(self._taken_at, dtype=np.int64)
+        order = np.argsort(taken_at, kind="stable")
+        number = np.empty(count, dtype=np.int64)
+        number[order] = np.arange(count)
+
+        terms, term_remap = _sorted_table(self._terms)
+        users, user_remap = _sorted_table(self._users)
+        locations, location_remap = _sorted_table(self._locations)
+
+        # Sort the (term, post) pairs, encoded as term * count + post, by term
+        # and then post number; each term's run starts at term * count
+        stride = max(count, 1)
+        pairs = term_remap[np.frombuffer(self._term_ids, dtype=np.uint32)] * stride
+        pairs += np.repeat(number, np.frombuffer(self._term_counts, dtype=np.uint32))
+        pairs.sort()
+        term_offsets = np.searchsorted(pairs, np.arange(len(terms) + 1) * stride)
+        postings = (pairs % stride).astype(np.uint32)
+        del pairs
+
+        location = np.frombuffer(self._location, dtype=np.int32)
+        if len(locations):
+            location = np.where(location >= 0, location_remap[np.maximum(location, 0)], -1)
+        arrays = {
+            "taken_at": taken_at[order],
+            "mediaid": np.frombuffer(self._mediaid, dtype=np.int64)[order],
+            "user": user_remap[np.frombuffer(self._user, dtype=np.uint32)][order].astype(np.uint32),
+            "location": location[order].astype(np.int32),
+            "latitude": np.frombuffer(self._latitude, dtype=np.float64)[order],
+            "longitude": np.frombuffer(self._longitude, dtype=np.float64)[order],
+            "postings": postings,
+            "term_offsets": term_offsets.astype(np.int64),
+        }
+
+        tmp_dir = f"{directory}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for name, values in arrays.items():
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), values)
+        for name, encoded in zip(_TABLES, (terms, users, locations)):
+            _save_strings(tmp_dir, name, encoded)
+        with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as file:
+            json.dump({"version": FORMAT_VERSION, "posts": count, "terms": len(terms), "users": len(users),
+                       "built_at": time.time(), "sources": [os.path.abspath(source) for source in sources]},
+                      file, indent=2)
+
+        old_dir = f"{directory}.old"
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.exists(directory):
+            os.rename(directory, old_dir)
+        os.rename(tmp_dir, directory)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def build_index(sources, directory=DEFAULT_DIR):
+    """
+    Builds an index from catalog CSVs and dump directories and returns the
+    builder's stats. Dump directories are read first: they carry the
+    coordinates the catalogs lack, and the first copy of a post wins.
+    """
+    sources = sorted(sources, key=lambda source: not os.path.isdir(source))
+    builder = PostIndexBuilder()
+    for source in sources:
+        for post in iter_source(source):
+            builder.add(post)
+    builder.write(directory, sources)
+    return builder.stats
+
+
+class _StringTable:
+    """
+    A sorted, memory-mapped table of UTF-8 strings.
+    """
+
+    def __init__(self, directory, name):
+        self._blob = np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+        self._offsets = np.load(os.path.join(directory, f"{name}_offsets.npy"), mmap_mode="r")
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def _bytes(self, i):
+        return self._blob[self._offsets[i]:self._offsets[i + 1]].tobytes()
+
+    def __getitem__(self, i):
+        return self._bytes(i).decode("utf-8")
+
+    def find(self, value):
+        """
+        Returns the position of value, or -1.
+        """
+        target = value.encode("utf-8")
+        keys = _TableKeys(self)
+        i = bisect_left(keys, target)
+        return i if i < len(self) and keys[i] == target else -1
+
+
+class _TableKeys:
+    # Sequence view of a table's raw bytes for bisect
+    def __init__(self, table):
+        self._table = table
+
+    def __len__(self):
+        return len(self._table)
+
+    def __getitem__(self, i):
+        return self._table._bytes(i)
+
+
+def _intersect(small, large):
+    """
+    Intersects two ascending arrays in O(len(small) * log(len(large))).
+    """
+    positions = np.searchsorted(large, small)
+    positions[positions == len(large)] = len(large) - 1
+    return small[large[positions] == small]
+
+
+def _unix(value, end_of_day=False):
+    if value is None:
+        return None
+    return int(parse_date(value, end_of_day=end_of_day).replace(tzinfo=timezone.utc).timestamp())
+
+
+class PostIndex:
+    """
+    Queries an index directory. Opening it reads meta.json only; the arrays
+    are memory mapped and paged in as queries touch them.
+    """
+
+    def __init__(self, directory=DEFAULT_DIR):
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as file:
+            self.meta = json.load(file)
+        if self.meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"{directory} has index format {self.meta.get('version')}, expected {FORMAT_VERSION}")
+        for name in _ARRAYS:
+            setattr(self, f"_{name}", np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r"))
+        self.terms = _StringTable(directory, "terms")
+        self.users = _StringTable(directory, "users")
+        self.locations = _StringTable(directory, "locations")
+
+    def __len__(self):
+        return len(self._taken_at)
+
+    def postings(self, term):
+        """
+        Returns the ascending post numbers of an index term.
+        """
+        i = self.terms.find(term)
+        if i < 0:
+            return np.empty(0, dtype=np.uint32)
+        return self._postings[self._term_offsets[i]:self._term_offsets[i + 1]]
+
+    def match(self, terms=(), location=None, username=None, since=None, until=None, bbox=None):
+        """
+        Returns the ascending (oldest first) post numbers matching all of the
+        given conditions.
+
+        Args:
+            terms (list): Query terms, see query_terms(); all must match.
+            location (str): Words that must all occur in the location name.
+            username (str): Only this account's posts.
+            since, until: Date range (datetimes or strings, see
+                timeline.date_range.parse_date); until is inclusive.
+            bbox (tuple): (south, west, north, east) in degrees; posts
+                without coordinates never match.
+        """
+        empty = np.empty(0, dtype=np.int64)
+        low, high = 0, len(self)
+        if since is not None:
+            low = int(np.searchsorted(self._taken_at, _unix(since), "left"))
+        if until is not None:
+            high = int(np.searchsorted(self._taken_at, _unix(until, end_of_day=True), "right"))
+        if low >= high:
+            return empty
+
+        # A given term without index terms ("#", "!!") matches nothing
+        index_terms = []
+        for text in list(terms) + (["@" + location] if location else []):
+            found = query_terms(text)
+            if not found:
+                return empty
+            index_terms += found
+        lists = []
+        for term in dict.fromkeys(index_terms):
+            posting = self.postings(term)
+            posting = posting[np.searchsorted(posting, low):np.searchsorted(posting, high)]
+            if not len(posting):
+                return empty
+            lists.append(posting)
+
+        user = None
+        if username is not None:
+            user = self.users.find(username)
+            if user < 0:
+                return empty
+
+        if lists:
+            lists.sort(key=len)
+            posts = np.asarray(lists[0], dtype=np.int64)
+            for posting in lists[1:]:
+                posts = _intersect(posts, posting)
+                if not len(posts):
+                    return empty
+            if user is not None:
+                posts = posts[self._user[posts] == user]
+        elif user is not None:
+            posts = np.flatnonzero(self._user[low:high] == user) + low
+        else:
+            posts = np.arange(low, high)
+
+        if bbox is not None:
+            south, west, north, east = bbox
+            latitude, longitude = self._latitude[posts], self._longitude[posts]
+            posts = posts[(latitude >= south) & (latitude <= north) & (longitude >= west) & (longitude <= east)]
+        return posts
+
+    def count(self, terms=(), **conditions):
+        """
+        Returns the number of posts matching, see match().
+        """
+        return len(self.match(terms, **conditions))
+
+    def search(self, terms=(), limit=None, newest_first=True, **conditions):
+        """
+        Returns the matching posts as PostHit records, newest first unless
+        newest_first is False. Conditions are those of match().
+        """
+        posts = self.match(terms, **conditions)
+        if newest_first:
+            posts = posts[::-1]
+        if limit is not None:
+            posts = posts[:limit]
+        return [self.hit(int(post)) for post in posts]
+
+    def hit(self, post):
+        """
+        Returns the PostHit of a post number.
+        """
+        shortcode = mediaid_to_shortcode(int(self._mediaid[post]))
+        location = int(self._location[post])
+        latitude, longitude = float(self._latitude[post]), float(self._longitude[post])
+        return PostHit(
+            self.users[int(self._user[post])],
+            shortcode,
+            f"https://www.instagram.com/p/{shortcode}/",
+            datetime.fromtimestamp(int(self._taken_at[post]), tz=timezone.utc).replace(tzinfo=None),
+            self.locations[location] if location >= 0 else None,
+            None if math.isnan(latitude) else latitude,
+            None if math.isnan(longitude) else longitude,
+        )
+
+    def close(self):
+        # Dropping the memmaps unmaps the files
+        for name in _ARRAYS:
+            setattr(self, f"_{name}", None)
+        self.terms = self.users = self.locations = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index and search archived posts by hashtag, caption and location.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Build the index from catalog CSVs and dump directories")
+    build.add_argument("sources", nargs="+", help="main5 <username>.csv files or instaloader dump directories")
+    build.add_argument("-o", "--index", default=DEFAULT_DIR, help="Index directory")
+    query = commands.add_parser("query", help="Print matching posts as CSV, newest first")
+    query.add_argument("terms", nargs="*", help="#hashtag, @location word or caption word; all must match")
+    query.add_argument("--index", default=DEFAULT_DIR, help="Index directory")
+    query.add_argument("--location", help="Words of the location name")
+    query.add_argument("--user", help="Only this account's posts")
+    query.add_argument("--since", help="Only posts since this date (YYYY-MM-DD) or age (e.g. 30d)")
+    query.add_argument("--until", help="Only posts until this date (YYYY-MM-DD)")
+    query.add_argument("--bbox", type=float, nargs=4, metavar=("SOUTH", "WEST", "NORTH", "EAST"))
+    query.add_argument("--limit", type=int, default=100)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        start = time.perf_counter()
+        stats = build_index(args.sources, args.index)
+        print(f"Indexed {stats['posts']} posts ({stats['postings']} postings, {stats['duplicates']} duplicates "
+              f"skipped) into {args.index} in {time.perf_counter() - start:.1f}s.")
+        return
+
+    with PostIndex(args.index) as index:
+        start = time.perf_counter()
+        hits = index.search(args.terms, limit=args.limit, location=args.location, username=args.user,
+                            since=args.since, until=args.until, bbox=args.bbox)
+        elapsed = time.perf_counter() - start
+        writer = csv.writer(sys.stdout)
+        writer.writerow(PostHit.KEYS)
+        writer.writerows(hit.values() for hit in hits)
+    print(f"{len(hits)} posts in {elapsed * 1000:.1f} ms.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
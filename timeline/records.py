@@ -0,0 +1,152 @@
+"""
+Compact post records and chunked writers for streaming timelines.
+
+The collectors used to build a list with one dict per post and hand it to
+pandas at the end, holding every row (and a DataFrame copy) in memory. Here
+a row is a record with ``__slots__`` (roughly a third of a dict's size) that
+still supports the dict operations the scripts use (``row["url"]``,
+``row.get(...)``, ``row[key] = value``), and the writers consume any
+iterable of records in fixed-size chunks, so rows reach the disk while the
+crawl is still running.
+
+Columns added later (e.g. geocode's city/region/country) are kept in a small
+dict created only for the records that get them.
+"""
+
+import csv
+import re
+from itertools import islice
+
+CHUNK_SIZE = 1000
+# write_csv's first chunk; chunks then double up to CHUNK_SIZE, so the first
+# rows of a slow crawl reach the disk right away
+FIRST_CHUNK_SIZE = 1
+
+
+class Record:
+    """
+    Base class of the record types made by record_type().
+    """
+
+    __slots__ = ("_extra",)
+    KEYS = ()
+    _SLOTS = {}
+
+    def __init__(self, *args, **kwargs):
+        self._extra = None
+        for slot in self._SLOTS.values():
+            setattr(self, slot, None)
+        for key, value in zip(self.KEYS, args):
+            setattr(self, self._SLOTS[key], value)
+        for key, value in kwargs.items():
+            self[key] = value
+
+    def __getitem__(self, key):
+        slot = self._SLOTS.get(key)
+        if slot is not None:
+            return getattr(self, slot)
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        slot = self._SLOTS.get(key)
+        if slot is not None:
+            setattr(self, slot, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __contains__(self, key):
+        return key in self._SLOTS or (self._extra is not None and key in self._extra)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return list(self.KEYS) + (list(self._extra) if self._extra else [])
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def as_dict(self):
+        return dict(self.items())
+
+    @classmethod
+    def from_dict(cls, row):
+        return cls(**row)
+
+    def __eq__(self, other):
+        if isinstance(other, (Record, dict)):
+            return self.as_dict() == dict(other.items())
+        return NotImplemented
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.as_dict()!r})"
+
+
+def record_type(name, keys):
+    """
+    Makes a Record subclass with one slot per key. Keys need not be
+    identifiers ("Post URL"); slot names are derived from them.
+    """
+    slots = {key: "_" + re.sub(r"\W", "_", key.lower()) for key in keys}
+    return type(name, (Record,), {"__slots__": tuple(slots.values()), "KEYS": tuple(keys), "_SLOTS": slots})
+
+
+# main4's rows
+PostRecord = record_type("PostRecord", ("date", "url", "location_name", "latitude", "longitude"))
+
+
+def iter_chunks(records, size=CHUNK_SIZE, first_size=None):
+    """
+    Yields lists of at most size records. With first_size, the first list
+    has at most first_size records and each following one twice as many,
+    up to size.
+    """
+    iterator = iter(records)
+    current = min(first_size or size, size)
+    while True:
+        chunk = list(islice(iterator, current))
+        if not chunk:
+            return
+        yield chunk
+        current = min(current * 2, size)
+
+
+def _cell(value):
+    return "" if value is None else value
+
+
+def write_csv(records, path, fieldnames=None, chunk_size=CHUNK_SIZE):
+    """
+    Writes records (or dicts) to a CSV file chunk by chunk, flushing after
+    each chunk. Chunks start at FIRST_CHUNK_SIZE rows and grow to
+    chunk_size, so the header and first row are on disk as soon as the
+    first record arrives. The header is taken from the first record if
+    fieldnames is None. Values are written as pandas' to_csv wrote them (None as empty).
+
+    Returns:
+        int: Number of rows written.
+    """
+    count = 0
+    with open(path, mode="w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        for chunk in iter_chunks(records, chunk_size, FIRST_CHUNK_SIZE):
+            if fieldnames is None:
+                fieldnames = list(chunk[0].keys())
+            if count == 0:
+                writer.writerow(fieldnames)
+            writer.writerows([[_cell(row.get(name)) for name in fieldnames] for row in chunk])
+            file.flush()
+            count += len(chunk)
+        if count == 0 and fieldnames:
+            writer.writerow(fieldnames)
+    return count
@@ -0,0 +1,153 @@
+"""
+Headless, aggregated rendering of location timelines.
+
+main3.visualize_timeline draws one marker per post on a categorical axis and
+calls plt.show(), which blocks on a server and becomes unreadable past a few
+thousand posts. TimelineRenderer instead:
+
+- draws on an Agg canvas (matplotlib.figure.Figure, no pyplot, no display),
+- aggregates posts per time bucket and location before drawing, keeping the
+  top locations and folding the rest into "Other", with the marker size
+  showing the number of posts,
+- reuses one figure for every profile, so batches of thousands of profiles
+  render in one process,
+- writes PNG, SVG and/or a standalone HTML page to the output directory.
+"""
+
+import html
+import io
+import os
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from timeline.date_range import utc_datetime64
+
+TOP_LOCATIONS = 25
+OTHER = "Other"
+UNKNOWN = "Unknown"
+
+# numpy datetime64 units used as time buckets
+BUCKETS = {"day": "D", "week": "W", "month": "M", "year": "Y"}
+
+
+def choose_bucket(dates):
+    """
+    Picks a bucket size that keeps the number of columns readable.
+    """
+    if len(dates) < 2:
+        return "day"
+    span_days = (dates.max() - dates.min()).astype("timedelta64[D]").astype(np.int64)
+    if span_days <= 120:
+        return "day"
+    if span_days <= 3 * 365:
+        return "week"
+    if span_days <= 30 * 365:
+        return "month"
+    return "year"
+
+
+def aggregate_timeline(dates, locations, bucket=None, top=TOP_LOCATIONS):
+    """
+    Counts posts per (time bucket, location).
+
+    Args:
+        dates: Post dates (datetimes, ISO strings or datetime64).
+        locations: Location names; None/empty become "Unknown".
+        bucket (str): "day", "week", "month" or "year"; chosen from the
+            time span if None.
+        top (int): Number of locations drawn individually.
+
+    Returns:
+        tuple: (bucket_starts, location_codes, counts, labels, bucket) where
+        location_codes index labels.
+    """
+    dates = utc_datetime64(dates)
+    names = np.array([location if location not in (None, "", "nan") else UNKNOWN
+                      for location in locations], dtype=object)
+    bucket = bucket or choose_bucket(dates)
+    starts = dates.astype(f"datetime64[{BUCKETS[bucket]}]")
+
+    # Most frequent locations first; the rest share one row
+    labels, codes, totals = np.unique(names.astype(str), return_inverse=True, return_counts=True)
+    ranking = np.argsort(-totals, kind="stable")
+    if len(labels) > top:
+        keep = ranking[:top - 1]
+        rank_of = np.full(len(labels), top - 1)
+        rank_of[keep] = np.arange(top - 1)
+        labels = [str(label) for label in labels[keep]] + [OTHER]
+    else:
+        rank_of = np.empty(len(labels), dtype=np.int64)
+        rank_of[ranking] = np.arange(len(labels))
+        labels = [str(label) for label in labels[ranking]]
+    codes = rank_of[codes]
+
+    pairs = np.rec.fromarrays([starts.astype(np.int64), codes], names="start,code")
+    unique_pairs, counts = np.unique(pairs, return_counts=True)
+    bucket_starts = unique_pairs["start"].astype(f"datetime64[{BUCKETS[bucket]}]")
+    return bucket_starts, unique_pairs["code"], counts, labels, bucket
+
+
+class TimelineRenderer:
+    """
+    Renders timeline charts into output_dir, reusing one Agg figure.
+
+    Args:
+        output_dir (str): Where the charts are written.
+        formats (tuple): Any of "png", "svg" and "html".
+        size (tuple): Figure size in inches.
+        dpi (int): Resolution of PNG output.
+    """
+
+    def __init__(self, output_dir, formats=("png",), size=(10, 6), dpi=100):
+        self.output_dir = output_dir
+        self.formats = formats
+        self.dpi = dpi
+        os.makedirs(output_dir, exist_ok=True)
+        self.figure = Figure(figsize=size)
+        self.canvas = FigureCanvasAgg(self.figure)
+        self.axes = self.figure.add_subplot()
+        # Fixed margins; tight_layout per chart costs more than the drawing
+        self.figure.subplots_adjust(left=0.25, right=0.97, bottom=0.18, top=0.92)
+
+    def render(self, name, dates, locations, bucket=None, title=None):
+        """
+        Draws one timeline and writes it in every configured format.
+
+        Returns:
+            list: Paths of the written files.
+        """
+        axes = self.axes
+        axes.clear()
+        if len(dates):
+            starts, codes, counts, labels, bucket = aggregate_timeline(dates, locations, bucket)
+            sizes = 20 + 80 * np.sqrt(counts / counts.max())
+            axes.scatter(starts, codes, s=sizes, alpha=0.7)
+            axes.set_yticks(range(len(labels)))
+            axes.set_yticklabels(labels, fontsize=8)
+            axes.set_ylim(len(labels) - 0.5, -0.5)
+            axes.set_xlabel(f"Date (per {bucket})")
+        axes.set_title(title or f"Instagram Location Timeline: {name}")
+        axes.set_ylabel("Location Name")
+        axes.tick_params(axis="x", labelrotation=45)
+
+        paths = []
+        for fmt in self.formats:
+            path = os.path.join(self.output_dir, f"{name}.{fmt}")
+            if fmt == "html":
+                self._write_html(path, name)
+            else:
+                self.figure.savefig(path, format=fmt, dpi=self.dpi)
+            paths.append(path)
+        return paths
+
+    def _write_html(self, path, name):
+        buffer = io.StringIO()
+        self.figure.savefig(buffer, format="svg")
+        svg = buffer.getvalue()
+        svg = svg[svg.index("<svg"):]
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(f"<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\">"
+                       f"<title>{html.escape(name)}</title></head>\n<body>\n{svg}\n</body></html>\n")
+
@@ -0,0 +1,258 @@
+"""
+Stay/trip segmentation of location timelines.
+
+The timelines written by main3/main4 are flat (date, location) rows. This
+module turns them into stays (runs of posts close to each other in space
+that last at least a minimum dwell time) and trips (everything in between),
+using consecutive-point haversine distances and time gaps computed with NumPy.
+The work is linear in the number of posts; Python only loops over segments.
+
+Segmentation is incremental: TimelineSegmenter keeps the finished segments
+and only re-evaluates the last one when new posts are appended.
+
+Usage:
+  python -m timeline.segments location_timeline.csv [--radius-km 25] [--min-dwell-hours 0]
+"""
+
+import argparse
+import csv
+import sys
+
+import numpy as np
+
+from timeline.date_range import utc_datetime64
+from timeline.geocode import haversine_km
+
+STAY_RADIUS_KM = 25.0
+MIN_DWELL_SECONDS = 0
+MIN_STAY_POSTS = 1
+MAX_GAP_SECONDS = 90 * 24 * 3600
+
+_DATE_COLUMNS = ("date", "Date", "taken_at", "timestamp")
+# main4/batch/dump rows use lower case, main3's save_timeline title case
+_LATITUDE_COLUMNS = ("latitude", "Latitude")
+_LONGITUDE_COLUMNS = ("longitude", "Longitude")
+
+
+def _float_array(values):
+    result = np.full(len(values), np.nan)
+    for i, value in enumerate(values):
+        try:
+            result[i] = float(value)
+        except (TypeError, ValueError):
+            pass
+    return result
+
+
+def timeline_arrays(frame):
+    """
+    Extracts (seconds, latitudes, longitudes) from a timeline, sorted by time.
+
+    frame is anything indexable by column name (a pandas DataFrame, a dict of
+    lists) with a date column and latitude/longitude. Rows without coordinates
+    ('Unknown' in main4's CSV) are dropped.
+
+    Raises:
+        ValueError: If the date or a coordinate column is missing, e.g. in
+            a main3 CSV written before it had coordinates.
+    """
+    found = [next((column for column in candidates if column in frame), None)
+             for candidates in (_DATE_COLUMNS, _LATITUDE_COLUMNS, _LONGITUDE_COLUMNS)]
+    missing = [" or ".join(candidates) for candidates, column
+               in zip((_DATE_COLUMNS, _LATITUDE_COLUMNS, _LONGITUDE_COLUMNS), found) if column is None]
+    if missing:
+        raise ValueError(f"timeline has no {', '.join(missing)} column")
+    date_column, latitude_column, longitude_column = found
+    seconds = utc_datetime64(list(frame[date_column])).astype(np.int64)
+    latitudes = _float_array(list(frame[latitude_column]))
+    longitudes = _float_array(list(frame[longitude_column]))
+    keep = ~(np.isnan(latitudes) | np.isnan(longitudes))
+    order = np.argsort(seconds[keep], kind="stable")
+    return seconds[keep][order], latitudes[keep][order], longitudes[keep][order]
+
+
+def read_timeline_csv(path):
+    """
+    Reads a timeline CSV (save_to_csv / save_timeline output) into a dict of
+    column lists.
+    """
+    with open(path, newline="", encoding="utf-8") as file:
+        reader = csv.DictReader(file)
+        columns = {name: [] for name in reader.fieldnames}
+        for row in reader:
+            for name in columns:
+                columns[name].append(row[name])
+    return columns
+
+
+def segment_points(seconds, latitudes, longitudes, radius_km=STAY_RADIUS_KM,
+                   min_dwell=MIN_DWELL_SECONDS, min_posts=MIN_STAY_POSTS, max_gap=MAX_GAP_SECONDS):
+    """
+    Partitions time-sorted points into stay and trip segments.
+
+    Consecutive points further apart than radius_km, or with a time gap over
+    max_gap seconds, start a new run. Runs lasting at least min_dwell seconds
+    with at least min_posts posts are stays; consecutive other runs are merged
+    into trips.
+
+    Returns:
+        list: Segment dictionaries with kind ("stay" or "trip"), start_index,
+        end_index (inclusive), start, end (Unix seconds), posts, latitude and
+        longitude (centroid), distance_km (path length within the segment),
+        and the coordinates of the first and last point.
+    """
+    count = len(seconds)
+    if not count:
+        return []
+
+    hop_km = np.zeros(count)
+    hop_km[1:] = haversine_km(latitudes[:-1], longitudes[:-1], latitudes[1:], longitudes[1:])
+    gap = np.zeros(count, dtype=np.int64)
+    gap[1:] = np.diff(seconds)
+
+    # Runs of nearby posts
+    run_starts = np.flatnonzero(np.r_[True, (hop_km[1:] > radius_km) | (gap[1:] > max_gap)])
+    run_ends = np.r_[run_starts[1:] - 1, count - 1]
+    run_is_stay = ((seconds[run_ends] - seconds[run_starts] >= min_dwell)
+                   & (run_ends - run_starts + 1 >= min_posts))
+
+    # Segments: every stay run on its own, consecutive non-stay runs together
+    run_label = np.where(run_is_stay, np.arange(len(run_starts)), -1)
+    new_segment = np.r_[True, run_label[1:] != run_label[:-1]]
+    segment_starts = run_starts[new_segment]
+    segment_ends = np.r_[segment_starts[1:] - 1, count - 1]
+    segment_is_stay = run_is_stay[new_segment]
+
+    # Per segment aggregates with reduceat over the point arrays
+    posts = segment_ends - segment_starts + 1
+    mean_latitudes = np.add.reduceat(latitudes, segment_starts) / posts
+    mean_longitudes = np.add.reduceat(longitudes, segment_starts) / posts
+    inner_hops = hop_km.copy()
+    inner_hops[segment_starts] = 0.0
+    distances = np.add.reduceat(inner_hops, segment_starts)
+
+    return [
+        {
+            "kind": "stay" if is_stay else "trip",
+            "start_index": int(start),
+            "end_index": int(end),
+            "start": int(seconds[start]),
+            "end": int(seconds[end]),
+            "posts": int(n),
+            "latitude": float(lat),
+            "longitude": float(lng),
+            "distance_km": float(distance),
+            "first_point": (float(latitudes[start]), float(longitudes[start])),
+            "last_point": (float(latitudes[end]), float(longitudes[end])),
+        }
+        for is_stay, start, end, n, lat, lng, distance in zip(
+            segment_is_stay, segment_starts, segment_ends, posts, mean_latitudes, mean_longitudes, distances)
+    ]
+
+
+def link_segments(segments):
+    """
+    Returns the segments with the moves between them made explicit: a trip
+    with no posts is inserted between two consecutive stays, and the hops
+    into and out of each trip are added to its distance.
+    """
+    linked = []
+    previous = None
+    for segment in segments:
+        if previous is not None:
+            hop = float(haversine_km(*previous["last_point"], *segment["first_point"]))
+            if previous["kind"] == "stay" and segment["kind"] == "stay":
+                linked.append({
+                    "kind": "trip", "start_index": previous["end_index"], "end_index": segment["start_index"],
+                    "start": previous["end"], "end": segment["start"], "posts": 0,
+                    "latitude": (previous["last_point"][0] + segment["first_point"][0]) / 2,
+                    "longitude": (previous["last_point"][1] + segment["first_point"][1]) / 2,
+                    "distance_km": hop,
+                    "first_point": previous["last_point"], "last_point": segment["first_point"],
+                })
+            elif segment["kind"] == "trip":
+                segment = {**segment, "distance_km": segment["distance_km"] + hop}
+            else:
+                # The hop into a stay belongs to the trip before it
+                linked[-1] = {**previous, "distance_km": previous["distance_km"] + hop}
+        linked.append(segment)
+        previous = segment
+    return linked
+
+
+class TimelineSegmenter:
+    """
+    Incremental segmentation: append posts as they arrive, oldest first.
+
+    Only the points of the last segment are kept around; a segment before it
+    can no longer change, because the run break that ended it depends only
+    on the two points around it.
+    """
+
+    def __init__(self, radius_km=STAY_RADIUS_KM, min_dwell=MIN_DWELL_SECONDS,
+                 min_posts=MIN_STAY_POSTS, max_gap=MAX_GAP_SECONDS):
+        self.options = {"radius_km": radius_km, "min_dwell": min_dwell,
+                        "min_posts": min_posts, "max_gap": max_gap}
+        self.finished = []
+        self.tail = []
+        self._offset = 0
+        self._tail_points = (np.empty(0, dtype=np.int64), np.empty(0), np.empty(0))
+
+    def append(self, seconds, latitudes, longitudes):
+        """
+        Adds points (arrays sorted by time, all newer than the points seen so
+        far) and re-evaluates the tail segment.
+        """
+        points = [np.concatenate([old, np.asarray(new, dtype=old.dtype)])
+                  for old, new in zip(self._tail_points, (seconds, latitudes, longitudes))]
+        segments = segment_points(*points, **self.options)
+        for segment in segments:
+            segment["start_index"] += self._offset
+            segment["end_index"] += self._offset
+
+        # Everything but the last segment is final
+        self.finished.extend(segments[:-1])
+        self.tail = segments[-1:]
+        if self.tail:
+            cut = self.tail[0]["start_index"] - self._offset
+            self._tail_points = tuple(array[cut:] for array in points)
+            self._offset = self.tail[0]["start_index"]
+
+    def append_frame(self, frame):
+        self.append(*timeline_arrays(frame))
+
+    def segments(self, linked=True):
+        segments = self.finished + self.tail
+        return link_segments(segments) if linked else segments
+
+
+def segment_timeline(frame, **options):
+    """
+    Segments a whole timeline (a DataFrame or dict of columns).
+    """
+    return link_segments(segment_points(*timeline_arrays(frame), **options))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Split a location timeline into stays and trips.")
+    parser.add_argument("timeline", help="Timeline CSV with date and latitude/longitude columns")
+    parser.add_argument("--radius-km", type=float, default=STAY_RADIUS_KM)
+    parser.add_argument("--min-dwell-hours", type=float, default=MIN_DWELL_SECONDS / 3600)
+    parser.add_argument("--min-posts", type=int, default=MIN_STAY_POSTS)
+    args = parser.parse_args(argv)
+
+    try:
+        segments = segment_timeline(read_timeline_csv(args.timeline), radius_km=args.radius_km,
+                                    min_dwell=args.min_dwell_hours * 3600, min_posts=args.min_posts)
+    except ValueError as e:
+        print(f"Error: {args.timeline}: {e}")
+        return 1
+    for segment in segments:
+        start = np.datetime64(segment["start"], "s")
+        end = np.datetime64(segment["end"], "s")
+        print(f"{segment['kind']:5} {start} -> {end} posts={segment['posts']} "
+              f"at=({segment['latitude']:.4f}, {segment['longitude']:.4f}) distance={segment['distance_km']:.1f} km")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,481 @@
+"""
+Watch mode: keep many profiles' timelines fresh by polling for new posts only.
+
+Rerunning a crawl to pick up new posts costs a full profile walk. Watcher
+instead remembers the newest media id of every profile (in a small SQLite
+state file) and, on each poll, reads the profile's posts newest first only
+until it reaches that post. For a profile without new posts this is the
+profile request alone: the first page of posts comes with it.
+
+New posts are appended to ``<timeline_dir>/<username>.csv`` (the files
+timeline.batch writes, so a batch crawl can do the backfill) and reported as
+one JSON line each on the events stream:
+
+    {"event": "post", "username": ..., "date": ..., "url": ..., "location_name": ..., ...}
+    {"event": "error", "username": ..., "error": ..., "failures": 3}
+
+Polling is adaptive. Every profile keeps a running mean of the gap between
+its posts, and its next poll is due after POLL_FRACTION of the larger of that
+gap and its current silence, bounded by min_interval and max_interval.
+Active accounts are therefore polled often and dormant ones about every
+max_interval, while failures back off exponentially. A RateLimiter shared by
+all workers bounds the global request rate.
+
+The first poll of a profile only records its newest post, unless its
+timeline file already exists: then the first page's posts missing from the
+file are reported as new.
+
+Usage:
+  python -m timeline.watch usernames.txt [--login YOUR_USERNAME] [-o timelines] [--events events.jsonl]
+                           [--rate 60] [-w 4] [--min-interval 15m] [--max-interval 2d] [--once]
+"""
+
+import argparse
+import csv
+import heapq
+import json
+import os
+import random
+import re
+import sqlite3
+import statistics
+import sys
+import threading
+import time
+from datetime import timezone
+
+from timeline.batch import InstaloaderSessions, read_usernames
+from timeline.date_range import POSSIBLY_PINNED
+from timeline.records import PostRecord
+
+DEFAULT_STATE_PATH = "watch_state.sqlite"
+TIMELINE_DIR = "timelines"
+WORKERS = 4
+REQUESTS_PER_MINUTE = 60
+MIN_INTERVAL = 15 * 60
+MAX_INTERVAL = 2 * 24 * 3600
+# A profile is polled this many times per expected gap between its posts
+POLL_FRACTION = 0.25
+# Weight of the newest gap in the running mean
+GAP_WEIGHT = 0.3
+# Posts read on the first poll of a profile (one page)
+BASELINE_POSTS = 12
+JITTER = 0.1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS profiles (
+    username TEXT PRIMARY KEY,
+    newest_mediaid INTEGER,
+    newest_taken_at REAL,
+    mean_gap REAL,
+    next_poll REAL NOT NULL,
+    last_poll REAL,
+    polls INTEGER NOT NULL DEFAULT 0,
+    new_posts INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT
+);
+"""
+
+_DURATION = re.compile(r"^(\d+(?:\.\d+)?)\s*([smhd]?)$")
+
+
+def parse_duration(value):
+    """
+    Parses "90", "90s", "15m", "12h" or "2d" into seconds.
+    """
+    match = _DURATION.match(str(value).strip().lower())
+    if not match:
+        raise ValueError(f"Invalid duration: {value!r}")
+    return float(match[1]) * {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}[match[2]]
+
+
+def next_interval(mean_gap, newest_taken_at, now, failures=0, min_interval=MIN_INTERVAL,
+                  max_interval=MAX_INTERVAL):
+    """
+    Returns the seconds until a profile's next poll (without jitter).
+
+    Args:
+        mean_gap (float): Running mean of the gap between its posts, or None.
+        newest_taken_at (float): Unix time of its newest post, or None.
+        now (float): Current Unix time.
+        failures (int): Consecutive failed polls.
+    """
+    if failures:
+        return min(max_interval, min_interval * 2 ** failures)
+    if newest_taken_at is None:
+        return max_interval
+    expected = max(mean_gap or max_interval, now - newest_taken_at)
+    return min(max(expected * POLL_FRACTION, min_interval), max_interval)
+
+
+class RateLimiter:
+    """
+    Token bucket shared by threads: acquire() blocks until a request may be
+    made, so at most ``per_minute`` requests start per minute after an
+    initial burst of ``burst``.
+    """
+
+    def __init__(self, per_minute=REQUESTS_PER_MINUTE, burst=None):
+        self.rate = per_minute / 60
+        self.capacity = burst or max(1, per_minute // 10)
+        self.requests = 0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            self.requests += 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        # The token is reserved; sleeping outside the lock keeps the order
+        if wait:
+            time.sleep(wait)
+
+
+def limited_rate_controller(limiter):
+    """
+    Returns a rate_controller factory for instaloader.Instaloader that takes
+    a token from limiter before every query.
+    """
+    import instaloader
+
+    class LimitedRateController(instaloader.RateController):
+        def wait_before_query(self, query_type):
+            limiter.acquire()
+            super().wait_before_query(query_type)
+
+    return lambda context: LimitedRateController(context)
+
+
+class InstaloaderSource:
+    """
+    Recent posts of profiles through instaloader, one loader per worker
+    thread, logged in with sessions (an InstaloaderSessions) or anonymous.
+    """
+
+    def __init__(self, limiter, sessions=None):
+        import instaloader
+
+        self.instaloader = instaloader
+        self.limiter = limiter
+        self.sessions = sessions
+        self._local = threading.local()
+
+    def _loader(self):
+        loader = getattr(self._local, "loader", None)
+        if loader is None:
+            if self.sessions is not None:
+                loader = self.sessions.client()
+            else:
+                loader = self.instaloader.Instaloader(quiet=True,
+                                                      rate_controller=limited_rate_controller(self.limiter))
+            self._local.loader = loader
+        return loader
+
+    def recent_posts(self, username):
+        """
+        Returns the profile's posts, newest first, fetched lazily page by page.
+        """
+        profile = self.instaloader.Profile.from_username(self._loader().context, username)
+        return profile.get_posts()
+
+
+def _timestamp(post):
+    # Post.date_utc is a naive UTC datetime
+    return post.date_utc.replace(tzinfo=timezone.utc).timestamp()
+
+
+def post_row(post):
+    """
+    Returns the timeline row (main4's columns) of a post.
+    """
+    location = post.location
+    return PostRecord(post.date_utc, f"https://www.instagram.com/p/{post.shortcode}/",
+                      location.name if location else None,
+                      location.lat if location else None,
+                      location.lng if location else None)
+
+
+class WatchState:
+    """
+    Per-profile polling state in a SQLite file. Safe to share between threads.
+    """
+
+    def __init__(self, path=DEFAULT_STATE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+
+    def add(self, usernames, next_poll):
+        with self._lock:
+            self._db.executemany("INSERT OR IGNORE INTO profiles (username, next_poll) VALUES (?, ?)",
+                                 [(username, next_poll) for username in usernames])
+
+    def get(self, username):
+        with self._lock:
+            cursor = self._db.execute("SELECT * FROM profiles WHERE username = ?", (username,))
+            row = cursor.fetchone()
+            return dict(zip([column[0] for column in cursor.description], row)) if row else None
+
+    def update(self, username, **fields):
+        with self._lock:
+            self._db.execute(f"UPDATE profiles SET {', '.join(f'{name} = ?' for name in fields)} WHERE username = ?",
+                             (*fields.values(), username))
+
+    def schedule(self):
+        """
+        Returns (next_poll, username) for every profile.
+        """
+        with self._lock:
+            return self._db.execute("SELECT next_poll, username FROM profiles").fetchall()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _stored_shortcodes(path):
+    """
+    Returns the shortcodes of the posts in a timeline CSV, or None if there
+    is no such file.
+    """
+    try:
+        with open(path, newline="", encoding="utf-8") as file:
+            return {row["url"].rstrip("/").rsplit("/", 1)[-1] for row in csv.DictReader(file) if row.get("url")}
+    except FileNotFoundError:
+        return None
+
+
+class Watcher:
+    """
+    Polls profiles on their adaptive schedules from a pool of worker threads.
+
+    Args:
+        source: Object with recent_posts(username) -> newest-first iterator
+            of posts (instaloader.Post or alike).
+        state (WatchState): Polling state, also the list of watched profiles.
+        timeline_dir (str): Where ``<username>.csv`` timelines are appended to.
+        events: Text file to write JSON line events to, or None.
+        workers (int): Concurrent polls.
+        min_interval, max_interval (float): Bounds of the poll interval, seconds.
+    """
+
+    def __init__(self, source, state, timeline_dir=TIMELINE_DIR, events=None, workers=WORKERS,
+                 min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL):
+        self.source = source
+        self.state = state
+        self.timeline_dir = timeline_dir
+        self.events = events
+        self.workers = workers
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.stats = {"polls": 0, "new_posts": 0, "errors": 0}
+        self._stats_lock = threading.Lock()
+        self._events_lock = threading.Lock()
+        self._condition = threading.Condition()
+        self._stopped = False
+        os.makedirs(timeline_dir, exist_ok=True)
+
+    def add(self, usernames):
+        """
+        Starts watching usernames; profiles already watched keep their state.
+        """
+        self.state.add(usernames, time.time())
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self.stats[name] += amount
+
+    def _emit(self, event):
+        if self.events is None:
+            return
+        line = json.dumps(event, default=str)
+        with self._events_lock:
+            self.events.write(line + "\n")
+            self.events.flush()
+
+    def _append(self, username, rows):
+        path = os.path.join(self.timeline_dir, f"{username}.csv")
+        new_file = not os.path.exists(path)
+        with open(path, "a", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file)
+            if new_file:
+                writer.writerow(PostRecord.KEYS)
+            writer.writerows([["" if value is None else value for value in row.values()] for row in rows])
+
+    def poll(self, username):
+        """
+        Polls one profile: appends and reports its new posts (oldest first)
+        and schedules its next poll. Returns the new rows.
+        """
+        profile = self.state.get(username)
+        now = time.time()
+        self._count("polls")
+        try:
+            known = profile["newest_mediaid"]
+            stored = _stored_shortcodes(os.path.join(self.timeline_dir, f"{username}.csv")) if known is None else None
+            new_posts = []
+            seen = []
+            # Media ids of the posts that are or may be pinned
+            pinned_ids = set()
+            for index, post in enumerate(self.source.recent_posts(username)):
+                pinned = getattr(post, "is_pinned", None)
+                if pinned is None:
+                    pinned = index < POSSIBLY_PINNED
+                if pinned:
+                    pinned_ids.add(post.mediaid)
+                if known is None:
+                    # First poll: one page, new only if the timeline file lacks it
+                    seen.append(post)
+                    if stored is not None and post.shortcode not in stored:
+                        new_posts.append(post)
+                    if len(seen) >= BASELINE_POSTS:
+                        break
+                elif post.mediaid > known:
+                    new_posts.append(post)
+                    seen.append(post)
+                elif not pinned:
+                    break
+            new_posts.sort(key=lambda post: post.mediaid)
+            # post.location may fetch the post's page, so it can fail too
+            rows = [post_row(post) for post in new_posts]
+            if rows:
+                self._append(username, rows)
+        except Exception as e:
+            failures = profile["failures"] + 1
+            self._count("errors")
+            self.state.update(username, last_poll=now, polls=profile["polls"] + 1, failures=failures,
+                              last_error=str(e), next_poll=now + next_interval(
+                                  None, None, now, failures, self.min_interval, self.max_interval))
+            self._emit({"event": "error", "username": username, "error": str(e), "failures": failures})
+            return []
+
+        for row in rows:
+            self._emit({"event": "post", "username": username, **row.as_dict()})
+
+        newest_mediaid, newest_taken_at, mean_gap = profile["newest_mediaid"], profile["newest_taken_at"], profile["mean_gap"]
+        dated = sorted((post for post in seen if post.mediaid not in pinned_ids), key=lambda post: post.mediaid)
+        times = [_timestamp(post) for post in dated]
+        if known is None:
+            gaps = [later - earlier for earlier, later in zip(times, times[1:])]
+            mean_gap = statistics.median(gaps) if gaps else None
+        else:
+            previous = newest_taken_at
+            for taken_at in times:
+                if previous is not None and taken_at > previous:
+                    gap = taken_at - previous
+                    mean_gap = gap if mean_gap is None else GAP_WEIGHT * gap + (1 - GAP_WEIGHT) * mean_gap
+                previous = taken_at
+        if seen:
+            newest = max(seen, key=lambda post: post.mediaid)
+            if newest_mediaid is None or newest.mediaid > newest_mediaid:
+                newest_mediaid = newest.mediaid
+        if times and (newest_taken_at is None or times[-1] > newest_taken_at):
+            newest_taken_at = times[-1]
+
+        interval = next_interval(mean_gap, newest_taken_at, now, 0, self.min_interval, self.max_interval)
+        # Jitter spreads polls out but must not break the bounds
+        interval = min(max(interval * random.uniform(1 - JITTER, 1 + JITTER), self.min_interval), self.max_interval)
+        self.state.update(username, newest_mediaid=newest_mediaid, newest_taken_at=newest_taken_at,
+                          mean_gap=mean_gap, last_poll=now, next_poll=now + interval,
+                          polls=profile["polls"] + 1, new_posts=profile["new_posts"] + len(rows),
+                          failures=0, last_error=None)
+        self._count("new_posts", len(rows))
+        return rows
+
+    def _worker(self, queue, once):
+        while True:
+            with self._condition:
+                while True:
+                    if self._stopped:
+                        return
+                    now = time.time()
+                    if queue and queue[0][0] <= now:
+                        _, username = heapq.heappop(queue)
+                        break
+                    if once:
+                        return
+                    self._condition.wait(timeout=min(queue[0][0] - now, 60) if queue else 60)
+            self.poll(username)
+            if not once:
+                with self._condition:
+                    heapq.heappush(queue, (self.state.get(username)["next_poll"], username))
+                    self._condition.notify_all()
+
+    def run(self, once=False):
+        """
+        Polls profiles as they come due until stop() is called (from another
+        thread or a signal handler). With once, every profile due now is
+        polled a single time and run() returns.
+        """
+        queue = self.state.schedule()
+        heapq.heapify(queue)
+        threads = [threading.Thread(target=self._worker, args=(queue, once), name=f"watch-{i}", daemon=True)
+                   for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            self.stop()
+        return self.stats
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Poll Instagram profiles and report only their new posts.")
+    parser.add_argument("usernames", help="File with one username or profile URL per line")
+    parser.add_argument("--login", help="Account whose saved instaloader session is used (default: anonymous)")
+    parser.add_argument("--session-file", help="instaloader session file (default: instaloader's)")
+    parser.add_argument("-o", "--timeline-dir", default=TIMELINE_DIR, help="Where per-profile CSVs are appended to")
+    parser.add_argument("--events", default="-", help="JSON lines file for new-post events (default: stdout)")
+    parser.add_argument("--state", default=DEFAULT_STATE_PATH, help="Polling state database")
+    parser.add_argument("--rate", type=float, default=REQUESTS_PER_MINUTE, help="Requests per minute, all profiles")
+    parser.add_argument("-w", "--workers", type=int, default=WORKERS)
+    parser.add_argument("--min-interval", type=parse_duration, default=MIN_INTERVAL, help="e.g. 15m")
+    parser.add_argument("--max-interval", type=parse_duration, default=MAX_INTERVAL, help="e.g. 2d")
+    parser.add_argument("--once", action="store_true", help="Poll the profiles that are due, then exit")
+    args = parser.parse_args(argv)
+
+    limiter = RateLimiter(args.rate)
+    sessions = None
+    if args.login:
+        sessions = InstaloaderSessions(args.login, args.session_file,
+                                       rate_controller=limited_rate_controller(limiter))
+    source = InstaloaderSource(limiter, sessions)
+    events = sys.stdout if args.events == "-" else open(args.events, "a", encoding="utf-8")
+    try:
+        with WatchState(args.state) as state:
+            watcher = Watcher(source, state, args.timeline_dir, events, workers=args.workers,
+                              min_interval=args.min_interval, max_interval=args.max_interval)
+            watcher.add(read_usernames(args.usernames))
+            stats = watcher.run(once=args.once)
+    finally:
+        if events is not sys.stdout:
+            events.close()
+    print(f"{stats['polls']} polls, {stats['new_posts']} new posts, {stats['errors']} errors, "
+          f"{limiter.requests} requests.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()